@@ -37,6 +37,19 @@ READONLY_STATES = {
     'done': [('readonly', True)],
 }
 
+# 费用分摊方式
+APPORTION_TYPES = [
+    ('amount', u'按金额'),
+    ('qty', u'按数量'),
+    ('weight', u'按重量')]
+
+# 分摊方式对应的出入库明细字段
+APPORTION_COLUMNS = {
+    'amount': 'amount',
+    'qty': 'goods_qty',
+    'weight': 'line_net_weight',
+}
+
 
 class CostOrder(models.Model):
     _name = "cost.order"
@@ -84,6 +97,10 @@ class CostOrder(models.Model):
                                    'cost_ids',
                                    'move_ids',
                                    u'费用分摊出入库明细', copy=False)
+    apportion_type = fields.Selection(APPORTION_TYPES, u'分摊方式',
+                                      default='amount', required=True,
+                                      states=READONLY_STATES,
+                                      help=u'按关联出入库单的金额、数量或净重分摊费用')
     approve_uid = fields.Many2one('res.users', u'审核人',
                                   copy=False, ondelete='restrict',
                                   help=u'审核单据的人')
@@ -162,43 +179,65 @@ class CostOrder(models.Model):
                 self.invoice_ids = [(4, invoice_id.id)]
         return self.invoice_ids
 
+    @api.multi
+    def _get_apportion_bases(self):
+        '''
+        按分摊方式一次汇总所关联出入库单的分摊依据
+        :return: {出入库单id: 分摊依据}
+        '''
+        self.ensure_one()
+        if not self.wh_move_ids:
+            return {}
+        self.env.cr.execute('''
+            SELECT move_id, COALESCE(SUM(%s), 0)
+              FROM wh_move_line
+             WHERE move_id IN %%s
+          GROUP BY move_id
+        ''' % APPORTION_COLUMNS[self.apportion_type], (tuple(self.wh_move_ids.ids),))
+        return dict(self.env.cr.fetchall())
+
     @api.one
     def _create_mv_cost(self):
         """
-        在所关联的入库单/发货单上创建费用行
+        在所关联的入库单/发货单上创建费用行，每个服务明细行按分摊依据占比分摊到各单据
         :return:
         """
-        all_amount = sum(wh_move_line.amount for wh_move_line in self.env['wh.move.line'].search(
-            [('move_id', 'in', self.wh_move_ids.ids)]))
-        for mv in self.wh_move_ids:
-
-            if mv.origin == 'buy.receipt.buy':
-                buy_id = self.env['buy.receipt'].search(
-                    [('buy_move_id', '=', mv.id)])
-                mv_amount = sum(mv_line.amount for mv_line in mv.line_in_ids)
-                for cost_line in self.line_ids:
-                    cost_mv_in_id = self.env['cost.line'].create({
-                        'partner_id': self.partner_id.id,
-                        'category_id': cost_line.category_id.id,
-                        'amount': cost_line.amount * (mv_amount / all_amount),
-                        'tax': cost_line.tax_amount * (mv_amount / all_amount),
-                        'buy_id': buy_id.id
-                    })
-                    self.wm_ids = [(4, cost_mv_in_id.id)]
-
-            if mv.origin == 'sell.delivery.sell':
-                sell_id = self.env['sell.delivery'].search(
-                    [('sell_move_id', '=', mv.id)])
-                mv_amount = sum(mv_line.amount for mv_line in mv.line_out_ids)
-                for cost_line in self.line_ids:
-                    cost_mv_out_id = self.env['cost.line'].create({
-                        'partner_id': self.partner_id.id,
-                        'category_id': cost_line.category_id.id,
-                        'amount': cost_line.amount * (mv_amount / all_amount),
-                        'tax': cost_line.tax_amount * (mv_amount / all_amount),
-                        'sell_id': sell_id.id
-                    })
-                    self.wm_ids = [(4, cost_mv_out_id.id)]
+        bases = self._get_apportion_bases()
+        if not bases:
+            return
+        all_base = sum(bases.values())
+        if float_is_zero(all_base, 6):
+            raise UserError(u'关联出入库单的分摊依据合计为零，请换一种分摊方式')
+        CostLine = self.env['cost.line']
+        # (费用行上的单据字段, 单据, 单据上的出入库单字段)
+        orders = [('buy_id', order, 'buy_move_id')
+                  for order in self.env['buy.receipt'].search(
+                      [('buy_move_id', 'in', bases.keys()),
+                       ('origin', '=', 'buy.receipt.buy')])]
+        if 'sell_id' in CostLine._fields:
+            orders += [('sell_id', order, 'sell_move_id')
+                       for order in self.env['sell.delivery'].search(
+                           [('sell_move_id', 'in', bases.keys()),
+                            ('origin', '=', 'sell.delivery.sell')])]
+        order_fields = list(set(field for field, _order, _move in orders))
+        tax_rate = CostLine.default_get(['tax_rate']).get('tax_rate', 0)
+        vals_list = []
+        for field, order, move_field in orders:
+            rate = bases[order[move_field].id] / all_base
+            for cost_line in self.line_ids:
+                vals = dict.fromkeys(order_fields, False)
+                vals.update({
+                    'partner_id': self.partner_id.id,
+                    'category_id': cost_line.category_id.id,
+                    'amount': cost_line.amount * rate,
+                    'tax_rate': tax_rate,
+                    'company_id': self.company_id.id,
+                    field: order.id,
+                })
+                vals_list.append(vals)
+        cost_lines = CostLine._bulk_insert(vals_list)
+        cost_lines.modified(order_fields + ['amount'])
+        self.wm_ids = [(6, 0, (self.wm_ids | cost_lines).ids)]
 
     @api.one
     def cost_order_confim(self):
@@ -227,10 +266,9 @@ class CostOrder(models.Model):
         if self.state == 'draft':
             raise UserError(u'请不要重复反审核！')
 
-        for mv_id in self.wm_ids:
-            cost_line_id = mv_id
-            self.wm_ids = [(3, mv_id.id)]
-            cost_line_id.unlink()
+        cost_lines = self.wm_ids
+        self.wm_ids = [(5, 0, 0)]
+        cost_lines.unlink()
 
         for invoice in self.invoice_ids:
             invoice_id = invoice
@@ -86,6 +86,26 @@ class TestCostOrder(TransactionCase):
         self.cost_order_1.wh_move_ids = [(4, self.delivery.sell_move_id.id)]
         self.cost_order_1.cost_order_confim()
 
+    def test_create_mv_cost_apportion_type(self):
+        '''按数量、重量分摊费用，费用行合计等于服务订单金额'''
+        self.cost_order_1.wh_move_ids = [(4, self.receipt.buy_move_id.id)]
+        for apportion_type in ('qty', 'amount'):
+            self.cost_order_1.apportion_type = apportion_type
+            self.cost_order_1.cost_order_confim()
+            self.assertEqual(len(self.cost_order_1.wm_ids),
+                             len(self.cost_order_1.line_ids))
+            self.assertAlmostEqual(
+                sum(self.receipt.cost_line_ids.mapped('amount')),
+                self.cost_order_1.amount)
+            self.cost_order_1.cost_order_draft()
+            self.assertFalse(self.receipt.cost_line_ids)
+
+        # 商品没有净重时不能按重量分摊
+        self.receipt.line_in_ids.write({'line_net_weight': 0})
+        self.cost_order_1.apportion_type = 'weight'
+        with self.assertRaises(UserError):
+            self.cost_order_1.cost_order_confim()
+
     def test_cost_order_draft_has_prepayment(self):
         '''反审核服务订单'''
         self.cost_order_1.prepayment = 20
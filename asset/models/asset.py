@@ -517,29 +517,16 @@ class CreateDepreciationWizard(models.TransientModel):
         default=lambda self: self.env['res.company']._company_default_get())
 
     @api.multi
-    def _get_voucher_line(self, Asset, cost_depreciation, vouch_obj):
-        '''借方行'''
-        res = {}
-        if Asset.account_depreciation.id not in res:
-            res[Asset.account_depreciation.id] = {'debit': 0}
-        val = res[Asset.account_depreciation.id]
-        val.update({'debit': val.get('debit') + cost_depreciation,
-                    'voucher_id': vouch_obj.id,
-                    'account_id': Asset.account_depreciation.id,
-                    'name': u'固定资产折旧',
-                    })
-
-        '''贷方行'''
-        if Asset.account_accumulated_depreciation.id not in res:
-            res[Asset.account_accumulated_depreciation.id] = {'credit': 0}
-
-        val = res[Asset.account_accumulated_depreciation.id]
-        val.update({'credit': val.get('credit') + cost_depreciation,
-                    'voucher_id': vouch_obj.id,
-                    'account_id': Asset.account_accumulated_depreciation.id,
-                    'name': u'固定资产折旧',
-                    })
-        return res
+    def _get_voucher_line(self, Asset, cost_depreciation):
+        '''借方行：折旧费用；贷方行：累计折旧'''
+        return [{'debit': cost_depreciation,
+                 'account_id': Asset.account_depreciation.id,
+                 'name': u'固定资产折旧',
+                 },
+                {'credit': cost_depreciation,
+                 'account_id': Asset.account_accumulated_depreciation.id,
+                 'name': u'固定资产折旧',
+                 }]
 
     @api.multi
     def _generate_asset_line(self, Asset, cost_depreciation, total):
@@ -559,8 +546,7 @@ class CreateDepreciationWizard(models.TransientModel):
     def create_depreciation(self):
         ''' 资产折旧，生成凭证和折旧明细'''
 
-        vouch_obj = self.env['voucher'].create({'date': self.date})
-        res = {}
+        voucher_lines = []
         asset_line_id_list = []
         for Asset in self.env['asset'].search([('no_depreciation', '=', False),
                                                ('state', '=', 'done'), ('period_id', '!=', self.period_id.id)]):
@@ -573,19 +559,17 @@ class CreateDepreciationWizard(models.TransientModel):
                     cost_depreciation = Asset.surplus_value - total
                     Asset.no_depreciation = 1
                 # 获得凭证明细行
-                res = self._get_voucher_line(
-                    Asset, cost_depreciation, vouch_obj)
+                voucher_lines += self._get_voucher_line(
+                    Asset, cost_depreciation)
                 # 生成折旧明细行
                 asset_line_row = self._generate_asset_line(
                     Asset, cost_depreciation, total)
                 asset_line_id_list.append(asset_line_row.id)
-        for account_id, val in res.iteritems():
-            self.env['voucher.line'].create(dict(val, account_id=account_id))
-
-        if not vouch_obj.line_ids:
-            vouch_obj.unlink()
+        if not voucher_lines:
             raise UserError(u'本期没有需要折旧的固定资产。')
-        vouch_obj.voucher_done()
+        # 按科目汇总所有资产的折旧
+        self.env['voucher'].create_voucher(
+            {'date': self.date}, voucher_lines, merge=True)
         view = self.env.ref('asset.asset_line_tree')
         return {
             'view_mode': 'tree',
@@ -105,16 +105,44 @@ class Currency(models.Model):
                     line.note = u'系统于(%s)从中国银行网站上取得' % fields.Date.context_today(
                         self)
 
+    @tools.ormcache()
+    def _get_exchange_rate_map(self):
+        '''
+        本进程的汇率表 {(币别 id, 期间): 汇率}，期间形如 201710，可由日期直接得出，
+        查汇率不再逐次搜索会计期间、遍历汇率明细行。汇率明细行变更时清空
+        '''
+        self.env.cr.execute('''
+            SELECT line.currency_id, period.year, period.month, line.exchange
+              FROM auto_exchange_line line
+              JOIN finance_period period ON period.id = line.period_id
+        ''')
+        return dict(((currency_id, '%s%s' % (year, str(month).zfill(2))), exchange)
+                    for currency_id, year, month, exchange in self.env.cr.fetchall())
+
+    @api.model
+    def get_rates(self, date_currency_pairs):
+        '''
+        批量取汇率
+        :param date_currency_pairs: [(日期, 币别 id), ...]，日期为 %Y-%m-%d 字符串
+        :return: 与参数顺序一致的汇率列表，未设置汇率的为 0
+        '''
+        rate_map = self._get_exchange_rate_map()
+        return [rate_map.get((currency_id, date and date[0:4] + date[5:7]), 0)
+                for date, currency_id in date_currency_pairs]
+
+    @api.multi
+    def get_rate_silent(self, date, currency_id):
+        '''按日期所在期间取汇率，未设置汇率时同 rate 字段取 1'''
+        return self.get_rates([(date or fields.Date.context_today(self),
+                                currency_id)])[0] or 1.0
+
     '''取汇率函数，如果要给定日期，需要在context里增加date'''
     @api.multi
     def _compute_current_rate(self):
         date = self._context.get('date') or fields.Datetime.now()
-        period_id = self.env['finance.period'].get_period(date).id
-        for currency in self:
-            currency.rate = 1.0
-            for line in currency.month_exchange:
-                if period_id == line.period_id.id:
-                    currency.rate = line.exchange or 1.0
+        rates = self.get_rates([(date, currency.id) for currency in self])
+        for currency, rate in zip(self, rates):
+            currency.rate = rate or 1.0
 
 
 class AutoExchangeLine(models.Model):
@@ -149,18 +177,33 @@ class AutoExchangeLine(models.Model):
         ('unique_start_date', 'unique (currency_id,period_id)', u'同币别期间不能重合!'),
     ]
 
+    @api.model
+    def create(self, vals):
+        res = super(AutoExchangeLine, self).create(vals)
+        self.env['res.currency'].clear_caches()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(AutoExchangeLine, self).write(vals)
+        self.env['res.currency'].clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(AutoExchangeLine, self).unlink()
+        self.env['res.currency'].clear_caches()
+        return res
+
 
 class CurrencyMoneyOrder(models.Model):
     _inherit = 'money.order'
 
     @api.multi
     def get_rate_silent(self, date, currency_id):
-        currency = self.env['res.currency'].search([('id', '=', currency_id)])
-        period_id = self.env['finance.period'].get_period(date)
-        for line in currency.month_exchange:
-            if period_id == line.period_id:
-                rate = line.exchange
+        rate = self.env['res.currency'].get_rates([(date, currency_id)])[0]
         if not rate:
-            raise UserError(u'没有设置会计期间内的外币%s汇率' % currency.name)
+            raise UserError(u'没有设置会计期间内的外币%s汇率' %
+                            self.env['res.currency'].browse(currency_id).name)
 
         return rate
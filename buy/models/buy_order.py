@@ -36,6 +36,12 @@ READONLY_STATES = {
     'done': [('readonly', True)],
 }
 
+# 付款状态可选值：未付、部分、全部
+BUY_MONEY_STATES = {
+    'buy': (u'未付款', u'部分付款', u'全部付款'),
+    'return': (u'未退款', u'部分退款', u'全部退款'),
+}
+
 
 class BuyOrder(models.Model):
     _name = "buy.order"
@@ -72,15 +78,30 @@ class BuyOrder(models.Model):
         '''获取默认调入仓库'''
         return self._default_warehouse_dest_impl()
 
-    @api.one
+    @api.multi
+    @api.depends('receipt_ids.invoice_id.reconciled', 'money_order_ids.state',
+                 'money_order_ids.amount', 'money_order_ids.reconciled')
     def _get_paid_amount(self):
-        '''计算购货订单付款/退款状态'''
-        receipts = self.env['buy.receipt'].search([('order_id', '=', self.id)])
-        money_order_rows = self.env['money.order'].search([('buy_id', '=', self.id),
-                                                           ('reconciled', '=', 0),
-                                                           ('state', '=', 'done')])
-        self.paid_amount = sum([receipt.invoice_id.reconciled for receipt in receipts]) +\
-            sum([order_row.amount for order_row in money_order_rows])
+        '''计算购货订单已付/已退金额：入库单结算单已核销金额加上未核销的已审核付款单金额'''
+        for order in self:
+            order.paid_amount = sum(
+                order.receipt_ids.mapped('invoice_id.reconciled')) + \
+                sum(money.amount for money in order.money_order_ids
+                    if money.state == 'done' and not money.reconciled)
+
+    @api.multi
+    @api.depends('paid_amount', 'amount', 'type')
+    def _get_buy_money_state(self):
+        '''返回付款/退款状态'''
+        for order in self:
+            paid_amount = abs(order.paid_amount)
+            if float_is_zero(paid_amount, 2):
+                index = 0
+            elif float_compare(paid_amount, abs(order.amount), 2) < 0:
+                index = 1
+            else:
+                index = 2
+            order.money_state = BUY_MONEY_STATES[order.type or 'buy'][index]
 
     @api.depends('receipt_ids')
     def _compute_receipt(self):
@@ -226,7 +247,13 @@ class BuyOrder(models.Model):
         change_default=True,
         default=lambda self: self.env['res.company']._company_default_get())
     paid_amount = fields.Float(
-        u'已付金额', compute=_get_paid_amount, readonly=True)
+        u'已付金额', compute=_get_paid_amount, readonly=True, store=True,
+        copy=False, digits=dp.get_precision('Amount'))
+    money_state = fields.Char(u'付款状态', compute=_get_buy_money_state,
+                              store=True, default=u'未付款',
+                              help=u"购货订单的付款状态", index=True, copy=False)
+    money_order_ids = fields.One2many(
+        'money.order', 'buy_id', string=u'付款单', copy=False)
 
     @api.onchange('discount_rate', 'line_ids')
     def onchange_discount_rate(self):
@@ -434,6 +461,15 @@ class BuyOrder(models.Model):
             'target': 'current',
         }
 
+    @api.multi
+    def action_recompute_money_state(self):
+        '''重新计算已付金额和付款状态，用于修复历史数据；未选订单时计算全部订单'''
+        orders = self or self.search([])
+        for name in ('paid_amount', 'money_state'):
+            self.env.add_todo(self._fields[name], orders)
+        orders.recompute()
+        return True
+
     @api.multi
     def action_view_receipt(self):
         '''
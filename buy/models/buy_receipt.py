@@ -19,6 +19,8 @@ class BuyReceipt(models.Model):
     _inherit = ['mail.thread']
     _description = u"采购入库单"
     _order = 'date desc, id desc'
+    # 批量审核任务调用的审核方法
+    _batch_approve_method = 'buy_receipt_done'
 
     @api.one
     @api.depends('line_in_ids.subtotal', 'discount_amount',
@@ -309,8 +311,8 @@ class BuyReceipt(models.Model):
         })
         return money_order
 
-    def _create_voucher_line(self, account_id, debit, credit, voucher_id, goods_id, goods_qty, partner_id):
-        '''返回voucher line'''
+    def _get_voucher_line_vals(self, account_id, debit, credit, goods_id, goods_qty, partner_id):
+        '''返回voucher line的值'''
         rate_silent = currency_amount = 0
         currency = self.currency_id != self.env.user.company_id.currency_id and self.currency_id.id or False
         if self.currency_id and self.currency_id != self.env.user.company_id.currency_id:
@@ -319,20 +321,18 @@ class BuyReceipt(models.Model):
             currency_amount = debit or credit
             debit = debit * (rate_silent or 1)
             credit = credit * (rate_silent or 1)
-        voucher = self.env['voucher.line'].create({
+        return {
             'name': u'%s %s' % (self.name, self.note or ''),
             'account_id': account_id and account_id.id,
             'partner_id': partner_id and partner_id.id,
             'debit': debit,
             'credit': credit,
-            'voucher_id': voucher_id and voucher_id.id,
             'goods_id': goods_id and goods_id.id,
             'goods_qty': goods_qty,
             'currency_id': currency,
             'currency_amount': currency_amount,
             'rate_silent': rate_silent,
-        })
-        return voucher
+        }
 
     @api.multi
     def create_voucher(self):
@@ -345,39 +345,39 @@ class BuyReceipt(models.Model):
         采购退货单生成的金额为负
         '''
         self.ensure_one()
-        vouch_id = self.env['voucher'].create({'date': self.date})
-
         sum_amount = 0
+        voucher_lines = []
         if not self.is_return:
             for line in self.line_in_ids:
                 if line.amount:
                     # 借方明细
-                    self._create_voucher_line(line.goods_id.category_id.account_id,
-                                              line.amount, 0, vouch_id, line.goods_id, line.goods_qty, False)
+                    voucher_lines.append(self._get_voucher_line_vals(
+                        line.goods_id.category_id.account_id,
+                        line.amount, 0, line.goods_id, line.goods_qty, False))
                 sum_amount += line.amount
 
             if sum_amount:
                 # 贷方明细
-                self._create_voucher_line(self.buy_move_id.finance_category_id.account_id,
-                                          0, sum_amount, vouch_id, False, 0, self.partner_id)
+                voucher_lines.append(self._get_voucher_line_vals(
+                    self.buy_move_id.finance_category_id.account_id,
+                    0, sum_amount, False, 0, self.partner_id))
         if self.is_return:
             for line in self.line_out_ids:
                 if line.amount:
                     # 借方明细
-                    self._create_voucher_line(line.goods_id.category_id.account_id,
-                                              -line.amount, 0, vouch_id, line.goods_id, line.goods_qty, False)
+                    voucher_lines.append(self._get_voucher_line_vals(
+                        line.goods_id.category_id.account_id,
+                        -line.amount, 0, line.goods_id, line.goods_qty, False))
                     sum_amount += line.amount
 
             if sum_amount:
                 # 贷方明细
-                self._create_voucher_line(self.buy_move_id.finance_category_id.account_id,
-                                          0, -sum_amount, vouch_id, False, 0, self.partner_id)
+                voucher_lines.append(self._get_voucher_line_vals(
+                    self.buy_move_id.finance_category_id.account_id,
+                    0, -sum_amount, False, 0, self.partner_id))
 
-        if len(vouch_id.line_ids) > 0:
-            vouch_id.voucher_done()
-            return vouch_id
-        else:
-            vouch_id.unlink()
+        if voucher_lines:
+            return self.env['voucher'].create_voucher({'date': self.date}, voucher_lines)
 
     @api.one
     def buy_receipt_done(self):
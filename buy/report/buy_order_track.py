@@ -6,7 +6,12 @@ from odoo import fields, models, api
 
 class BuyOrderTrack(models.TransientModel):
     _name = 'buy.order.track'
+    _inherit = 'report.materialize'
     _description = u'采购订单跟踪表'
+    _report_columns = ['goods_code', 'goods_id', 'attribute', 'uom', 'date',
+                       'order_name', 'partner_id', 'warehouse_dest_id',
+                       'goods_state', 'qty', 'amount', 'qty_not_in',
+                       'planned_date', 'wh_in_date', 'note']
 
     goods_code = fields.Char(u'商品编码')
     goods_id = fields.Many2one('goods', u'商品名称')
@@ -27,6 +32,38 @@ class BuyOrderTrack(models.TransientModel):
     wh_in_date = fields.Date(u'入库日期')
     note = fields.Char(u'备注')
 
+    @api.model
+    def _get_source_query(self, domain):
+        '''
+        按购货订单行生成跟踪表行，退货订单的数量、金额取反，
+        入库日期取该行已审核的入库明细（分批入库时取第一条）
+        '''
+        line_query, params = self._domain_subquery('buy.order.line', domain)
+        return '''
+            SELECT goods.code, line.goods_id, attribute.name, uom.name,
+                   bo.date, bo.name, bo.partner_id, bo.warehouse_dest_id,
+                   bo.goods_state,
+                   sign.factor * line.quantity,
+                   sign.factor * line.subtotal,
+                   sign.factor * (line.quantity - COALESCE(line.quantity_in, 0)),
+                   bo.planned_date, wh_in.date, line.note
+              FROM buy_order_line line
+              JOIN buy_order bo ON bo.id = line.order_id
+         LEFT JOIN goods ON goods.id = line.goods_id
+         LEFT JOIN attribute ON attribute.id = line.attribute_id
+         LEFT JOIN uom ON uom.id = line.uom_id
+        CROSS JOIN LATERAL (
+                   SELECT CASE WHEN bo.type = 'buy' THEN 1 ELSE -1 END AS factor
+                   ) sign
+         LEFT JOIN LATERAL (
+                   SELECT wml.date FROM wh_move_line wml
+                    WHERE wml.buy_line_id = line.id AND wml.state = 'done'
+                 ORDER BY wml.lot, wml.id LIMIT 1
+                   ) wh_in ON TRUE
+             WHERE line.id IN (%s)
+          ORDER BY line.goods_id, line.id
+        ''' % line_query, params
+
     @api.multi
     def view_detail(self):
         '''查看明细按钮'''
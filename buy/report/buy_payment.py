@@ -6,6 +6,7 @@ from odoo import fields, models, api
 
 class BuyPayment(models.TransientModel):
     _name = 'buy.payment'
+    _inherit = 'report.materialize'
     _description = u'采购付款一览表'
 
     s_category_id = fields.Many2one('core.category', u'供应商类别')
@@ -153,6 +153,27 @@ class TestBuyOrder(TransactionCase):
         money_order.money_order_done()
         self.order.buy_order_draft()
 
+    def test_paid_amount_stored(self):
+        '''已付金额和付款状态随付款单审核更新，可重新计算修复'''
+        bank_account = self.env.ref('core.alipay')
+        bank_account.balance = 1000000
+        self.order.prepayment = 100
+        self.order.bank_account_id = bank_account
+        self.order.buy_order_done()
+        self.assertEqual(len(self.order.money_order_ids), 1)
+        self.order.money_order_ids.money_order_done()
+        paid_amount = self.order.paid_amount
+        money_state = self.order.money_state
+        self.assertIn(money_state, [u'未付款', u'部分付款'])
+
+        self.env.cr.execute("UPDATE buy_order SET paid_amount = 1, "
+                            "money_state = %s WHERE id = %s",
+                            (u'全部付款', self.order.id))
+        self.order.invalidate_cache()
+        self.order.action_recompute_money_state()
+        self.assertEqual(self.order.paid_amount, paid_amount)
+        self.assertEqual(self.order.money_state, money_state)
+
     def test_buy_generate_receipt(self):
         '''测试采购订单生成入库单,批次管理拆分折扣金额'''
         # 采购订单
@@ -208,6 +208,8 @@ class TestPaymentWizard(TransactionCase):
         self.payment.button_ok()
         payment_line = self.env['buy.payment'].search(
             [('order_name', '=', self.receipt.name)])
+        # 已付款为已审核付款单对入库单结算单的核销金额
+        self.assertEqual(payment_line.payment, self.receipt.invoice_id.reconciled)
         for line in payment_line:
             line.view_detail()
         payment_line2 = self.env['buy.payment'].search(
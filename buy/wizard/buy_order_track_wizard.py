@@ -52,68 +52,17 @@ class BuyOrderTrackWizard(models.TransientModel):
                            '=', self.warehouse_dest_id.id))
         return domain
 
-    def _get_wh_in_date(self, line):
-        '''对于一个buy order line，返回一个入库日期'''
-        wh_in_date = None
-        move_line = self.env['wh.move.line']
-        wh_move_line = move_line.search([
-            ('buy_line_id', '=', line.id),
-            ('state', '=', 'done')
-        ])
-        if len(wh_move_line) > 1:  # 如果是分批入库，则入库单明细行上的buy_line_id相同
-            wh_in_date = wh_move_line[0].date
-        else:
-            wh_in_date = wh_move_line.date
-        return wh_in_date
-
-    def _prepare_track_line(self, line, qty, amount, qty_not_in):
-        '''返回跟踪表明细行（非小计行）'''
-        return {
-            'goods_code': line.goods_id.code,
-            'goods_id': line.goods_id.id,
-            'attribute': line.attribute_id.name,
-            'uom': line.uom_id.name,
-            'date': line.order_id.date,
-            'order_name': line.order_id.name,
-            'partner_id': line.order_id.partner_id.id,
-            'warehouse_dest_id': line.order_id.warehouse_dest_id.id,
-            'goods_state': line.order_id.goods_state,
-            'qty': qty,
-            'amount': amount,
-            'qty_not_in': qty_not_in,
-            'planned_date': line.order_id.planned_date,
-            'wh_in_date': self._get_wh_in_date(line),  # 入库日期
-            'note': line.note,
-        }
-
     @api.multi
     def button_ok(self):
         self.ensure_one()
-        res = []
         if self.date_end < self.date_start:
             raise UserError(u'开始日期不能大于结束日期！')
 
-        buy_order_line = self.env['buy.order.line']
-        for line in buy_order_line.search(self._get_domain(), order='goods_id'):
-            is_buy = line.order_id.type == 'buy' and 1 or -1  # 是否购货订单
-            # 以下分别为明细行上数量、采购额、未入库数量，退货时均取反
-            qty = is_buy * line.quantity
-            amount = is_buy * line.subtotal
-            qty_not_in = is_buy * (line.quantity - line.quantity_in)
-            # 创建跟踪表明细行（非小计行）
-            track = self.env['buy.order.track'].create(
-                self._prepare_track_line(line, qty, amount, qty_not_in))
-            res.append(track.id)
+        # 一条 INSERT ... SELECT 生成跟踪表明细行
+        track = self.env['buy.order.track']
+        run_tag = track.materialize_query(
+            *track._get_source_query(self._get_domain()))
 
         view = self.env.ref('buy.buy_order_track_tree')
-        return {
-            'name': u'采购订单跟踪表',
-            'view_type': 'form',
-            'view_mode': 'tree',
-            'view_id': False,
-            'views': [(view.id, 'tree')],
-            'res_model': 'buy.order.track',
-            'type': 'ir.actions.act_window',
-            'domain': [('id', 'in', res)],
-            'limit': 65535,
-        }
+        return track.get_run_action(
+            run_tag, u'采购订单跟踪表', [(view.id, 'tree')], limit=65535)
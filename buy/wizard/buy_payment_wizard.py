@@ -53,22 +53,22 @@ class BuyPaymentWizard(models.TransientModel):
                      ('buy_move_id.warehouse_id', '=', self.warehouse_dest_id.id)]
         return cond
 
-    def _compute_payment(self, receipt):
-        '''计算该入库单的已付款和应付款余额'''
-        payment = 0
-        for order in self.env['money.order'].search(
-                [('state', '=', 'done')], order='name'):
-            for source in order.source_ids:
-                if source.name.name == receipt.name:
-                    payment += source.this_reconcile
-        return payment
+    def _compute_payment(self, receipt, payments=None):
+        '''
+        计算该入库单的已付款
+        :param payments: get_reconciled_by_invoice 返回的 {结算单id: 已付款}，不传时单独查询
+        '''
+        if payments is None:
+            payments = self.env['source.order.line'].get_reconciled_by_invoice(
+                receipt.invoice_id.ids)
+        return payments.get(receipt.invoice_id.id, 0)
 
     def _compute_payment_rate(self, payment, amount):
         '''计算付款率'''
         payment_rate = amount != 0 and (payment / amount) * 100 or 0.0
         return payment_rate
 
-    def _prepare_buy_payment(self, receipt):
+    def _prepare_buy_payment(self, receipt, payments=None):
         '''对于传入的入库单，为创建采购付款一览表准备数据'''
         self.ensure_one()
         factor = not receipt.is_return and 1 or -1  # 如果是退货则金额均取反
@@ -78,7 +78,7 @@ class BuyPaymentWizard(models.TransientModel):
         order_type = receipt.is_return and u'采购退回' or u'普通采购'
         warehouse = receipt.is_return and receipt.warehouse_id or receipt.warehouse_dest_id
         # 计算该入库单的已付款
-        payment = self._compute_payment(receipt)
+        payment = self._compute_payment(receipt, payments)
         return {
             'partner_id': receipt.partner_id.id,
             'type': order_type,
@@ -96,22 +96,19 @@ class BuyPaymentWizard(models.TransientModel):
 
     @api.multi
     def button_ok(self):
-        res = []
         if self.date_end < self.date_start:
             raise UserError(u'开始日期不能大于结束日期！')
 
-        receipt_obj = self.env['buy.receipt']
-        for receipt in receipt_obj.search(self._get_domain(), order='partner_id,date'):
-            # 用查找到的入库单信息来创建一览表
-            line = self.env['buy.payment'].create(
-                self._prepare_buy_payment(receipt))
-            res.append(line.id)
+        receipts = self.env['buy.receipt'].search(
+            self._get_domain(), order='partner_id,date')
+        # 所有入库单的已付款一次查出
+        payments = self.env['source.order.line'].get_reconciled_by_invoice(
+            receipts.mapped('invoice_id').ids)
+        # 用查找到的入库单信息来创建一览表
+        report = self.env['buy.payment']
+        run_tag = report.materialize_rows(
+            [self._prepare_buy_payment(receipt, payments)
+             for receipt in receipts])
 
-        return {
-            'name': u'采购付款一览表',
-            'view_mode': 'tree',
-            'res_model': 'buy.payment',
-            'type': 'ir.actions.act_window',
-            'domain': [('id', 'in', res)],
-            'limit': 65535,
-        }
+        return report.get_run_action(
+            run_tag, u'采购付款一览表', [(False, 'tree')], limit=65535)
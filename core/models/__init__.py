@@ -4,6 +4,7 @@ import clean_data
 import goods
 import partner
 import pricing
+import report_materialize
 import res_company
 import res_users
 import res_currency
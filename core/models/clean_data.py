@@ -1,8 +1,40 @@
 # -*- coding: utf-8 -*-
+import base64
+import csv
+import gzip
+import logging
+import os
+import threading
 
-from odoo import api, fields, models
+import psycopg2
+
+from odoo import api, fields, models, tools
 from odoo.exceptions import UserError
 
+_logger = logging.getLogger(__name__)
+
+CLEAN_STATE = [('draft', u'草稿'),
+               ('running', u'清理中'),
+               ('done', u'已完成')]
+
+TASK_STATE = [('wait', u'待清理'),
+              ('done', u'已完成'),
+              ('skipped', u'已跳过')]
+
+# 会话级咨询锁的键 = CLEAN_LOCK_BASE + 清理记录id，防止同一清理记录被多个进程同时执行
+CLEAN_LOCK_BASE = 0x636c65616e000000
+
+
+def _archive_value(value):
+    ''' 归档文件中的单元格：None 写空，二进制写 base64 '''
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, buffer):
+        return base64.b64encode(str(value))
+    return value
+
 
 class BusinessDataTable(models.Model):
     _name = 'business.data.table'
@@ -46,16 +78,302 @@ class CleanBusinessData(models.Model):
         string=u'公司',
         change_default=True,
         default=lambda self: self.env['res.company']._company_default_get())
+    clean_company_id = fields.Many2one(
+        'res.company', u'清理的公司',
+        help=u'只清理该公司的数据，为空时清理所有公司')
+    date_cutoff = fields.Date(
+        u'清理截止日期',
+        help=u'只清理单据日期在该日期之前的单据，明细随所属单据清理，'
+             u'没有单据日期的表（如业务伙伴、商品）跳过；为空时不限日期')
+    batch_size = fields.Integer(u'每批行数', default=1000,
+                                help=u'每批删除后提交一次，行锁只在一批内持有')
+    archive = fields.Boolean(u'清理前归档', default=True,
+                             help=u'删除前把每批数据写入文件存储下的 csv.gz 文件')
+    archive_path = fields.Char(u'归档目录', compute='_compute_archive_path')
+    state = fields.Selection(CLEAN_STATE, u'状态', default='draft', readonly=True)
+    task_ids = fields.One2many('clean.business.data.task', 'clean_id',
+                               u'清理进度', readonly=True)
+    progress = fields.Float(u'进度', compute='_compute_progress')
+    deleted_count = fields.Integer(u'已删除行数', compute='_compute_progress')
+
+    @api.multi
+    def _compute_archive_path(self):
+        for clean in self:
+            clean.archive_path = clean.id and os.path.join(
+                tools.config.filestore(self.env.cr.dbname),
+                'clean_business_data', str(clean.id))
+
+    @api.multi
+    @api.depends('task_ids.state', 'task_ids.deleted_count')
+    def _compute_progress(self):
+        for clean in self:
+            finished = clean.task_ids.filtered(lambda task: task.state != 'wait')
+            clean.progress = clean.task_ids and \
+                100.0 * len(finished) / len(clean.task_ids) or 0
+            clean.deleted_count = sum(clean.task_ids.mapped('deleted_count'))
+
+    def _commit(self):
+        ''' 每批删除单独提交；测试时不提交 '''
+        if not getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.commit()
+
+    def _rollback(self):
+        ''' 出错时回滚未提交的一批，事务中断后才能释放咨询锁；测试时不回滚 '''
+        if not getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.rollback()
+
+    @api.model
+    def _get_table_columns(self, table):
+        ''' 数据库表的字段名集合，表不存在时为空 '''
+        self.env.cr.execute('''
+            SELECT column_name FROM information_schema.columns
+             WHERE table_schema = current_schema() AND table_name = %s
+        ''', (table,))
+        return set(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def _get_cascade_keys(self, tables, side='parent'):
+        '''
+        删除时级联的外键（明细 -> 主表）
+        :param side: parent 时取引用 tables 的明细，child 时取 tables 引用的主表
+        :return: [(明细表, 外键字段, 主表)]
+        '''
+        if not tables:
+            return []
+        self.env.cr.execute('''
+            SELECT child.relname, att.attname, parent.relname
+              FROM pg_constraint con
+              JOIN pg_class child ON child.oid = con.conrelid
+              JOIN pg_class parent ON parent.oid = con.confrelid
+              JOIN pg_attribute att ON att.attrelid = con.conrelid
+                                   AND att.attnum = con.conkey[1]
+             WHERE con.contype = 'f' AND con.confdeltype = 'c'
+               AND child.relname != parent.relname
+               AND %s.relname IN %%s
+          ORDER BY child.relname, att.attname
+        ''' % side, (tuple(tables),))
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _add_cascade_tables(self, tables):
+        '''
+        加入删除主表时会级联删除的明细表，明细先单独归档、删除，不被主表静默级联
+        '''
+        tables = list(tables)
+        parents = tables
+        while parents:
+            children = [child for child, column, parent in self._get_cascade_keys(parents)
+                        if child not in tables]
+            parents = sorted(set(children))
+            tables += parents
+        return tables
+
+    @api.model
+    def _sort_tables(self, tables):
+        '''
+        按外键依赖排序：引用其他表的（明细）排在被引用的（主表）之前，
+        删除主表时不再级联删除或被已清理的明细阻止。循环引用的表保持原顺序
+        '''
+        if not tables:
+            return []
+        self.env.cr.execute('''
+            SELECT DISTINCT child.relname, parent.relname
+              FROM pg_constraint con
+              JOIN pg_class child ON child.oid = con.conrelid
+              JOIN pg_class parent ON parent.oid = con.confrelid
+             WHERE con.contype = 'f'
+               AND child.relname IN %s AND parent.relname IN %s
+               AND child.relname != parent.relname
+        ''', (tuple(tables), tuple(tables)))
+        children = dict((table, set()) for table in tables)
+        for child, parent in self.env.cr.fetchall():
+            children[parent].add(child)
+        result = []
+        while len(result) < len(tables):
+            ready = [table for table in tables if table not in result
+                     and not children[table] - set(result)]
+            if not ready:
+                ready = [table for table in tables if table not in result]
+            result.append(ready[0])
+        return result
 
     @api.multi
     def remove_data(self):
+        '''
+        按业务数据表生成清理进度后分批清理。
+        不再用 TRUNCATE ... CASCADE：它一次锁住所有业务表并级联清空未选的表
+        '''
+        self.ensure_one()
+        if self.batch_size <= 0:
+            raise UserError(u'每批行数必须大于0')
+        tables = []
+        for line in self.need_clean_table:
+            if line.name not in self.env:
+                raise UserError(u'业务数据表 %s 不存在' % line.name)
+            Model = self.env[line.name]
+            if Model._auto and not Model._abstract and Model._table not in tables:
+                tables.append(Model._table)
+        self.task_ids.unlink()
+        tables = self._add_cascade_tables(tables)
+        for sequence, table in enumerate(self._sort_tables(tables)):
+            self.env['clean.business.data.task'].create({
+                'clean_id': self.id,
+                'sequence': sequence,
+                'name': table,
+            })
+        self.state = 'running'
+        self._commit()
+        return self.action_resume()
+
+    @api.multi
+    def action_resume(self):
+        ''' 从最后完成的一批继续清理，中断（超时、重启）后可再次执行 '''
+        self.ensure_one()
+        cr = self.env.cr
+        cr.execute('SELECT pg_try_advisory_lock(%s)', (CLEAN_LOCK_BASE + self.id,))
+        if not cr.fetchone()[0]:
+            raise UserError(u'该清理正在其他进程中执行，请稍后查看进度')
         try:
-            for line in self.need_clean_table:
-                obj_name = line.name
-                obj = self.env[obj_name]
-                if obj._table_exist:
-                    sql = "TRUNCATE TABLE %s CASCADE " % obj._table
-                    self.env.cr.execute(sql)
-        except Exception, e:
-            raise UserError(e)
+            for task in self.task_ids.filtered(lambda task: task.state == 'wait'):
+                self._purge_table(task)
+            self.state = 'done'
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        finally:
+            cr.execute('SELECT pg_advisory_unlock(%s)', (CLEAN_LOCK_BASE + self.id,))
+        self.env.invalidate_all()
         return True
+
+    @api.multi
+    def _get_table_filter(self, table, tables):
+        '''
+        表的清理条件（不含分批的 id 条件）。
+        明细表按所属主表的条件关联主表过滤；主表按公司和单据日期过滤，
+        没有单据日期（date）的表不按创建时间代替，不能按日期清理
+        :param tables: 本次清理的所有表
+        :return: (条件列表, 参数列表)，不能清理时返回 (None, 原因)
+        '''
+        columns = self._get_table_columns(table)
+        if not columns:
+            return None, u'表不存在'
+        if not self.clean_company_id and not self.date_cutoff:
+            return [], []
+        for child, column, parent in self._get_cascade_keys([table], side='child'):
+            if parent not in tables:
+                continue
+            parent_where, parent_params = self._get_table_filter(parent, tables)
+            if parent_where is not None:
+                return ['"%s" IN (SELECT id FROM "%s" WHERE %s)' % (
+                    column, parent, ' AND '.join(parent_where) or 'TRUE')], parent_params
+        where, params = [], []
+        if self.clean_company_id:
+            if 'company_id' not in columns:
+                return None, u'表上没有公司字段，不能按公司清理'
+            where.append('company_id = %s')
+            params.append(self.clean_company_id.id)
+        if self.date_cutoff:
+            if 'date' not in columns:
+                return None, u'表上没有单据日期，也不是有单据日期的主表的明细，不能按日期清理'
+            where.append('"date" < %s')
+            params.append(self.date_cutoff)
+        return where, params
+
+    @api.multi
+    def _get_purge_where(self, task):
+        '''
+        清理条件
+        :return: (条件列表, 参数列表)，不能清理时返回 (None, 原因)
+        '''
+        where, params = self._get_table_filter(
+            task.name, self.task_ids.mapped('name'))
+        if where is None:
+            return where, params
+        return ['id > %s'] + where, params
+
+    @api.multi
+    def _purge_table(self, task):
+        ''' 按 id 顺序分批归档、删除一个表，每批提交并记录最后处理的 id '''
+        where, params = self._get_purge_where(task)
+        if where is None:
+            task.write({'state': 'skipped', 'message': params})
+            self._commit()
+            return
+        sql = 'SELECT id FROM "%s" WHERE %s ORDER BY id LIMIT %%s' % (
+            task.name, ' AND '.join(where))
+        while True:
+            self.env.cr.execute(sql, [task.last_id] + params + [self.batch_size])
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                break
+            if self.archive:
+                self._archive_rows(task, ids)
+            deleted = self._delete_rows(task.name, ids)
+            task.write({
+                'last_id': ids[-1],
+                'batch_count': task.batch_count + 1,
+                'deleted_count': task.deleted_count + deleted,
+                'skipped_count': task.skipped_count + len(ids) - deleted,
+            })
+            self._commit()
+            _logger.info(u'清理业务数据 %s：第 %s 批，删除 %s 行',
+                         task.name, task.batch_count, deleted)
+        task.state = 'done'
+        self._commit()
+
+    @api.multi
+    def _archive_rows(self, task, ids):
+        ''' 一批数据写入归档目录下的 表名_批次.csv.gz，重做同一批时覆盖 '''
+        path = self.archive_path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.env.cr.execute('SELECT * FROM "%s" WHERE id IN %%s ORDER BY id' % task.name,
+                            (tuple(ids),))
+        columns = [desc[0] for desc in self.env.cr.description]
+        file_name = os.path.join(path, '%s_%06d.csv.gz' % (task.name, task.batch_count + 1))
+        with gzip.open(file_name, 'wb') as archive:
+            writer = csv.writer(archive)
+            writer.writerow(columns)
+            for row in self.env.cr.fetchall():
+                writer.writerow([_archive_value(value) for value in row])
+
+    @api.model
+    def _delete_rows(self, table, ids):
+        '''
+        删除一批数据，返回删除行数。
+        整批因仍被未清理的数据引用而失败时逐行删除，跳过仍被引用的行
+        '''
+        cr = self.env.cr
+        try:
+            with cr.savepoint():
+                cr.execute('DELETE FROM "%s" WHERE id IN %%s' % table, (tuple(ids),))
+                return cr.rowcount
+        except psycopg2.IntegrityError:
+            deleted = 0
+            for record_id in ids:
+                try:
+                    with cr.savepoint():
+                        cr.execute('DELETE FROM "%s" WHERE id = %%s' % table, (record_id,))
+                        deleted += cr.rowcount
+                except psycopg2.IntegrityError:
+                    pass
+            return deleted
+
+
+class CleanBusinessDataTask(models.Model):
+    ''' 清理进度：每个数据库表一行，记录最后处理的 id 以便中断后继续 '''
+    _name = 'clean.business.data.task'
+    _description = u'清理进度'
+    _order = 'sequence, id'
+
+    clean_id = fields.Many2one('clean.business.data', u'清理记录',
+                               ondelete='cascade', index=True)
+    sequence = fields.Integer(u'顺序')
+    name = fields.Char(u'数据库表', required=True)
+    state = fields.Selection(TASK_STATE, u'状态', default='wait')
+    last_id = fields.Integer(u'最后处理的id', default=0)
+    batch_count = fields.Integer(u'批数')
+    deleted_count = fields.Integer(u'删除行数')
+    skipped_count = fields.Integer(u'仍被引用未删除行数')
+    message = fields.Char(u'说明')
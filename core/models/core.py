@@ -1,18 +1,31 @@
 # -*- coding: utf-8 -*-
 
 import odoo.addons.decimal_precision as dp
-from odoo import api, fields, models
+from odoo import api, fields, models, tools
 from odoo.exceptions import UserError
 
 # 单据自动编号，避免在所有单据对象上重载
 
 create_original = models.BaseModel.create
 
+# 不自动编号的模块前缀
+SEQUENCE_SKIP_PREFIXES = ['mail', 'ir', 'res']
+
+
+def _use_sequence(model):
+    '''
+    模型是否自动编号：有 name 字段，且存在以模型名为编码的序列。
+    没有序列的明细行（如 wh.move.line、voucher.line）不再每次查询 ir.sequence
+    '''
+    return 'name' in model._fields \
+        and model._name.split('.')[0] not in SEQUENCE_SKIP_PREFIXES \
+        and model._name in model.env['ir.sequence']._get_sequence_codes()
+
 
 @api.model
 @api.returns('self', lambda value: value.id)
 def create(self, vals):
-    if not self._name.split('.')[0] in ['mail', 'ir', 'res'] and not vals.get('name'):
+    if not vals.get('name') and _use_sequence(self):
         next_name = self.env['ir.sequence'].next_by_code(self._name)
         if next_name:
             vals.update({'name': next_name})
@@ -22,6 +35,144 @@ def create(self, vals):
 
 models.BaseModel.create = create
 
+
+@api.model
+def create_multi(self, vals_list):
+    '''
+    批量新建记录，缺少 name 的记录一次预留所需数量的编号
+    :return: 新建的记录集
+    '''
+    vals_list = [dict(vals) for vals in vals_list]
+    missing = [vals for vals in vals_list if not vals.get('name')]
+    if missing and _use_sequence(self):
+        names = self.env['ir.sequence'].next_by_code_batch(
+            self._name, len(missing))
+        for vals, name in zip(missing, names):
+            vals['name'] = name
+    return self.browse([self.create(vals).id for vals in vals_list])
+
+
+models.BaseModel.create_multi = create_multi
+
+
+class IrSequence(models.Model):
+    _inherit = 'ir.sequence'
+
+    @tools.ormcache()
+    def _get_sequence_codes(self):
+        ''' 所有启用序列的编码，供自动编号判断模型是否有序列 '''
+        self.env.cr.execute('''
+            SELECT DISTINCT code FROM ir_sequence
+             WHERE code IS NOT NULL AND active
+        ''')
+        return frozenset(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def create(self, vals):
+        res = super(IrSequence, self).create(vals)
+        self.clear_caches()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(IrSequence, self).write(vals)
+        if set(vals) & set(['code', 'active']):
+            self.clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(IrSequence, self).unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    def next_by_code_batch(self, sequence_code, count):
+        '''
+        按编码一次预留 count 个编号，公司匹配规则同 next_by_code
+        :return: 编号列表，找不到序列时返回空列表
+        '''
+        self.check_access_rights('read')
+        company_id = self._context.get(
+            'force_company') or self.env.user.company_id.id
+        seqs = self.search([('code', '=', sequence_code),
+                            ('company_id', 'in', [company_id, False])],
+                           order='company_id')
+        if not seqs:
+            return []
+        return seqs[0]._next_batch(count)
+
+    @api.multi
+    def _next_batch(self, count):
+        '''
+        一次取 count 个号：标准序列一条 nextval 查询，无间隔序列一次加锁累加。
+        按日期分段或自动重置的序列逐个取号
+        '''
+        self.ensure_one()
+        if count <= 0:
+            return []
+        if self.use_date_range or ('auto_reset' in self._fields and self.auto_reset):
+            return [self._next() for _i in range(count)]
+        step = self.number_increment
+        if self.implementation == 'standard':
+            self.env.cr.execute(
+                "SELECT nextval('ir_sequence_%03d') FROM generate_series(1, %%s)" % self.id,
+                (count,))
+            numbers = sorted([row[0] for row in self.env.cr.fetchall()],
+                             reverse=step < 0)
+        else:
+            self.env.cr.execute(
+                'SELECT number_next FROM ir_sequence WHERE id = %s FOR UPDATE NOWAIT',
+                (self.id,))
+            number_next = self.env.cr.fetchone()[0]
+            self.env.cr.execute(
+                'UPDATE ir_sequence SET number_next = number_next + %s WHERE id = %s',
+                (step * count, self.id))
+            self.invalidate_cache(['number_next'], [self.id])
+            numbers = [number_next + step * i for i in range(count)]
+        return [self.get_next_char(number) for number in numbers]
+
+# 批量写入，用于一次生成大量明细行的场景（补货申请行、报表行等）
+
+BULK_INSERT_SIZE = 1000
+
+
+def _bulk_insert(self, vals_list):
+    '''
+    用多行 INSERT 一次写入多条记录，不逐条调用 create
+    vals_list 中各字典的键必须相同，且只能是普通存储字段；
+    不触发计算字段、约束和自动编号，调用方自行保证数据完整
+    :return: 新建的记录集
+    '''
+    if not vals_list:
+        return self.browse()
+    names = sorted(vals_list[0])
+    columns = list(names)
+    if self._log_access:
+        now = fields.Datetime.now()
+        columns += ['create_uid', 'create_date', 'write_uid', 'write_date']
+        log_values = [self.env.uid, now, self.env.uid, now]
+    else:
+        log_values = []
+    fields_ = [self._fields[name] for name in names]
+    placeholders = '(%s)' % ','.join(['%s'] * len(columns))
+    ids = []
+    cr = self.env.cr
+    for index in range(0, len(vals_list), BULK_INSERT_SIZE):
+        rows = [cr.mogrify(placeholders,
+                           [field.convert_to_column(vals[field.name], self)
+                            for field in fields_] + log_values)
+                for vals in vals_list[index:index + BULK_INSERT_SIZE]]
+        cr.execute('INSERT INTO "%s" (%s) VALUES %s RETURNING id' % (
+            self._table, ','.join('"%s"' % column for column in columns),
+            ','.join(rows)))
+        ids += [row[0] for row in cr.fetchall()]
+    self.invalidate_cache()
+    return self.browse(ids)
+
+
+models.BaseModel._bulk_insert = _bulk_insert
+
 class BaseModelExtend(models.AbstractModel):
     _name = 'basemodel.extend'
 
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import uuid
+
+from odoo import api, fields, models
+
+# 生成的报表行保留的小时数，超时后下次生成该报表时删除
+REPORT_RUN_TTL = 1
+
+
+class ReportMaterialize(models.AbstractModel):
+    '''
+    向导生成的报表行。
+    报表模型继承此类并声明 _report_columns，用 materialize_query（INSERT ... SELECT）
+    或 materialize_rows（多行 INSERT）一次写入一批报表行。
+    同一次生成的行有相同的 run_tag，报表动作按 run_tag 过滤而不是传 id 列表
+    '''
+    _name = 'report.materialize'
+    _description = u'报表行生成'
+
+    # 报表字段名，materialize_query 的源查询按此顺序返回各列
+    _report_columns = []
+
+    run_tag = fields.Char(u'生成批次', index=True, readonly=True, copy=False)
+
+    @api.model
+    def _gc_runs(self):
+        ''' 删除超过 REPORT_RUN_TTL 小时的报表行 '''
+        self.env.cr.execute('''
+            DELETE FROM "%s"
+             WHERE create_date < (now() at time zone 'UTC') - interval '%s hours'
+        ''' % (self._table, REPORT_RUN_TTL))
+
+    @api.model
+    def _domain_subquery(self, model, domain):
+        '''
+        把模型上的 domain（含记录规则）转换为 SELECT id 子查询，
+        源查询用 "id IN (子查询)" 复用向导上的过滤条件
+        :return: (子查询, 参数列表)
+        '''
+        Model = self.env[model]
+        query = Model._where_calc(domain)
+        Model._apply_ir_rules(query, 'read')
+        from_clause, where_clause, params = query.get_sql()
+        return 'SELECT "%s".id FROM %s WHERE %s' % (
+            Model._table, from_clause, where_clause or 'TRUE'), params
+
+    @api.model
+    def materialize_query(self, query, params=None):
+        '''
+        用一条 INSERT ... SELECT 写入报表行
+        :param query: 源查询，各列依次对应 _report_columns
+        :return: run_tag
+        '''
+        self._gc_runs()
+        run_tag = uuid.uuid4().hex
+        columns = list(self._report_columns) + ['run_tag']
+        values = ['src.*', '%s']
+        head_params = [run_tag]
+        if self._log_access:
+            columns += ['create_uid', 'create_date', 'write_uid', 'write_date']
+            values += ['%s', "(now() at time zone 'UTC')"] * 2
+            head_params += [self.env.uid, self.env.uid]
+        self.env.cr.execute('INSERT INTO "%s" (%s) SELECT %s FROM (%s) src' % (
+            self._table, ','.join('"%s"' % column for column in columns),
+            ','.join(values), query), head_params + list(params or []))
+        self.invalidate_cache()
+        return run_tag
+
+    @api.model
+    def materialize_rows(self, vals_list):
+        '''
+        用多行 INSERT 写入在 Python 中算好的报表行，缺少的字段写空
+        :return: run_tag
+        '''
+        self._gc_runs()
+        run_tag = uuid.uuid4().hex
+        names = self._report_columns or sorted(
+            set(name for vals in vals_list for name in vals))
+        self._bulk_insert([
+            dict([(name, vals.get(name, False)) for name in names],
+                 run_tag=run_tag)
+            for vals in vals_list])
+        return run_tag
+
+    @api.model
+    def get_run_action(self, run_tag, name, views, **kwargs):
+        ''' 打开一次生成的报表行 '''
+        action = {
+            'name': name,
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'view_type': 'form',
+            'view_mode': ','.join(view_type for _view_id, view_type in views),
+            'view_id': False,
+            'views': views,
+            'domain': [('run_tag', '=', run_tag)],
+        }
+        action.update(kwargs)
+        return action
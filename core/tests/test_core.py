@@ -60,7 +60,8 @@ class TestBusinessData(TransactionCase):
         business_data_table = self.env['business.data.table']
         clean_business_data = self.env['clean.business.data']
         business_data_table.create({'name': 'home.report.type'})
-        clean_business_data.create({'create_uid': self.env.uid}).remove_data()
+        clean_business_data.create({'create_uid': self.env.uid,
+                                    'archive': False}).remove_data()
 
     def test_clean_business_data_no_table(self):
         ''' 测试清空业务数据 表不存在会报错'''
@@ -71,6 +72,47 @@ class TestBusinessData(TransactionCase):
             clean_business_data.create(
                 {'create_uid': self.env.uid}).remove_data()
 
+    def test_clean_business_data_batch(self):
+        ''' 测试分批清理业务数据：按公司、日期过滤，中断后继续 '''
+        business_data_table = self.env['business.data.table']
+        company = self.env['res.company'].create({
+            'name': 'demo company',
+            'partner_id': self.env.ref('core.zt').id
+        })
+        business_data_table.search([]).unlink()
+        kept = business_data_table.create({'name': 'business.data.table'})
+        purged = business_data_table.create({'name': 'business.data.table',
+                                             'company_id': company.id})
+        clean = self.env['clean.business.data'].create({
+            'clean_company_id': company.id,
+            'batch_size': 1,
+            'archive': False,
+        })
+        # 截止日期之前没有数据
+        clean.date_cutoff = '2000-01-01'
+        clean.remove_data()
+        self.assertEqual(clean.state, 'done')
+        self.assertEqual(clean.deleted_count, 0)
+        self.assertTrue(purged.exists())
+        # 没有单据日期的表不按创建时间清理
+        self.assertEqual(clean.task_ids.mapped('state'), ['skipped'])
+
+        clean.write({'date_cutoff': False, 'state': 'draft'})
+        clean.remove_data()
+        self.assertEqual(clean.progress, 100)
+        self.assertEqual(clean.deleted_count, 1)
+        self.assertFalse(purged.exists())
+        self.assertTrue(kept.exists())
+
+        # 模拟中断：进度回到待清理，继续时从最后处理的 id 之后开始
+        again = business_data_table.create({'name': 'business.data.table',
+                                            'company_id': company.id})
+        clean.task_ids.write({'state': 'wait'})
+        clean.write({'state': 'running'})
+        clean.action_resume()
+        self.assertFalse(again.exists())
+        self.assertEqual(clean.task_ids.batch_count, 2)
+
 
 class TestResCompany(TransactionCase):
 
@@ -80,3 +122,43 @@ class TestResCompany(TransactionCase):
             'name': 'demo company',
             'partner_id': self.env.ref('core.zt').id
         })
+
+
+class TestSequence(TransactionCase):
+
+    def setUp(self):
+        super(TestSequence, self).setUp()
+        self.sequence = self.env['ir.sequence'].create({
+            'name': u'可选值',
+            'code': 'core.value',
+            'prefix': 'CV',
+            'padding': 4,
+        })
+
+    def test_sequence_codes_cache(self):
+        ''' 新建、删除序列后自动编号的序列编码缓存随之更新 '''
+        self.assertIn('core.value', self.env['ir.sequence']._get_sequence_codes())
+        value = self.env['core.value'].create({'type': 'test'})
+        self.assertTrue(value.name.startswith('CV'))
+        self.sequence.unlink()
+        self.assertNotIn('core.value', self.env['ir.sequence']._get_sequence_codes())
+
+    def test_next_by_code_batch(self):
+        ''' 一次预留多个编号 '''
+        names = self.env['ir.sequence'].next_by_code_batch('core.value', 3)
+        self.assertEqual(len(set(names)), 3)
+        self.assertEqual(sorted(names), names)
+        self.assertEqual(self.env['ir.sequence'].next_by_code_batch('core.none', 3), [])
+        self.sequence.implementation = 'no_gap'
+        names = self.env['ir.sequence'].next_by_code_batch('core.value', 2)
+        self.assertEqual(int(names[1][2:]) - int(names[0][2:]), 1)
+        self.assertEqual(self.env['ir.sequence'].next_by_code('core.value')[2:],
+                         '%04d' % (int(names[1][2:]) + 1))
+
+    def test_create_multi(self):
+        ''' 批量新建时缺少 name 的记录按顺序编号，已有 name 的保持不变 '''
+        values = self.env['core.value'].create_multi([
+            {'type': 'test'}, {'type': 'test', 'name': 'manual'}, {'type': 'test'}])
+        self.assertEqual(len(values), 3)
+        self.assertEqual(values[1].name, 'manual')
+        self.assertTrue(values[0].name < values[2].name)
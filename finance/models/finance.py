@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import calendar
+import collections
 from datetime import datetime
 import odoo.addons.decimal_precision as dp
 from odoo import api, fields, models
@@ -23,6 +24,15 @@ MONTH_SELECTION = [
     ('11', u'11'),
     ('12', u'12')]
 
+# 业务单据批量生成凭证行时写入的字段
+VOUCHER_LINE_FIELDS = ('name', 'account_id', 'partner_id', 'goods_id', 'auxiliary_id',
+                       'currency_id', 'init_obj')
+# 合并凭证行时相加的字段
+VOUCHER_LINE_SUM_FIELDS = ('debit', 'credit', 'goods_qty', 'currency_amount')
+# 可合并的凭证行需要相同的字段
+VOUCHER_LINE_MERGE_KEYS = ('account_id', 'partner_id', 'goods_id', 'auxiliary_id',
+                           'currency_id')
+
 # 字段只读状态
 READONLY_STATES = {
     'done': [('readonly', True)],
@@ -99,21 +109,8 @@ class Voucher(models.Model):
             raise UserError(u'该会计期间已结账！不能审核')
         if not self.line_ids:
             raise ValidationError(u'请输入凭证行')
-        for line in self.line_ids:
-            if line.debit + line.credit == 0:
-                raise ValidationError(u'单行凭证行 %s 借和贷不能同时为0\n 借方金额为: %s 贷方金额为:%s' % (
-                    line.account_id.name, line.debit, line.credit))
-            if line.debit * line.credit != 0:
-                raise ValidationError(u'单行凭证行不能同时输入借和贷\n 摘要为%s的凭证行 借方为:%s 贷方为:%s' %
-                                      (line.name, line.debit, line.credit))
-        debit_sum = sum([line.debit for line in self.line_ids])
-        credit_sum = sum([line.credit for line in self.line_ids])
-        precision = self.env['decimal.precision'].precision_get('Amount')
-        debit_sum = round(debit_sum, precision)
-        credit_sum = round(credit_sum, precision)
-        if debit_sum != credit_sum:
-            raise ValidationError(u'借贷方不平!\n 借方合计:%s 贷方合计:%s' %
-                                  (debit_sum, credit_sum))
+        self._check_voucher_lines([(line.name, line.account_id, line.debit, line.credit)
+                                   for line in self.line_ids])
 
         self.state = 'done'
         if self.is_checkout:   # 月结凭证不做反转
@@ -128,6 +125,91 @@ class Voucher(models.Model):
                 line.credit = -line.debit
                 line.debit = 0
 
+    @api.model
+    def _check_voucher_lines(self, lines):
+        """
+        审核前校验凭证行：每行借贷只能有一方且不为0，借贷方合计相等
+        :param lines: (摘要, 科目, 借方, 贷方) 的列表
+        """
+        for name, account, debit, credit in lines:
+            if debit + credit == 0:
+                raise ValidationError(u'单行凭证行 %s 借和贷不能同时为0\n 借方金额为: %s 贷方金额为:%s' % (
+                    account.name, debit, credit))
+            if debit * credit != 0:
+                raise ValidationError(u'单行凭证行不能同时输入借和贷\n 摘要为%s的凭证行 借方为:%s 贷方为:%s' %
+                                      (name, debit, credit))
+        precision = self.env['decimal.precision'].precision_get('Amount')
+        debit_sum = round(sum([line[2] for line in lines]), precision)
+        credit_sum = round(sum([line[3] for line in lines]), precision)
+        if debit_sum != credit_sum:
+            raise ValidationError(u'借贷方不平!\n 借方合计:%s 贷方合计:%s' %
+                                  (debit_sum, credit_sum))
+
+    @api.model
+    def merge_voucher_lines(self, lines):
+        """
+        把科目、往来单位、商品、辅助核算、外币及借贷方向相同的凭证行合并为一行，
+        摘要取第一行，金额和数量相加
+        """
+        merged = collections.OrderedDict()
+        for line in lines:
+            key = tuple(line.get(name) or False for name in VOUCHER_LINE_MERGE_KEYS) + \
+                (bool(line.get('debit')),)
+            if key not in merged:
+                merged[key] = dict(line)
+                continue
+            for name in VOUCHER_LINE_SUM_FIELDS:
+                merged[key][name] = (merged[key].get(name) or 0) + (line.get(name) or 0)
+        return merged.values()
+
+    @api.model
+    def create_voucher(self, vals, lines, merge=False):
+        """
+        业务单据生成凭证并审核：凭证行在内存中汇总、一次校验借贷平衡，
+        用一条多行 INSERT 写入，凭证只做一次审核状态变更
+        :param vals: 凭证的值，如 {'date': ...}
+        :param lines: 凭证行值的列表，键为 voucher.line 的字段
+        :param merge: 是否合并科目、往来单位、商品、辅助核算相同的行
+        :return: 已审核的凭证
+        """
+        if not lines:
+            raise ValidationError(u'请输入凭证行')
+        if merge:
+            lines = self.merge_voucher_lines(lines)
+        accounts = self.env['finance.account'].browse(
+            [line.get('account_id') for line in lines])
+        self._check_voucher_lines([(line.get('name'), account,
+                                    line.get('debit') or 0, line.get('credit') or 0)
+                                   for line, account in zip(lines, accounts)])
+
+        voucher = self.create(vals)
+        if voucher.period_id.is_closed:
+            raise UserError(u'该会计期间已结账！不能审核')
+        company_id = self.env['res.company']._company_default_get().id
+        vals_list = []
+        for line, account in zip(lines, accounts):
+            line_vals = {name: line.get(name) or False for name in VOUCHER_LINE_FIELDS}
+            for name in VOUCHER_LINE_SUM_FIELDS + ('rate_silent',):
+                line_vals[name] = line.get(name) or 0
+            # 同 voucher_done：费用类科目只记借方，收入类科目只记贷方
+            if not voucher.is_checkout:
+                if account.costs_types == 'out' and line_vals['credit']:
+                    line_vals['debit'], line_vals['credit'] = -line_vals['credit'], 0
+                if account.costs_types == 'in' and line_vals['debit']:
+                    line_vals['credit'], line_vals['debit'] = -line_vals['debit'], 0
+            line_vals.update({
+                'voucher_id': voucher.id,
+                'period_id': voucher.period_id.id,
+                'date': voucher.date,
+                'state': 'draft',
+                'company_id': line.get('company_id') or company_id,
+            })
+            vals_list.append(line_vals)
+        self.env['voucher.line']._bulk_insert(vals_list)
+        voucher.modified(['line_ids'])
+        voucher.write({'state': 'done'})
+        return voucher
+
     @api.one
     def voucher_draft(self):
         if self.state == 'draft':
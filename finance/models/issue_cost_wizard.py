@@ -5,6 +5,12 @@ from odoo.exceptions import UserError
 import odoo.addons.decimal_precision as dp
 from odoo.tools import float_is_zero
 
+# 发出成本行的数量、金额字段，批量写入时缺省为 0
+MONTH_PRODUCT_COST_FIELDS = ['period_begin_qty', 'period_begin_cost',
+                             'current_period_out_qty', 'current_period_out_cost',
+                             'current_period_in_qty', 'current_period_in_cost',
+                             'current_period_remaining_qty', 'current_period_remaining_cost']
+
 
 class MonthProductCost(models.Model):
     _name = 'month.product.cost'
@@ -57,6 +63,27 @@ class MonthProductCost(models.Model):
         ''' % (date_range[0], date_range[1]))
         return self.env.cr.dictfetchall()
 
+    @api.multi
+    def get_last_period_remaining(self, period_id, goods_ids):
+        """
+        一次取出所有商品上一期间的剩余数量和成本
+        :param period_id: 当前期间，取每个商品在此之前最近的一条发出成本记录
+        :param goods_ids: 商品 id 列表
+        :return: {goods_id: (剩余数量, 剩余数量成本)}
+        """
+        if not goods_ids:
+            return {}
+        self.env.cr.execute('''
+            SELECT DISTINCT ON (goods_id) goods_id,
+                   COALESCE(current_period_remaining_qty, 0),
+                   COALESCE(current_period_remaining_cost, 0)
+            FROM month_product_cost
+            WHERE period_id < %s
+              AND goods_id IN %s
+            ORDER BY goods_id, id DESC
+        ''', (period_id.id, tuple(goods_ids)))
+        return {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
     @api.multi
     def get_goods_last_period_remaining_qty(self, period_id, goods_id):
         """
@@ -64,16 +91,8 @@ class MonthProductCost(models.Model):
         :param goods_id: 出入 goods 精确找到 上一期间 对应的 month.product.cost 记录
         :return: 让上一期间的 剩余数量，和剩余数量成本 以字典 形式返回
         """
-        last_period_remaining_qty = 0
-        last_period_remaining_cost = 0
-
-        # 查找 离输入期间最近的 对应产品的发出成本行
-        last_month_product_cost_row = self.search([('period_id', '<', period_id.id),
-                                                   ('goods_id', '=', goods_id)], limit=1, order='id desc')
-        if last_month_product_cost_row:
-            last_period_remaining_qty = last_month_product_cost_row.current_period_remaining_qty
-            last_period_remaining_cost = last_month_product_cost_row.current_period_remaining_cost
-
+        last_period_remaining_qty, last_period_remaining_cost = self.get_last_period_remaining(
+            period_id, [goods_id]).get(goods_id, (0, 0))
         return {
             'last_period_remaining_qty': last_period_remaining_qty,
             'last_period_remaining_cost': last_period_remaining_cost
@@ -126,18 +145,31 @@ class MonthProductCost(models.Model):
             month_cost = data_dcit.get("current_period_out_cost", 0)
         return round(month_cost, 2)
 
+    @api.multi
+    def get_real_out_cost(self, period_id, goods_ids):
+        """
+        一次算出所有商品当期库存商品科目（所有商品类别涉及的科目）贷方金额合计
+        :return: {goods_id: 贷方金额合计}
+        """
+        if not goods_ids:
+            return {}
+        self.env.cr.execute('''
+            SELECT goods_id, SUM(credit)
+            FROM voucher_line
+            WHERE period_id = %s
+              AND credit > 0
+              AND goods_id IN %s
+            GROUP BY goods_id
+        ''', (period_id.id, tuple(goods_ids)))
+        return dict(self.env.cr.fetchall())
+
     @api.multi
     def compute_real_out_cost(self, data_dict, period_id):
         """
         计算当期库存商品科目（所有商品类别涉及的科目）贷方金额合计
         """
-        line = self.env['voucher.line'].search([
-            ('goods_id', '=', data_dict.get('goods_id')),
-            ('voucher_id.period_id', '=', period_id.id),
-            ('credit', '>', 0)
-        ])
-        cost = sum(l.credit for l in line)
-        return cost
+        goods_id = data_dict.get('goods_id')
+        return self.get_real_out_cost(period_id, [goods_id]).get(goods_id, 0)
 
     @api.multi
     def create_month_product_cost_voucher(self, period_id, date, month_product_cost_dict):
@@ -152,12 +184,17 @@ class MonthProductCost(models.Model):
         voucher_line_data_list = []
         account_row = self.env.ref('finance.account_cost')
         all_balance_price = 0
+        goods_ids = list(month_product_cost_dict)
+        real_out_costs = self.get_real_out_cost(period_id, goods_ids)
+        goods_rows = {goods.id: goods for goods in self.env['goods'].browse(goods_ids)}
+        company_id = self.env['res.company']._company_default_get().id
+        vals_list = []
         for create_vals in month_product_cost_dict.values():
-            goods_row = self.env['goods'].browse(create_vals.get('goods_id'))
+            goods_row = goods_rows[create_vals.get('goods_id')]
             current_period_out_cost = self.compute_balance_price(
                 create_vals)   # 当期加权平均成本
-            real_out_cost = self.compute_real_out_cost(
-                create_vals, period_id)  # 发出时已结转的实际成本
+            real_out_cost = real_out_costs.get(
+                create_vals.get('goods_id'), 0)  # 发出时已结转的实际成本
 
             diff_cost = current_period_out_cost - real_out_cost  # 两者之差
             if not float_is_zero(diff_cost,2):  # 贷方
@@ -167,13 +204,19 @@ class MonthProductCost(models.Model):
                                      'goods_qty': create_vals.get('current_period_out_qty')}
                 voucher_line_data_list.append([0, 0, voucher_line_data.copy()])
                 all_balance_price += diff_cost
-            # 创建 发出成本
+            # 发出成本
             create_vals.update({'current_period_out_cost': current_period_out_cost,
                                 'current_period_remaining_cost': create_vals.get('period_begin_cost', 0) +
                                 create_vals.get('current_period_in_cost', 0) -
                                 current_period_out_cost
                                 })
-            self.create(create_vals)
+            vals = {name: create_vals.get(name) or 0 for name in MONTH_PRODUCT_COST_FIELDS}
+            vals.update({'goods_id': create_vals.get('goods_id'),
+                         'period_id': period_id.id,
+                         'company_id': company_id})
+            vals_list.append(vals)
+        # 所有商品的发出成本一次写入
+        self._bulk_insert(vals_list)
 
         if all_balance_price != 0:  # 借方
             voucher_line_data_list.append(
@@ -190,25 +233,20 @@ class MonthProductCost(models.Model):
         把 list_dict_data 按产品合并成 month_product_cost_dict，并填充期初、期末
         """
         month_product_cost_dict = {}
+        last_period_remaining = self.get_last_period_remaining(
+            period_id, list(set(dict_goods.get('goods_id') for dict_goods in list_dict_data)))
         for dict_goods in list_dict_data:
-            period_begin_qty_cost = self.get_goods_last_period_remaining_qty(
-                period_id, dict_goods.get('goods_id'))
-            vals = {}
-            if dict_goods.get('goods_id') not in month_product_cost_dict:
-                vals = {'goods_id': dict_goods.get('goods_id'), 'period_id': period_id.id,
-                        'period_begin_qty': period_begin_qty_cost.get('last_period_remaining_qty', 0),
-                        'period_begin_cost': period_begin_qty_cost.get('last_period_remaining_cost', 0)}
-                vals.update(self.fill_in_out(dict_goods))
-                month_product_cost_dict.update(
-                    {dict_goods.get('goods_id'): vals.copy()})
-                month_product_cost_dict.get(dict_goods.get('goods_id')).update(self.month_remaining_qty_cost(
-                    month_product_cost_dict.get(dict_goods.get('goods_id'))))
-            else:
-                vals.update(self.fill_in_out(dict_goods))
-                month_product_cost_dict.get(
-                    dict_goods.get('goods_id')).update(vals.copy())
-                month_product_cost_dict.get(dict_goods.get('goods_id')).update(self.month_remaining_qty_cost(
-                    month_product_cost_dict.get(dict_goods.get('goods_id'))))
+            goods_id = dict_goods.get('goods_id')
+            if goods_id not in month_product_cost_dict:
+                period_begin_qty, period_begin_cost = last_period_remaining.get(
+                    goods_id, (0, 0))
+                month_product_cost_dict[goods_id] = {
+                    'goods_id': goods_id, 'period_id': period_id.id,
+                    'period_begin_qty': period_begin_qty,
+                    'period_begin_cost': period_begin_cost}
+            vals = month_product_cost_dict[goods_id]
+            vals.update(self.fill_in_out(dict_goods))
+            vals.update(self.month_remaining_qty_cost(vals))
 
         return month_product_cost_dict
 
@@ -485,7 +485,7 @@ class CreateVouchersSummaryWizard(models.TransientModel):
                 raise UserError(u'期间%s未结账，无法取到%s期初余额' %
                                 (last_period.name, self.period_begin_id.name))
         # period_end = self.env['create.trial.balance.wizard'].compute_next_period_id(self.period_end_id)
-        vouchers_summary_ids = []
+        vals_list = []
         subject_ids = self.env['finance.account'].search([('code', '>=', self.subject_name_id.code),
                                                           ('code', '<=', self.subject_name_end_id.code)])
         for account_line in subject_ids:
@@ -524,9 +524,10 @@ class CreateVouchersSummaryWizard(models.TransientModel):
                 if self.no_balance and cumulative_year_occurrence[0].get('credit') == 0 \
                         and cumulative_year_occurrence[0].get('debit') == 0:
                     continue
-                for vals in create_vals:  # create_vals 值顺序为：期初余额  本期明细  本期本年累计
-                    vouchers_summary_ids.append(
-                        (self.env['vouchers.summary'].create(vals)).id)
+                vals_list += create_vals  # create_vals 值顺序为：期初余额  本期明细  本期本年累计
+        # 所有明细账记录一次写入
+        report = self.env['vouchers.summary']
+        run_tag = report.materialize_rows(vals_list)
         view_id = self.env.ref('finance.vouchers_summary_tree').id
 
         title = self.period_begin_id.name
@@ -539,18 +540,9 @@ class CreateVouchersSummaryWizard(models.TransientModel):
             title += '-'
             title += self.subject_name_end_id.name
 
-        return {
-            'type': 'ir.actions.act_window',
-            'name': u'明细账 : %s' % title,
-            'view_type': 'form',
-            'view_mode': 'tree',
-            'res_model': 'vouchers.summary',
-            'target': 'current',
-            'view_id': False,
-            'views': [(view_id, 'tree')],
-            'domain': [('id', 'in', vouchers_summary_ids)],
-            'limit': 65535,
-        }
+        return report.get_run_action(
+            run_tag, u'明细账 : %s' % title, [(view_id, 'tree')],
+            target='current', limit=65535)
 
     @api.multi
     def create_general_ledger_account(self):
@@ -561,7 +553,7 @@ class CreateVouchersSummaryWizard(models.TransientModel):
             raise UserError(u'期间%s未结账，无法取到%s期初余额' %
                             (last_period.name, self.period_begin_id.name))
         # period_end = self.env['create.trial.balance.wizard'].compute_next_period_id(self.period_end_id)
-        vouchers_summary_ids = []
+        vals_list = []
         subject_ids = self.env['finance.account'].search([('code', '>=', self.subject_name_id.code),
                                                           ('code', '<=', self.subject_name_end_id.code)])
         for account_line in subject_ids:
@@ -593,9 +585,11 @@ class CreateVouchersSummaryWizard(models.TransientModel):
                     continue
                 for vals in create_vals:
                     del vals['date']
-                    vouchers_summary_ids.append(
-                        (self.env['general.ledger.account'].create(vals)).id)
+                vals_list += create_vals
 
+        # 所有总账记录一次写入
+        report = self.env['general.ledger.account']
+        run_tag = report.materialize_rows(vals_list)
         view_id = self.env.ref('finance.general_ledger_account_tree').id
 
         title = self.period_begin_id.name
@@ -608,23 +602,15 @@ class CreateVouchersSummaryWizard(models.TransientModel):
             title += '-'
             title += self.subject_name_end_id.name
 
-        return {
-            'type': 'ir.actions.act_window',
-            'name': u'总账 %s' % title,
-            'view_type': 'form',
-            'view_mode': 'tree',
-            'res_model': 'general.ledger.account',
-            'target': 'current',
-            'view_id': False,
-            'views': [(view_id, 'tree')],
-            'domain': [('id', 'in', vouchers_summary_ids)],
-            'limit': 65535,
-        }
+        return report.get_run_action(
+            run_tag, u'总账 %s' % title, [(view_id, 'tree')],
+            target='current', limit=65535)
 
 
 class VouchersSummary(models.TransientModel):
     """明细帐"""
     _name = 'vouchers.summary'
+    _inherit = 'report.materialize'
     _description = u'明细账'
 
     date = fields.Date(u'日期', help=u'日期')
@@ -657,6 +643,7 @@ class VouchersSummary(models.TransientModel):
 class GeneralLedgerAccount(models.TransientModel):
     """总账"""
     _name = 'general.ledger.account'
+    _inherit = 'report.materialize'
     _description = u'总账'
 
     period_id = fields.Many2one(
@@ -192,6 +192,33 @@ class TestVoucher(TransactionCase):
         voucher_obj.create({})
 
 
+    def test_create_voucher(self):
+        '''业务单据批量生成凭证：合并同科目行、收入类科目转贷方、一次审核'''
+        bank = self.env.ref('finance.account_bank')
+        income = self.env.ref('finance.account_income')
+        voucher = self.env['voucher'].create_voucher({'date': '2017-01-01'}, [
+            {'name': u'退款给客户', 'account_id': bank.id, 'credit': 30.0},
+            {'name': u'退款给客户', 'account_id': bank.id, 'credit': 20.0},
+            {'name': u'退款给客户', 'account_id': income.id, 'debit': 50.0},
+        ], merge=True)
+        self.assertEqual(voucher.state, 'done')
+        self.assertEqual(len(voucher.line_ids), 2)
+        self.assertTrue(all(line.state == 'done' for line in voucher.line_ids))
+        bank_line = voucher.line_ids.filtered(lambda line: line.account_id == bank)
+        self.assertEqual(bank_line.credit, 50.0)
+        income_line = voucher.line_ids.filtered(lambda line: line.account_id == income)
+        self.assertEqual((income_line.debit, income_line.credit), (0, -50.0))
+        # 借贷不平
+        with self.assertRaises(ValidationError):
+            self.env['voucher'].create_voucher({'date': '2017-01-01'}, [
+                {'name': u'不平', 'account_id': bank.id, 'credit': 30.0},
+                {'name': u'不平', 'account_id': income.id, 'debit': 50.0},
+            ])
+        # 没有凭证行
+        with self.assertRaises(ValidationError):
+            self.env['voucher'].create_voucher({'date': '2017-01-01'}, [])
+
+
 class TestPeriod(TransactionCase):
 
     def test_get_period(self):
@@ -409,3 +436,31 @@ class TestMonthProductCost(TransactionCase):
             {'date': '2016-01-31', 'period_id': self.period_id.id})
         with self.assertRaises(UserError):
             checkout_wizard_row.button_checkout()
+
+    def test_data_structure(self):
+        """按商品汇总出入库，期初取各商品上一期间最近的剩余数量和成本"""
+        goods = self.env['goods'].create({
+            'name': u'发出成本测试商品',
+            'category_id': self.env.ref('core.goods_category_1').id,
+            'uom_id': self.env.ref('core.uom_pc').id,
+        })
+        month_product_cost = self.env['month.product.cost']
+        for period, qty, cost in (('finance.period_201511', 5, 50),
+                                  ('finance.period_201512', 10, 120)):
+            month_product_cost.create({
+                'period_id': self.env.ref(period).id,
+                'goods_id': goods.id,
+                'current_period_remaining_qty': qty,
+                'current_period_remaining_cost': cost,
+            })
+        res = month_product_cost.data_structure([
+            {'goods_id': goods.id, 'type': 'in', 'qty': 2, 'cost': 30},
+            {'goods_id': goods.id, 'type': 'out', 'qty': 4, 'cost': 40},
+        ], self.period_id)
+        vals = res[goods.id]
+        self.assertEqual(vals['period_begin_qty'], 10)
+        self.assertEqual(vals['period_begin_cost'], 120)
+        self.assertEqual(vals['current_period_remaining_qty'], 8)
+        self.assertEqual(vals['current_period_remaining_cost'], 110)
+        self.assertEqual(month_product_cost.get_real_out_cost(
+            self.period_id, [goods.id]), {})
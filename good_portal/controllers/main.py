@@ -3,8 +3,6 @@ from odoo import http
 from odoo.http import request
 from odoo import tools
 
-from odoo.fields import Date
-
 
 class website_account(http.Controller):
 
@@ -34,21 +32,15 @@ class website_account(http.Controller):
             domain = []
         if fields is None:
             fields = ['name', 'create_date']
-        groups = []
-        for group in request.env[model]._read_group_raw(domain, fields=fields, groupby=groupby, orderby=order):
-            dates, label = group[groupby]
-            date_begin, date_end = dates.split('/')
-            groups.append({
-                'date_begin': Date.to_string(Date.from_string(date_begin)),
-                'date_end': Date.to_string(Date.from_string(date_end)),
-                'name': label,
-                'item_count': group[groupby + '_count']
-            })
-        return groups
+        return request.env['portal.summary'].get_archive_groups(
+            request.env.user.gooderp_partner_id, model, domain, fields, groupby, order)
 
     @http.route(['/my', '/my/home'], type='http', auth="user", website=True)
     def account(self, **kw):
         values = self._prepare_portal_layout_values()
+        # 各门户模块的单据计数一次查出
+        values.update(request.env['portal.summary'].get_counts(
+            request.env.user.gooderp_partner_id))
 
         return request.render("good_portal.portal_my_home", values)
 
@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 import partner
 import res_users
+import portal_summary
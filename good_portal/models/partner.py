@@ -9,6 +9,8 @@ class Partner(models.Model):
     user_ids = fields.One2many('res.users',
                                'gooderp_partner_id',
                                u'登录用户')
+    portal_version = fields.Integer(u'门户数据版本', readonly=True, copy=False,
+                                    help=u'门户上显示的单据变更时加一，门户计数和归档分组的缓存按此版本失效')
 
     @api.multi
     def partner_create_user(self):
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models, tools
+from odoo.fields import Date
+
+
+class PortalSummary(models.AbstractModel):
+    '''
+    门户首页的单据计数和列表页的归档分组。
+    各门户模块继承 _get_count_domains 加入自己的计数条件，所有计数一次查询得到；
+    计数按当前用户的记录规则和 active 过滤，与门户列表页能打开的单据一致。
+    结果按 (用户, 业务伙伴, 业务伙伴的门户数据版本) 缓存，版本随单据的修改在同一事务中加一，
+    提交后其他进程才会读到新版本，不会缓存未提交的数据
+    '''
+    _name = 'portal.summary'
+    _description = u'门户汇总'
+
+    @api.model
+    def _get_version(self, partner):
+        ''' 直接读库，不受其他事务缓存的影响 '''
+        self.env.cr.execute('SELECT portal_version FROM partner WHERE id = %s', (partner.id,))
+        row = self.env.cr.fetchone()
+        return row and row[0] or 0
+
+    @api.model
+    def bump_version(self, partner_ids):
+        ''' 业务伙伴的门户单据变更，旧版本的缓存不再命中（由 ormcache 按 LRU 淘汰） '''
+        if not partner_ids:
+            return
+        self.env.cr.execute('''
+            UPDATE partner SET portal_version = COALESCE(portal_version, 0) + 1
+             WHERE id IN %s
+        ''', (tuple(partner_ids),))
+        self.env['partner'].invalidate_cache(['portal_version'], list(partner_ids))
+
+    @api.model
+    def _get_count_domains(self, partner):
+        '''
+        门户首页的计数条件，由各门户模块继承添加
+        :return: [(计数名, 模型, domain)]
+        '''
+        return []
+
+    @api.model
+    def get_counts(self, partner):
+        '''
+        业务伙伴的所有单据计数
+        :return: {计数名: 数量}
+        '''
+        if not partner:
+            return {}
+        return dict(self._get_counts_cached(partner.id, self._get_version(partner)))
+
+    @tools.ormcache('self.env.uid', 'partner_id', 'version')
+    def _get_counts_cached(self, partner_id, version):
+        ''' 把各计数条件（含记录规则）转换为 SQL，用一个 UNION ALL 查询得到 '''
+        queries, params = [], []
+        partner = self.env['partner'].browse(partner_id)
+        for name, model, domain in self._get_count_domains(partner):
+            Model = self.env[model]
+            query = Model._where_calc(domain)
+            Model._apply_ir_rules(query, 'read')
+            from_clause, where_clause, where_params = query.get_sql()
+            queries.append('(SELECT %%s, COUNT(*) FROM %s WHERE %s)' % (
+                from_clause, where_clause or 'TRUE'))
+            params += [name] + where_params
+        if not queries:
+            return ()
+        self.env.cr.execute(' UNION ALL '.join(queries), params)
+        return tuple(self.env.cr.fetchall())
+
+    @api.model
+    def get_archive_groups(self, partner, model, domain, fields, groupby, order):
+        '''
+        列表页按创建日期的归档分组。
+        domain 须限定为该业务伙伴的单据，单据变更时缓存才会随版本失效
+        '''
+        return [dict(group) for group in self._get_archive_groups_cached(
+            partner.id, self._get_version(partner), model, repr(domain), domain,
+            tuple(fields), groupby, order)]
+
+    @tools.ormcache('self.env.uid', 'partner_id', 'version', 'model', 'domain_key',
+                    'fields', 'groupby', 'order')
+    def _get_archive_groups_cached(self, partner_id, version, model, domain_key, domain,
+                                   fields, groupby, order):
+        groups = []
+        for group in self.env[model]._read_group_raw(
+                domain, fields=list(fields), groupby=groupby, orderby=order):
+            dates, label = group[groupby]
+            date_begin, date_end = dates.split('/')
+            groups.append({
+                'date_begin': Date.to_string(Date.from_string(date_begin)),
+                'date_end': Date.to_string(Date.from_string(date_end)),
+                'name': label,
+                'item_count': group[groupby + '_count']
+            })
+        return groups
+
+
+class PortalSummaryMixin(models.AbstractModel):
+    '''
+    门户上显示的单据继承此类，新建、修改、删除时相关业务伙伴的门户数据版本加一。
+    _portal_partner_field 为单据上指向业务伙伴的字段
+    '''
+    _name = 'portal.summary.mixin'
+    _description = u'门户数据版本'
+    _portal_partner_field = 'partner_id'
+
+    @api.multi
+    def _bump_portal_version(self):
+        self.env['portal.summary'].bump_version(
+            self.sudo().mapped(self._portal_partner_field).ids)
+
+    @api.model
+    def create(self, vals):
+        record = super(PortalSummaryMixin, self).create(vals)
+        record._bump_portal_version()
+        return record
+
+    @api.multi
+    def write(self, vals):
+        # 修改业务伙伴时，原业务伙伴和新业务伙伴都要失效
+        if self._portal_partner_field.split('.')[0] in vals:
+            self._bump_portal_version()
+        res = super(PortalSummaryMixin, self).write(vals)
+        self._bump_portal_version()
+        return res
+
+    @api.multi
+    def unlink(self):
+        self._bump_portal_version()
+        return super(PortalSummaryMixin, self).unlink()
@@ -9,22 +9,6 @@ from odoo.addons.good_portal.controllers.main import website_account
 
 class WebsiteAccount(website_account):
 
-    @http.route()
-    def account(self, **kw):
-        """ 在 我的账户 主页添加 采购订单+数量 """
-        response = super(WebsiteAccount, self).account(**kw)
-        partner = request.env.user.gooderp_partner_id
-
-        BuyOrder = request.env['buy.order']
-        buy_order_count = BuyOrder.search_count([
-            ('partner_id', '=', partner.id)
-        ])
-
-        response.qcontext.update({
-            'buy_order_count': buy_order_count,
-        })
-        return response
-
     #
     # Buy Orders
     #
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class PortalSummary(models.AbstractModel):
+    _inherit = 'portal.summary'
+
+    @api.model
+    def _get_count_domains(self, partner):
+        ''' 购货订单数 '''
+        return super(PortalSummary, self)._get_count_domains(partner) + [
+            ('buy_order_count', 'buy.order', [('partner_id', '=', partner.id)]),
+        ]
+
+
+class BuyOrder(models.Model):
+    _name = 'buy.order'
+    _inherit = ['buy.order', 'portal.summary.mixin']
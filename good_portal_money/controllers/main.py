@@ -10,32 +10,6 @@ from odoo.addons.good_portal.controllers.main import website_account
 
 class WebsiteAccount(website_account):
 
-    @http.route()
-    def account(self, **kw):
-        """ Add sales documents to main account page """
-        response = super(WebsiteAccount, self).account(**kw)
-        money_order_obj = request.env['money.order']
-        partner = request.env.user.gooderp_partner_id
-
-        # 付款单
-        pay_count = money_order_obj.search_count([
-            ('partner_id', '=', partner.id),
-            ('type', '=', 'get')
-        ])
-        response.qcontext.update({
-            'pay_count': pay_count,
-        })
-
-        # 收款单
-        get_count = money_order_obj.search_count([
-            ('partner_id', '=', partner.id),
-            ('type', '=', 'pay')
-        ])
-        response.qcontext.update({
-            'get_count': get_count,
-        })
-        return response
-
     #
     # Pay Orders
     #
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class PortalSummary(models.AbstractModel):
+    _inherit = 'portal.summary'
+
+    @api.model
+    def _get_count_domains(self, partner):
+        ''' 付款单数（门户上对应收款单 get）和收款单数（对应付款单 pay） '''
+        return super(PortalSummary, self)._get_count_domains(partner) + [
+            ('pay_count', 'money.order',
+             [('partner_id', '=', partner.id), ('type', '=', 'get')]),
+            ('get_count', 'money.order',
+             [('partner_id', '=', partner.id), ('type', '=', 'pay')]),
+        ]
+
+
+class MoneyOrder(models.Model):
+    _name = 'money.order'
+    _inherit = ['money.order', 'portal.summary.mixin']
@@ -10,22 +10,6 @@ from odoo.addons.good_portal.controllers.main import website_account
 
 class WebsiteAccount(website_account):
 
-    @http.route()
-    def account(self, **kw):
-        """ Add sales documents to main account page """
-        response = super(WebsiteAccount, self).account(**kw)
-        partner = request.env.user.gooderp_partner_id
-
-        # 销售单
-        sell_order_obj = request.env['sell.order']
-        order_count = sell_order_obj.search_count([
-            ('partner_id', '=', partner.id)
-        ])
-        response.qcontext.update({
-            'order_count': order_count,
-        })
-        return response
-
     #
     # Sell Orders
     #
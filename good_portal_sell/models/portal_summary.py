@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class PortalSummary(models.AbstractModel):
+    _inherit = 'portal.summary'
+
+    @api.model
+    def _get_count_domains(self, partner):
+        ''' 销货订单数 '''
+        return super(PortalSummary, self)._get_count_domains(partner) + [
+            ('order_count', 'sell.order', [('partner_id', '=', partner.id)]),
+        ]
+
+
+class SellOrder(models.Model):
+    _name = 'sell.order'
+    _inherit = ['sell.order', 'portal.summary.mixin']
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+
+
+class TestPortalSummary(TransactionCase):
+
+    def setUp(self):
+        super(TestPortalSummary, self).setUp()
+        self.summary = self.env['portal.summary']
+        self.partner = self.env.ref('core.jd')
+        self.order = self.env.ref('sell.sell_order_1')
+
+    def test_get_counts(self):
+        '''门户首页的销货订单数与列表页能看到的订单数一致'''
+        counts = self.summary.get_counts(self.partner)
+        self.assertEqual(counts['order_count'], self.env['sell.order'].search_count(
+            [('partner_id', '=', self.partner.id)]))
+        self.assertEqual(self.summary.get_counts(self.env['partner']), {})
+
+    def test_get_counts_after_create(self):
+        '''计数按业务伙伴的门户数据版本缓存，新建、删除订单后计数立即变化'''
+        count = self.summary.get_counts(self.partner)['order_count']
+        version = self.summary._get_version(self.partner)
+        self.assertEqual(self.summary.get_counts(self.partner)['order_count'], count)
+        self.assertEqual(self.summary._get_version(self.partner), version)
+        order = self.order.copy()
+        self.assertTrue(self.summary._get_version(self.partner) > version)
+        self.assertEqual(self.summary.get_counts(self.partner)['order_count'], count + 1)
+        order.unlink()
+        self.assertEqual(self.summary.get_counts(self.partner)['order_count'], count)
+
+    def test_get_archive_groups(self):
+        '''列表页归档分组的数量合计等于订单数'''
+        domain = [('partner_id', '=', self.partner.id)]
+        groups = self.summary.get_archive_groups(
+            self.partner, 'sell.order', domain, ['name', 'create_date'],
+            'create_date', 'create_date desc')
+        self.assertEqual(sum(group['item_count'] for group in groups),
+                         self.env['sell.order'].search_count(domain))
@@ -8,24 +8,6 @@ from odoo.addons.good_portal.controllers.main import website_account
 
 class WebsiteAccount(website_account):
 
-    @http.route()
-    def account(self, **kw):
-        """ Add task documents to main account page """
-        response = super(WebsiteAccount, self).account(**kw)
-        Project = request.env['project']
-        Tasks = request.env['task']
-
-        task_count = 0
-        for project in Project.search([('customer_id', '=', request.env.user.gooderp_partner_id.id)]):
-            task_count += Tasks.search_count([
-                ('project_id', '=', project.id)
-            ])
-
-        response.qcontext.update({
-            'task_count': task_count,
-        })
-        return response
-
     #
     # Tasks
     #
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class PortalSummary(models.AbstractModel):
+    _inherit = 'portal.summary'
+
+    @api.model
+    def _get_count_domains(self, partner):
+        ''' 客户项目下的任务数 '''
+        return super(PortalSummary, self)._get_count_domains(partner) + [
+            ('task_count', 'task', [('project_id.customer_id', '=', partner.id)]),
+        ]
+
+
+class Project(models.Model):
+    _name = 'project'
+    _inherit = ['project', 'portal.summary.mixin']
+    _portal_partner_field = 'customer_id'
+
+
+class Task(models.Model):
+    _name = 'task'
+    _inherit = ['task', 'portal.summary.mixin']
+    _portal_partner_field = 'project_id.customer_id'
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.exceptions import ValidationError
 
 
@@ -11,29 +11,64 @@ class MailThread(models.AbstractModel):
     '''
     _inherit = 'mail.thread'
 
-    @api.one
-    @api.depends('_to_approver_ids', '_approver_num')
-    def _get_approve_state(self):
-        """计算审批状态"""
-        to_approver = len(self._to_approver_ids)
-        if not to_approver:
-            self._approve_state = u'已审批'
-        elif to_approver == self._approver_num:
-            self._approve_state = u'已提交'
-        else:
-            self._approve_state = u'审批中'
-
     _to_approver_ids = fields.One2many('good_process.approver',  'res_id', readonly='1',
                                        domain=lambda self: [('model', '=', self._name)], auto_join=True, string='待审批人')
     _approver_num = fields.Integer(string='总审批人数')
-    _approve_state = fields.Char(u'审批状态',
-                                 compute='_get_approve_state')
+    _approve_state = fields.Char(u'审批状态', readonly=True, copy=False,
+                                 default=u'已审批')
 
-    def __get_groups__(self, process_rows):
+    @api.model_cr_context
+    def _auto_init(self):
+        """
+        新建 _approve_state 列时已有单据会被填上默认值“已审批”，
+        建列后立即按待审批人重算，避免审批中的单据显示为已审批
+        """
+        new_column = False
+        if self._auto and not self._abstract:
+            self._cr.execute("""
+                SELECT 1 FROM information_schema.columns
+                 WHERE table_name = %s AND column_name = '_approve_state'
+            """, (self._table,))
+            new_column = not self._cr.fetchone()
+        res = super(MailThread, self)._auto_init()
+        if new_column:
+            # 待审批人表还不存在时（安装本模块的过程中）不会有待审批的单据，默认值即正确
+            self._cr.execute("SELECT 1 FROM pg_class WHERE relname = 'good_process_approver'")
+            if self._cr.fetchone():
+                self.browse()._get_approve_state()
+        return res
+
+    @api.multi
+    def _get_approve_state(self):
+        """
+        按待审批人数和总审批人数更新存储的审批状态，self 为空时更新本模型全部单据
+        直接用 SQL 更新，不经过 write 中的审批校验
+        """
+        if self._abstract or not self._auto:
+            return
+        where_clause = ''
+        params = [self._name, u'已审批', u'已提交', u'审批中']
+        if self:
+            where_clause = 'WHERE t.id IN %s'
+            params.append(tuple(self.ids))
+        self._cr.execute('''
+            UPDATE "%s" t SET _approve_state =
+                CASE (SELECT COUNT(*) FROM good_process_approver a
+                       WHERE a.model = %%s AND a.res_id = t.id)
+                    WHEN 0 THEN %%s
+                    WHEN t._approver_num THEN %%s
+                    ELSE %%s
+                END
+            %s
+        ''' % (self._table, where_clause), params)
+        self.invalidate_cache(['_approve_state'], self.ids or None)
+
+    def __get_groups__(self, process):
+        ''' 审批规则中的审批组及顺序 [(审批组, 顺序)] '''
         groups = []
-        if process_rows:
-            [groups.append((line.group_id, line.sequence)) for line in self.env['good_process.process_line'].search(
-                [('process_id', '=', process_rows.id)], order='sequence')]
+        if process:
+            groups = [(self.env['res.groups'].browse(group_id), sequence)
+                      for group_id, sequence, is_all_approve in process['lines']]
         return groups
 
     def __get_users__(self, groups):
@@ -43,39 +78,49 @@ class MailThread(models.AbstractModel):
              for user in group.users]
         return users
 
-    def __get_user_manager__(self, thread_row, process_rows):
+    def __get_user_manager__(self, thread_row, process):
         '''
         如此流程需要记录创建者的部门经理审批，取得部门经理用户
         '''
         return_vals = False
-        if process_rows.is_department_approve:
+        if process['is_department_approve']:
             staff_row = self.env['staff'].search(
                 [('user_id', '=', thread_row.create_uid.id)])
             if staff_row and getattr(staff_row, 'parent_id', False):
                 return_vals = staff_row.parent_id.user_id
         return return_vals
 
-    def __add_approver__(self, thread_row, model_name):
+    def __add_approver__(self, thread_rows, model_name):
+        '''
+        按审批规则给单据生成待审批人，thread_rows 可以是多张单据，所有待审批人一次写入；
+        单据没有配置审批规则时不查询数据库
+        '''
         # TODO 加上当前用户的部门经理
-        approver_rows = []
-        users = []
-        process_rows = self.env['good_process.process'].search(
-            [('model_id.model', '=', model_name), ('type', '=', getattr(thread_row, 'type', False))])
-        groups = self.__get_groups__(process_rows)
-        department_manager = self.__get_user_manager__(
-            thread_row, process_rows)
-        if department_manager:
-            users.append((department_manager, 0, False))
-        users.extend(self.__get_users__(groups))
-        [approver_rows.append(self.env['good_process.approver'].create(
-            {'user_id': user.id,
-             'res_id': thread_row.id,
-             'model_type': thread_row._description,
-             'record_name': getattr(thread_row, 'name', ''),
-             'creator': thread_row.create_uid.id,
-             'sequence': sequence,
-             'group_id': groud_id,
-             'model': thread_row._name})) for user, sequence, groud_id in users]
+        Process = self.env['good_process.process']
+        vals_list = []
+        for thread_row in thread_rows:
+            process = Process.get_process(
+                model_name, getattr(thread_row, 'type', False))
+            if not process:
+                continue
+            users = []
+            groups = self.__get_groups__(process)
+            department_manager = self.__get_user_manager__(
+                thread_row, process)
+            if department_manager:
+                users.append((department_manager, 0, False))
+            users.extend(self.__get_users__(groups))
+            vals_list.extend([
+                {'user_id': user.id,
+                 'res_id': thread_row.id,
+                 'model_type': thread_row._description,
+                 'record_name': getattr(thread_row, 'name', '') or False,
+                 'creator': thread_row.create_uid.id,
+                 'sequence': sequence,
+                 'group_id': groud_id,
+                 'model': thread_row._name,
+                 } for user, sequence, groud_id in users])
+        approver_rows = self.env['good_process.approver']._bulk_insert(vals_list)
         return [{'id': row.id, 'display_name': row.user_id.name} for row in approver_rows]
 
     def __good_approver_send_message__(self, active_id, active_model, message):
@@ -114,6 +159,7 @@ class MailThread(models.AbstractModel):
             return_vals.extend(self.__remove_approver__(
                 active_id, active_model, users, can_clean_groups))
             if return_vals:
+                model_row._get_approve_state()
                 message = self.__good_approver_send_message__(
                     active_id, active_model, u'同意')
             else:
@@ -137,6 +183,7 @@ class MailThread(models.AbstractModel):
             message = self.__good_approver_send_message__(
                 active_id, active_model, u'拒绝')
             return_vals = self.__add_approver__(mode_row, active_model)
+            mode_row._get_approve_state()
 
         else:
             return_vals = u'已经通过不能拒绝！'
@@ -146,7 +193,9 @@ class MailThread(models.AbstractModel):
     def create(self, vals):
         thread_row = super(MailThread, self).create(vals)
         approvers = self.__add_approver__(thread_row, self._name)
-        thread_row._approver_num = len(approvers)
+        if approvers:
+            thread_row._approver_num = len(approvers)
+            thread_row._get_approve_state()
         return thread_row
 
     @api.multi
@@ -186,6 +235,8 @@ class MailThread(models.AbstractModel):
                 raise ValidationError(u"审批中不可修改")
 
         thread_row = super(MailThread, self).write(vals)
+        if vals.get('state') == 'draft' and '_approver_num' in vals:
+            self._get_approve_state()
         return thread_row
 
     @api.multi
@@ -201,23 +252,22 @@ class MailThread(models.AbstractModel):
 
     def __get_user_group__(self, active_id,  active_model, users, mode_row):
         all_groups = []
-        process_rows = self.env['good_process.process'].search([('model_id.model', '=', active_model),
-                                                                ('type', '=', getattr(mode_row, 'type', False))])
-        line_rows = self.env['good_process.process_line'].search(
-            [('process_id', '=', process_rows.id)], order='sequence')
+        process = self.env['good_process.process'].get_process(
+            active_model, getattr(mode_row, 'type', False))
         least_num = 'default_vals'
-        for line in line_rows:
+        for group_id, sequence, is_all_approve in process and process['lines'] or []:
+            group = self.env['res.groups'].browse(group_id)
             approver_s = self.env['good_process.approver'].search([('model', '=', active_model),
                                                                    ('group_id', '=',
-                                                                    line.group_id.id),
+                                                                    group_id),
                                                                    ('res_id', '=', active_id)])
 
             if least_num == 'default_vals' and approver_s:
-                least_num = line.sequence
-            if least_num == line.sequence and self.env.uid in [user.id for user in line.group_id.users]:
+                least_num = sequence
+            if least_num == sequence and self.env.uid in [user.id for user in group.users]:
                 users = [self.env.uid]
-            if not line.is_all_approve:
-                all_groups.append(line.group_id)
+            if not is_all_approve:
+                all_groups.append(group)
         can_clean_groups = []
         for group in all_groups:
             all_group_user = [user.id for user in group.users]
@@ -300,6 +350,16 @@ class Approver(models.Model):
             'res_id': self.res_id,
         }
 
+    @api.model
+    def refresh_approve_state(self):
+        '''
+        重新计算所有单据的审批状态，用于修复数据
+        '''
+        for model_name in self.env.registry:
+            model = self.env[model_name]
+            if '_approve_state' in model._fields and not model._abstract and model._auto:
+                model.browse()._get_approve_state()
+
     @api.model_cr
     def init(self):
         self._cr.execute(
@@ -342,8 +402,44 @@ class Process(models.Model):
         model = self.env[process_id.model_id.model]
         if hasattr(model, 'type') and not process_id.type:
             raise ValidationError(u'请输入类型')
+        self.clear_caches()
         return process_id
 
+    @api.multi
+    def write(self, vals):
+        res = super(Process, self).write(vals)
+        self.clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(Process, self).unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def _get_process_map(self):
+        """
+        启用的审批规则表 {(模型, 类型): 规则}，审批规则或规则行变更时清空
+        """
+        process_map = {}
+        for process in self.sudo().search([]):
+            process_map[(process.model_id.model, process.type or False)] = {
+                'id': process.id,
+                'is_department_approve': process.is_department_approve,
+                'lines': tuple((line.group_id.id, line.sequence, line.is_all_approve)
+                               for line in process.line_ids.sorted(lambda line: line.sequence)),
+            }
+        return process_map
+
+    @api.model
+    def get_process(self, model_name, type):
+        """
+        取得单据适用的审批规则，没有配置时返回 None
+        """
+        return self._get_process_map().get((model_name, type or False))
+
 
 class ProcessLine(models.Model):
     '''
@@ -357,3 +453,21 @@ class ProcessLine(models.Model):
     group_id = fields.Many2one('res.groups', string=u'审批组', required=True)
     is_all_approve = fields.Boolean(string=u'是否需要本组用户全部审批')
     process_id = fields.Many2one('good_process.process', u'审批规则')
+
+    @api.model
+    def create(self, vals):
+        line = super(ProcessLine, self).create(vals)
+        self.env['good_process.process'].clear_caches()
+        return line
+
+    @api.multi
+    def write(self, vals):
+        res = super(ProcessLine, self).write(vals)
+        self.env['good_process.process'].clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(ProcessLine, self).unlink()
+        self.env['good_process.process'].clear_caches()
+        return res
@@ -211,23 +211,19 @@ class WebsiteSale(http.Controller):
 
         parent_category_ids = []
         if category:
-            parent_category_ids = [category.id]
-            current_category = category
-            while current_category.parent_id:
-                parent_category_ids.append(current_category.parent_id.id)
-                current_category = current_category.parent_id
+            parent_category_ids = category.get_parent_category_ids()
 
-        product_count = Product.search_count(domain)
+        listing_key = (category and category.id, search,
+                       tuple(tuple(v) for v in attrib_values))
+        product_count, goods_ids, attribute_ids, facet_counts = \
+            Product._get_shop_listing(listing_key, domain, page, ppg)
         pager = request.website.pager(
             url=url, total=product_count, page=page, step=ppg, scope=7, url_args=post)
-        products = Product.search(domain, limit=ppg, offset=pager['offset'])
+        products = Product.browse(goods_ids)
 
         ProductAttribute = request.env['attribute']
         if products:
-            # get all products without limit
-            selected_products = Product.search(domain, limit=False)
-            attributes = ProductAttribute.search(
-                [('goods_id', 'in', selected_products.ids)])
+            attributes = ProductAttribute.browse(attribute_ids)
         else:
             attributes = ProductAttribute.browse(attributes_ids)
 
@@ -246,6 +242,7 @@ class WebsiteSale(http.Controller):
             'bins': TableCompute().process(products, ppg),
             'rows': PPR,
             'attributes': attributes,
+            'facet_counts': facet_counts,
             'keep': keep,
             'parent_category_ids': parent_category_ids,
             'currency': currency,
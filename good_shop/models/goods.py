@@ -1,7 +1,64 @@
 # -*- coding: utf-8 -*-
-from odoo import api, fields, models
+from odoo import api, fields, models, tools
 from odoo.exceptions import UserError
 
+# 商城列表缓存的版本号，商品、属性、分类变更时加一
+SHOP_VERSION_KEY = 'good_shop.listing_version'
+
+
+class ShopListingVersion(models.AbstractModel):
+    '''
+    商城列表缓存的版本号，存在 ir_config_parameter 中，随修改数据的事务一起提交。
+    直接用 SQL 读写，不经过 set_param（它会清空整个注册表的缓存）
+    '''
+    _name = 'shop.listing.version'
+    _description = u'商城列表缓存版本'
+
+    @api.model
+    def get(self):
+        self.env.cr.execute('SELECT value FROM ir_config_parameter WHERE key = %s',
+                            (SHOP_VERSION_KEY,))
+        row = self.env.cr.fetchone()
+        return row and row[0] or '0'
+
+    @api.model
+    def bump(self):
+        ''' 版本加一，旧版本的缓存不再命中（由 ormcache 按 LRU 淘汰） '''
+        self.env.cr.execute('''
+            UPDATE ir_config_parameter SET value = (value::bigint + 1)::text
+             WHERE key = %s
+        ''', (SHOP_VERSION_KEY,))
+        if not self.env.cr.rowcount:
+            self.env.cr.execute('''
+                INSERT INTO ir_config_parameter (key, value, create_uid, create_date,
+                                                 write_uid, write_date)
+                VALUES (%s, '1', %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+            ''', (SHOP_VERSION_KEY, self.env.uid, self.env.uid))
+
+
+class ShopListingMixin(models.AbstractModel):
+    ''' 新建、修改、删除后商城列表缓存版本加一 '''
+    _name = 'shop.listing.mixin'
+    _description = u'影响商城列表的数据'
+
+    @api.model
+    def create(self, vals):
+        res = super(ShopListingMixin, self).create(vals)
+        self.env['shop.listing.version'].bump()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(ShopListingMixin, self).write(vals)
+        self.env['shop.listing.version'].bump()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(ShopListingMixin, self).unlink()
+        self.env['shop.listing.version'].bump()
+        return res
+
 
 class ProductStyle(models.Model):
     _name = "product.style"
@@ -12,8 +69,30 @@ class ProductStyle(models.Model):
     html_class = fields.Char(string='HTML Classes')
 
 
+class GoodsClass(models.Model):
+    _name = 'goods.class'
+    _inherit = ['goods.class', 'shop.listing.mixin']
+
+    parent_path = fields.Char(u'分类路径', compute='_compute_parent_path',
+                              store=True, index=True,
+                              help=u'形如 /1/5/8/ 的上级分类路径，商城页面据此一次取得全部上级分类')
+
+    @api.one
+    @api.depends('parent_id', 'parent_id.parent_path')
+    def _compute_parent_path(self):
+        self.parent_path = '%s%s/' % (self.parent_id.parent_path or '/', self.id)
+
+    @api.multi
+    def get_parent_category_ids(self):
+        '''返回本分类及全部上级分类的 id，本分类在前'''
+        self.ensure_one()
+        return [int(category_id) for category_id in
+                reversed((self.parent_path or '').strip('/').split('/'))
+                if category_id] or [self.id]
+
+
 class Goods(models.Model):
-    _inherit = ['goods', 'website.published.mixin']
+    _inherit = ['goods', 'website.published.mixin', 'shop.listing.mixin']
     _name = 'goods'
 
     website_size_x = fields.Integer('Size X',
@@ -22,3 +101,61 @@ class Goods(models.Model):
                                     default=1)
     website_style_ids = fields.Many2many('product.style',
                                          string=u'样式')
+
+    @api.model
+    def _get_shop_facets(self, domain):
+        '''
+        用一条分组 SQL 取得符合条件商品的属性及每个属性值对应的商品数
+        :return: (属性 id 列表, {属性值 id: 商品数})
+        '''
+        query = self._where_calc(domain)
+        self._apply_ir_rules(query, 'read')
+        from_clause, where_clause, where_params = query.get_sql()
+        self.env.cr.execute('''
+            SELECT av.value_id,
+                   array_agg(DISTINCT a.id),
+                   COUNT(DISTINCT a.goods_id)
+              FROM attribute a
+              JOIN attribute_value av ON av.attribute_id = a.id
+             WHERE a.goods_id IN (SELECT goods.id FROM %s WHERE %s)
+          GROUP BY av.value_id
+        ''' % (from_clause, where_clause or 'TRUE'), where_params)
+        attribute_ids = set()
+        facet_counts = {}
+        for value_id, value_attribute_ids, goods_count in self.env.cr.fetchall():
+            attribute_ids.update(value_attribute_ids)
+            facet_counts[value_id] = goods_count
+        return sorted(attribute_ids), facet_counts
+
+    @api.model
+    def _get_shop_listing(self, key, domain, page, ppg):
+        '''
+        商城产品列表，按 (分类, 搜索词, 属性筛选) 的 key 和页码缓存，商品、属性或分类变更后版本改变
+        :param key: 可哈希的查询条件标识，与 domain 一一对应
+        :return: (产品总数, 当前页产品 id, 属性 id, {属性值 id: 商品数})
+        '''
+        return self._get_shop_listing_cached(
+            self.env['shop.listing.version'].get(), key, domain, page, ppg)
+
+    @tools.ormcache('self.env.uid', 'version', 'key', 'page', 'ppg')
+    def _get_shop_listing_cached(self, version, key, domain, page, ppg):
+        product_count = self.search_count(domain)
+        # 与 website.pager 相同的页码修正，保证取到的是 pager 显示的那一页
+        page_count = max(1, -(-product_count // ppg))
+        page = max(1, min(int(page or 1), page_count))
+        goods_ids = self.search(domain, limit=ppg, offset=(page - 1) * ppg).ids
+        attribute_ids, facet_counts = [], {}
+        if goods_ids:
+            attribute_ids, facet_counts = self._get_shop_facets(domain)
+        return (product_count, tuple(goods_ids),
+                tuple(attribute_ids), facet_counts)
+
+
+class Attribute(models.Model):
+    _name = 'attribute'
+    _inherit = ['attribute', 'shop.listing.mixin']
+
+
+class AttributeValue(models.Model):
+    _name = 'attribute.value'
+    _inherit = ['attribute.value', 'shop.listing.mixin']
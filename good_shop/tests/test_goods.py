@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+
+
+class TestGoods(TransactionCase):
+
+    def setUp(self):
+        super(TestGoods, self).setUp()
+        self.iphone = self.env.ref('goods.iphone')
+        self.keyboard = self.env.ref('goods.keyboard')
+        self.white = self.env.ref('goods.white')
+        self.black = self.env.ref('goods.black')
+
+    def test_get_shop_facets(self):
+        '''商城属性筛选：符合条件商品的属性及每个属性值的商品数'''
+        domain = [('id', 'in', [self.iphone.id, self.keyboard.id])]
+        attribute_ids, facet_counts = self.env['goods']._get_shop_facets(domain)
+        self.assertEqual(set(attribute_ids),
+                         set(self.iphone.attribute_ids.ids + self.keyboard.attribute_ids.ids))
+        self.assertEqual(facet_counts[self.white.id], 2)
+        self.assertEqual(facet_counts[self.black.id], 2)
+
+        # 没有属性的商品不产生筛选项
+        attribute_ids, facet_counts = self.env['goods']._get_shop_facets(
+            [('id', '=', self.env.ref('goods.mouse').id)])
+        self.assertEqual(attribute_ids, [])
+        self.assertEqual(facet_counts, {})
+
+    def test_get_shop_listing(self):
+        '''商城产品列表：分页结果缓存，商品变更后不再返回旧结果'''
+        Goods = self.env['goods']
+        domain = [('name', 'ilike', 'iPhone'), ('not_saleable', '=', False)]
+        key = (None, 'iPhone', ())
+        count, goods_ids, attribute_ids, facet_counts = Goods._get_shop_listing(
+            key, domain, 1, 20)
+        self.assertEqual(count, Goods.search_count(domain))
+        self.assertTrue(self.iphone.id in goods_ids)
+        self.assertEqual(set(attribute_ids), set(self.iphone.attribute_ids.ids))
+        self.assertEqual(facet_counts[self.white.id], 1)
+
+        # 版本不变时命中缓存，修改分类后版本改变
+        Version = self.env['shop.listing.version']
+        version = Version.get()
+        self.assertEqual(Version.get(), version)
+        self.env.ref('goods.partner_services').parent_id = self.env.ref('goods.fruits_vegetables')
+        self.assertNotEqual(Version.get(), version)
+        # 新建商品后版本改变，列表包含新商品
+        new_goods = self.iphone.copy({'name': 'iPhone X'})
+        count_new, goods_ids, _, _ = Goods._get_shop_listing(key, domain, 1, 20)
+        self.assertEqual(count_new, count + 1)
+        self.assertTrue(new_goods.id in goods_ids)
+        # 删除后列表不再包含
+        new_goods.unlink()
+        count_new, goods_ids, _, _ = Goods._get_shop_listing(key, domain, 1, 20)
+        self.assertEqual(count_new, count)
+        self.assertFalse(new_goods.id in goods_ids)
+
+        # 页码超出范围时取最后一页
+        _, goods_ids, _, _ = Goods._get_shop_listing(key, domain, 99, 20)
+        self.assertTrue(self.iphone.id in goods_ids)
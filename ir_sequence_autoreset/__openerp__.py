@@ -28,6 +28,9 @@ Auto reset sequence by year,month,day
 
 功能：自动重置序列编号
 
+标准实现的序列按 (序列, 重置期间) 各建一个 PostgreSQL 序列取号，并发取号不锁行；
+无间隔实现仍锁行，在同一事务内重置。并发基准见 benchmark/sequence_concurrency.py
+
 如果您觉得好用，请进入下面的网址，付费支持作者 ~
 
 http://me.alipay.com/wangbuke
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+'''
+自动重置序列并发取号基准测试
+
+多个线程各自开事务取号，对比：
+    standard  每期间一个 PostgreSQL 序列，nextval 取号
+    no_gap    锁 ir_sequence 行取号（旧实现的加锁方式）
+
+用法：
+    python sequence_concurrency.py -c /etc/odoo.conf -d gooderp --workers 8 --numbers 200
+
+测试结束后删除临时序列并提交，不影响业务数据。
+'''
+import argparse
+import threading
+import time
+
+import psycopg2
+
+import odoo
+
+
+def draw_numbers(registry, seq_id, count, hold, result):
+    ''' 一个工作线程：每个号码单独一个事务，hold 秒模拟业务单据的其余写入 '''
+    numbers = []
+    failures = 0
+    cr = registry.cursor()
+    try:
+        env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        seq = env['ir.sequence'].browse(seq_id)
+        for _i in range(count):
+            try:
+                numbers.append(seq.next_by_id())
+                if hold:
+                    time.sleep(hold)
+                cr.commit()
+            except psycopg2.OperationalError:
+                # no_gap 取号时 FOR UPDATE NOWAIT 拿不到行锁
+                cr.rollback()
+                failures += 1
+    finally:
+        cr.close()
+    result.append((numbers, failures))
+
+
+def run(registry, implementation, workers, count, hold):
+    with registry.cursor() as cr:
+        env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        seq_id = env['ir.sequence'].create({
+            'name': 'benchmark %s' % implementation,
+            'implementation': implementation,
+            'prefix': 'BM%(year)s%(month)s',
+            'padding': 6,
+            'auto_reset': True,
+            'reset_period': 'month',
+        }).id
+        cr.commit()
+
+    result = []
+    threads = [threading.Thread(target=draw_numbers,
+                                args=(registry, seq_id, count, hold, result))
+               for _i in range(workers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    numbers = [number for numbers, _failures in result for number in numbers]
+    failures = sum(failures for _numbers, failures in result)
+    print('%-9s workers=%-3d drawn=%-6d failed=%-5d duplicates=%-3d '
+          '%.2fs  %.1f numbers/s' % (
+              implementation, workers, len(numbers), failures,
+              len(numbers) - len(set(numbers)), elapsed,
+              len(numbers) / elapsed if elapsed else 0))
+
+    with registry.cursor() as cr:
+        env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        env['ir.sequence'].browse(seq_id).unlink()
+        cr.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=u'自动重置序列并发取号基准测试')
+    parser.add_argument('-c', '--config', help=u'odoo 配置文件')
+    parser.add_argument('-d', '--database', required=True, help=u'数据库名')
+    parser.add_argument('--workers', type=int, default=8, help=u'并发线程数')
+    parser.add_argument('--numbers', type=int, default=200, help=u'每个线程取号数')
+    parser.add_argument('--hold', type=float, default=0.01,
+                        help=u'取号后事务继续持有的秒数，模拟单据其余写入')
+    args = parser.parse_args()
+
+    odoo.tools.config.parse_config(args.config and ['-c', args.config] or [])
+    registry = odoo.registry(args.database)
+    for implementation in ('no_gap', 'standard'):
+        run(registry, implementation, args.workers, args.numbers, args.hold)
+
+
+if __name__ == '__main__':
+    main()
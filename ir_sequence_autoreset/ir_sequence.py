@@ -21,10 +21,36 @@
 ##############################################################################
 
 from odoo import models, fields, api, _
-from odoo.exceptions import UserError
+from odoo.exceptions import ValidationError
+from odoo.addons.base.ir.ir_sequence import _alter_sequence, _predict_nextval, _update_nogap
+import psycopg2
+from psycopg2 import errorcodes
 import pytz
 from datetime import datetime
 
+# 每种重置周期对应的期间标识，期间变化即重新编号
+RESET_PERIOD_FORMATS = {
+    'year': '%Y',
+    'month': '%Y%m',
+    'day': '%Y%m%d',
+    'h24': '%Y%m%d%H',
+    'min': '%Y%m%d%H%M',
+    'sec': '%Y%m%d%H%M%S',
+}
+
+# 旧版本 reset_time 只保存期间的一段，如 month 周期下的 10，升级时转换
+LEGACY_RESET_FORMATS = {
+    'year': '%Y',
+    'month': '%m',
+    'day': '%d',
+    'h24': '%H',
+    'min': '%M',
+    'sec': '%S',
+}
+
+# 标准实现按期间建 PostgreSQL 序列，只允许按天及以上重置，避免序列无限增多
+STANDARD_RESET_PERIODS = ('year', 'month', 'day')
+
 
 class IrSequence(models.Model):
     _inherit = 'ir.sequence'
@@ -39,37 +65,142 @@ class IrSequence(models.Model):
     reset_init_number = fields.Integer(
         'Reset Number', required=True, default=1, help="Reset number of this sequence")
 
-    def get_next_char(self, number_next):
-        def _interpolation_dict():
-            now = range_date = effective_date = datetime.now(
+    @api.model_cr
+    def init(self):
+        '''
+        升级旧版本：旧的 reset_time 只存期间的一段（如月份 10），改为完整期间标识；
+        标准序列当前期间已发过号的，按已有的下一编号建立当前期间的序列，避免重号
+        '''
+        for seq in self.search([('auto_reset', '=', True), ('reset_time', '!=', False)]):
+            period_key = seq._get_reset_period_key()
+            if seq.reset_time != seq._get_reset_period_key(LEGACY_RESET_FORMATS):
+                continue
+            number_next = seq.number_next
+            if seq.implementation == 'standard':
+                # 旧版本标准序列从 ir_sequence_NNN 取号
+                number_next = _predict_nextval(seq, '%03d' % seq.id)
+                if seq.reset_period in STANDARD_RESET_PERIODS:
+                    seq_name = seq._get_reset_sequence_name(period_key)
+                    if seq._reset_sequence_exists(seq_name):
+                        continue
+                    seq._create_reset_sequence(seq_name, number_next)
+            self.env.cr.execute(
+                'UPDATE ir_sequence SET reset_time = %s, number_next = %s WHERE id = %s',
+                (period_key, number_next, seq.id))
+        self.invalidate_cache(['reset_time', 'number_next'])
+
+    @api.constrains('auto_reset', 'reset_period', 'implementation')
+    def _check_reset_period(self):
+        for seq in self:
+            if seq.auto_reset and seq.implementation == 'standard' and \
+                    seq.reset_period not in STANDARD_RESET_PERIODS:
+                raise ValidationError(_(
+                    'Standard sequences can only be reset every year, month or day. '
+                    'Use the "No gap" implementation for shorter periods.'))
+
+    def _uses_reset_sequence(self):
+        ''' 是否按期间的 PostgreSQL 序列取号 '''
+        return self.auto_reset and self.implementation == 'standard' and \
+            self.reset_period in STANDARD_RESET_PERIODS
+
+    def _get_reset_period_key(self, formats=RESET_PERIOD_FORMATS):
+        ''' 当前编号所属的重置期间，如 month 周期下的 201710 '''
+        if self._context.get('ir_sequence_date'):
+            effective_date = datetime.strptime(
+                self._context.get('ir_sequence_date'), '%Y-%m-%d')
+        else:
+            effective_date = datetime.now(
                 pytz.timezone(self._context.get('tz') or 'UTC'))
-            if self._context.get('ir_sequence_date'):
-                effective_date = datetime.strptime(
-                    self._context.get('ir_sequence_date'), '%Y-%m-%d')
-            if self._context.get('ir_sequence_date_range'):
-                range_date = datetime.strptime(self._context.get(
-                    'ir_sequence_date_range'), '%Y-%m-%d')
-            sequences = {'year': '%Y', 'month': '%m', 'day': '%d', 'y': '%y', 'doy': '%j', 'woy': '%W',
-                         'weekday': '%w', 'h24': '%H', 'h12': '%I', 'min': '%M', 'sec': '%S'}
-            res = {}
-            for key, format in sequences.iteritems():
-                res[key] = effective_date.strftime(format)
-                res['range_' + key] = range_date.strftime(format)
-                res['current_' + key] = now.strftime(format)
-            return res
-
-        d = _interpolation_dict()
-        current_time = d.get(self['reset_period'])
-        number_next_actual = False
-        if self['auto_reset'] and current_time != self['reset_time']:
+        return effective_date.strftime(formats[self.reset_period])
+
+    def _get_reset_sequence_name(self, period_key):
+        # 带 reset 标记，与日期分段序列 ir_sequence_NNN_MMM 区分
+        return 'ir_sequence_%03d_reset_%s' % (self.id, period_key)
+
+    def _reset_sequence_exists(self, seq_name):
+        self.env.cr.execute(
+            "SELECT 1 FROM pg_class WHERE relkind = 'S' AND relname = %s", (seq_name,))
+        return bool(self.env.cr.fetchone())
+
+    def _create_reset_sequence(self, seq_name, number_next=None):
+        '''
+        按需创建某个期间的 PostgreSQL 序列。
+        并发事务同时创建时，后创建的一方忽略重名错误，直接使用已有序列
+        '''
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute(
+                    'CREATE SEQUENCE IF NOT EXISTS %s INCREMENT BY %%s START WITH %%s' % seq_name,
+                    (self.number_increment, number_next or self.reset_init_number))
+        except (psycopg2.IntegrityError, psycopg2.ProgrammingError):
+            pass
+
+    def _next_reset_number(self):
+        '''
+        自动重置序列取号：每个 (序列, 期间) 对应一个 PostgreSQL 序列，
+        用 nextval 取号，不锁 ir_sequence 行，也不在业务事务中途提交。
+        期间序列不存在（新期间，或创建它的事务已回滚）时再创建
+        '''
+        seq_name = self._get_reset_sequence_name(self._get_reset_period_key())
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute('SELECT nextval(%s)', (seq_name,), log_exceptions=False)
+        except psycopg2.ProgrammingError as e:
+            if e.pgcode != errorcodes.UNDEFINED_TABLE:
+                raise
+            self._create_reset_sequence(seq_name)
+            self.env.cr.execute('SELECT nextval(%s)', (seq_name,))
+        return self.env.cr.fetchone()[0]
+
+    def _get_number_next_actual(self):
+        reset_seqs = self.filtered(lambda seq: seq.id and seq._uses_reset_sequence())
+        super(IrSequence, self - reset_seqs)._get_number_next_actual()
+        for seq in reset_seqs:
+            seq_name = seq._get_reset_sequence_name(seq._get_reset_period_key())
+            if seq._reset_sequence_exists(seq_name):
+                seq.number_next_actual = _predict_nextval(
+                    seq, seq_name[len('ir_sequence_'):])
+            else:
+                seq.number_next_actual = seq.reset_init_number
+
+    @api.multi
+    def write(self, values):
+        res = super(IrSequence, self).write(values)
+        if 'number_next' in values or 'number_increment' in values:
+            # 界面上修改下一编号或步长时，同步到当前期间的序列
+            for seq in self.filtered(lambda seq: seq._uses_reset_sequence()):
+                seq_name = seq._get_reset_sequence_name(seq._get_reset_period_key())
+                seq._create_reset_sequence(seq_name, values.get('number_next'))
+                _alter_sequence(self.env.cr, seq_name, seq.number_increment,
+                                values.get('number_next'))
+        return res
+
+    def _next_do(self):
+        if not self.auto_reset:
+            return super(IrSequence, self)._next_do()
+        if self._uses_reset_sequence():
+            return self.get_next_char(self._next_reset_number())
+        # 无间隔序列本身就要锁行，期间变化时在同一事务内重置起始编号
+        period_key = self._get_reset_period_key()
+        self.env.cr.execute(
+            'SELECT reset_time FROM ir_sequence WHERE id = %s FOR UPDATE NOWAIT',
+            (self.id,))
+        if self.env.cr.fetchone()[0] != period_key:
+            self.env.cr.execute(
+                'UPDATE ir_sequence SET reset_time = %s, number_next = %s WHERE id = %s',
+                (period_key, self.reset_init_number, self.id))
+            self.invalidate_cache(['reset_time', 'number_next'], [self.id])
+        if self.implementation == 'standard':
+            # 升级前已有的按小时以下重置的标准序列，按无间隔方式取号
+            return self.get_next_char(_update_nogap(self, self.number_increment))
+        return super(IrSequence, self)._next_do()
+
+    @api.multi
+    def unlink(self):
+        for seq in self:
             self.env.cr.execute(
-                "UPDATE ir_sequence SET reset_time=%s WHERE id=%s ", (current_time, self['id']))
-            self.env.cr.commit()
-            number_next = (self['reset_init_number'],)
-            number_next_actual = self['reset_init_number'] + \
-                self['number_increment']
-        return_vals = super(IrSequence, self).get_next_char(number_next)
-        if number_next_actual:
-            self.sudo().number_next_actual = number_next_actual
-            self.sudo().number_next = number_next_actual
-        return return_vals
+                "SELECT relname FROM pg_class WHERE relkind = 'S' AND relname LIKE %s",
+                ('ir\\_sequence\\_%03d\\_reset\\_%%' % seq.id,))
+            for (seq_name,) in self.env.cr.fetchall():
+                self.env.cr.execute('DROP SEQUENCE IF EXISTS %s' % seq_name)
+        return super(IrSequence, self).unlink()
@@ -31,6 +31,8 @@
         'views/other_money_order_view.xml',
         'views/money_transfer_order_view.xml',
         'views/reconcile_order_view.xml',
+        'data/reconcile_data.xml',
+        'data/overdue_data.xml',
         'data/money_sequence.xml',
         'wizard/partner_statements_wizard_view.xml',
         'report/bank_statements_view.xml',
@@ -39,6 +41,8 @@
         'wizard/other_money_statements_wizard_view.xml',
         'wizard/money_get_pay_wizard_view.xml',
         'report/money_get_pay_view.xml',
+        'report/receivable_aging_view.xml',
+        'wizard/receivable_aging_wizard_view.xml',
         'wizard/partner_statements_wizard_simple_view.xml',
         'wizard/cash_flow_wizard_view.xml',
         'report/customer_statements_view.xml',
@@ -5,3 +5,4 @@ import money_transfer_order
 import partner
 import generate_accounting
 import cash_flow_statement
+import reconcile_engine
@@ -23,7 +23,35 @@ from odoo.exceptions import UserError, ValidationError
 import odoo.addons.decimal_precision as dp
 from odoo import fields, models, api
 from odoo.tools import float_compare, float_is_zero
-from datetime import datetime
+from collections import defaultdict
+from odoo.addons.money.models.reconcile_engine import RECONCILE_STRATEGIES
+
+# 逾期账龄区间：(逾期天数上限, 区间)，最后一个区间不限上限
+OVERDUE_BUCKET_DAYS = [
+    (0, 'current'),
+    (30, '1_30'),
+    (60, '31_60'),
+    (90, '61_90'),
+    (None, 'over_90'),
+]
+OVERDUE_BUCKETS = [
+    ('current', u'未逾期'),
+    ('1_30', u'逾期1-30天'),
+    ('31_60', u'逾期31-60天'),
+    ('61_90', u'逾期61-90天'),
+    ('over_90', u'逾期90天以上'),
+]
+# 按逾期天数 days 取账龄区间
+OVERDUE_BUCKET_SQL = 'CASE %s END' % ' '.join(
+    day_to is None and "ELSE '%s'" % bucket or "WHEN days <= %s THEN '%s'" % (day_to, bucket)
+    for day_to, bucket in OVERDUE_BUCKET_DAYS)
+
+
+def get_overdue_bucket(days):
+    ''' 按逾期天数取账龄区间 '''
+    for day_to, bucket in OVERDUE_BUCKET_DAYS:
+        if day_to is None or days <= day_to:
+            return bucket
 
 
 class MoneyOrder(models.Model):
@@ -330,7 +358,6 @@ class MoneyOrder(models.Model):
             else:
                 voucher = order.create_money_order_pay_voucher(
                     order.line_ids, order.source_ids, order.partner_id, order.name, order.note or '')
-            voucher.voucher_done()
 
             return order.write({
                 'to_reconcile': order.advance_payment,
@@ -412,12 +439,6 @@ class MoneyOrder(models.Model):
             'rate_silent': rate_silent or ''
         }
 
-    def _create_voucher_line(self, line, name, account_id, debit, credit, voucher_id, partner_id, currency_id):
-        line_data = self._prepare_vouch_line_data(
-            line, name, account_id, debit, credit, voucher_id, partner_id, currency_id)
-        voucher_line = self.env['voucher.line'].create(line_data)
-        return voucher_line
-
     @api.multi
     def create_money_order_get_voucher(self, line_ids, source_ids, partner, name, note):
         """
@@ -426,10 +447,9 @@ class MoneyOrder(models.Model):
         :param source_ids: 没用到
         :param partner: 客户
         :param name: 收款单名称
-        :return: 创建的凭证
+        :return: 创建并审核的凭证
         """
-        vouch_obj = self.env['voucher'].create({'date': self.date})
-        # self.write({'voucher_id': vouch_obj.id})
+        voucher_lines = []
         amount_all = 0.0
         line_data = False
         for line in line_ids:
@@ -438,45 +458,45 @@ class MoneyOrder(models.Model):
                 raise UserError(u'请配置%s的会计科目' % (line.bank_id.name))
             # 生成借方明细行
             # param: line, name, account_id, debit, credit, voucher_id, partner_id
-            self._create_voucher_line(line,
-                                      u"%s %s" % (name, note),
-                                      line.bank_id.account_id.id,
-                                      line.amount,
-                                      0,
-                                      vouch_obj.id,
-                                      '',
-                                      line.currency_id.id
-                                      )
+            voucher_lines.append(self._prepare_vouch_line_data(line,
+                                                               u"%s %s" % (name, note),
+                                                               line.bank_id.account_id.id,
+                                                               line.amount,
+                                                               0,
+                                                               False,
+                                                               '',
+                                                               line.currency_id.id
+                                                               ))
 
             amount_all += line.amount
         if self.discount_amount != 0:
             # 生成借方明细行
             # param: False, name, account_id, debit, credit, voucher_id, partner_id
-            self._create_voucher_line(False,
-                                      u"%s 现金折扣 %s" % (name, note),
-                                      self.discount_account_id.id,
-                                      self.discount_amount,
-                                      0,
-                                      vouch_obj.id,
-                                      self.partner_id.id,
-                                      line_data and line_data.currency_id.id or self.currency_id.id
-                                      )
+            voucher_lines.append(self._prepare_vouch_line_data(False,
+                                                               u"%s 现金折扣 %s" % (name, note),
+                                                               self.discount_account_id.id,
+                                                               self.discount_amount,
+                                                               0,
+                                                               False,
+                                                               self.partner_id.id,
+                                                               line_data and line_data.currency_id.id or self.currency_id.id
+                                                               ))
 
         if partner.c_category_id:
             partner_account_id = partner.c_category_id.account_id.id
 
         # 生成贷方明细行
         # param: source, name, account_id, debit, credit, voucher_id, partner_id
-        self._create_voucher_line('',
-                                  u"%s %s" % (name, note),
-                                  partner_account_id,
-                                  0,
-                                  amount_all + self.discount_amount,
-                                  vouch_obj.id,
-                                  self.partner_id.id,
-                                  line_data and line.currency_id.id or self.currency_id.id
-                                  )
-        return vouch_obj
+        voucher_lines.append(self._prepare_vouch_line_data('',
+                                                           u"%s %s" % (name, note),
+                                                           partner_account_id,
+                                                           0,
+                                                           amount_all + self.discount_amount,
+                                                           False,
+                                                           self.partner_id.id,
+                                                           line_data and line.currency_id.id or self.currency_id.id
+                                                           ))
+        return self.env['voucher'].create_voucher({'date': self.date}, voucher_lines)
 
     @api.multi
     def create_money_order_pay_voucher(self, line_ids, source_ids, partner, name, note):
@@ -486,10 +506,9 @@ class MoneyOrder(models.Model):
         :param source_ids: 没用到
         :param partner: 供应商
         :param name: 付款单名称
-        :return: 创建的凭证
+        :return: 创建并审核的凭证
         """
-        vouch_obj = self.env['voucher'].create({'date': self.date})
-        # self.write({'voucher_id': vouch_obj.id})
+        voucher_lines = []
 
         amount_all = 0.0
         line_data = False
@@ -499,43 +518,43 @@ class MoneyOrder(models.Model):
                 raise UserError(u'请配置%s的会计科目' % (line.bank_id.name))
             # 生成贷方明细行 credit
             # param: line, name, account_id, debit, credit, voucher_id, partner_id
-            self._create_voucher_line(line,
-                                      u"%s %s" % (name, note),
-                                      line.bank_id.account_id.id,
-                                      0,
-                                      line.amount,
-                                      vouch_obj.id,
-                                      '',
-                                      line.currency_id.id
-                                      )
+            voucher_lines.append(self._prepare_vouch_line_data(line,
+                                                               u"%s %s" % (name, note),
+                                                               line.bank_id.account_id.id,
+                                                               0,
+                                                               line.amount,
+                                                               False,
+                                                               '',
+                                                               line.currency_id.id
+                                                               ))
             amount_all += line.amount
         partner_account_id = partner.s_category_id.account_id.id
 
         # 生成借方明细行 debit
         # param: source, name, account_id, debit, credit, voucher_id, partner_id
-        self._create_voucher_line('',
-                                  u"%s %s" % (name, note),
-                                  partner_account_id,
-                                  amount_all - self.discount_amount,
-                                  0,
-                                  vouch_obj.id,
-                                  self.partner_id.id,
-                                  line_data and line.currency_id.id or self.currency_id.id
-                                  )
+        voucher_lines.append(self._prepare_vouch_line_data('',
+                                                           u"%s %s" % (name, note),
+                                                           partner_account_id,
+                                                           amount_all - self.discount_amount,
+                                                           0,
+                                                           False,
+                                                           self.partner_id.id,
+                                                           line_data and line.currency_id.id or self.currency_id.id
+                                                           ))
 
         if self.discount_amount != 0:
             # 生成借方明细行 debit
             # param: False, name, account_id, debit, credit, voucher_id, partner_id
-            self._create_voucher_line(line_data and line_data or False,
-                                      u"%s 手续费 %s" % (name, note),
-                                      self.discount_account_id.id,
-                                      self.discount_amount,
-                                      0,
-                                      vouch_obj.id,
-                                      self.partner_id.id,
-                                      line_data and line.currency_id.id or self.currency_id.id
-                                      )
-        return vouch_obj
+            voucher_lines.append(self._prepare_vouch_line_data(line_data and line_data or False,
+                                                               u"%s 手续费 %s" % (name, note),
+                                                               self.discount_account_id.id,
+                                                               self.discount_amount,
+                                                               0,
+                                                               False,
+                                                               self.partner_id.id,
+                                                               line_data and line.currency_id.id or self.currency_id.id
+                                                               ))
+        return self.env['voucher'].create_voucher({'date': self.date}, voucher_lines)
 
 
 class MoneyOrderLine(models.Model):
@@ -605,21 +624,50 @@ class MoneyInvoice(models.Model):
                     (invoice.id, invoice.bill_number and invoice.bill_number or invoice.name))
         return res
 
-    @api.one
+    @api.multi
     @api.depends('date_due', 'to_reconcile')
     def compute_overdue(self):
         """
         计算逾期天数： 当前日期 - 到期日，< 0则显示为0；如果逾期金额为0则逾期天数也为0
         计算逾期金额： 逾期时等于未核销金额，否则为0
+        核销或修改到期日时重算，日期变化由 refresh_overdue 每天批量更新
         :return: 逾期天数
         """
-        d1 = datetime.strptime(fields.Date.context_today(self), '%Y-%m-%d')
-        d2 = self.date_due and datetime.strptime(
-            self.date_due, '%Y-%m-%d') or d1
-        day = (d1 - d2).days
-        self.overdue_days = day > 0 and day or 0.0
-        self.overdue_amount = self.overdue_days > 0 and self.to_reconcile or 0.0
-        self.overdue_days = self.overdue_amount and self.overdue_days or 0
+        today = fields.Date.from_string(fields.Date.context_today(self))
+        for invoice in self:
+            days = invoice.date_due and (
+                today - fields.Date.from_string(invoice.date_due)).days or 0
+            if days < 0 or float_is_zero(invoice.to_reconcile, 2):
+                days = 0
+            invoice.overdue_days = days
+            invoice.overdue_amount = days and invoice.to_reconcile or 0.0
+            invoice.overdue_bucket = get_overdue_bucket(days)
+
+    @api.model
+    def refresh_overdue(self):
+        '''
+        定时任务调用：按今天的日期用一条 UPDATE 重算所有结算单的逾期天数、逾期金额和账龄区间，
+        只更新有变化的行
+        '''
+        self.env.cr.execute('''
+            UPDATE money_invoice inv
+               SET overdue_days = v.days,
+                   overdue_amount = v.amount,
+                   overdue_bucket = v.bucket
+              FROM (SELECT id, days,
+                           CASE WHEN days > 0 THEN to_reconcile ELSE 0 END AS amount,
+                           %s AS bucket
+                      FROM (SELECT id, to_reconcile,
+                                   CASE WHEN date_due < %%(today)s AND COALESCE(to_reconcile, 0) != 0
+                                        THEN %%(today)s::date - date_due ELSE 0 END AS days
+                              FROM money_invoice) src
+                   ) v
+             WHERE inv.id = v.id
+               AND (inv.overdue_days, inv.overdue_amount, inv.overdue_bucket)
+                   IS DISTINCT FROM (v.days, v.amount, v.bucket)
+        ''' % OVERDUE_BUCKET_SQL, {'today': fields.Date.context_today(self)})
+        self.invalidate_cache(['overdue_days', 'overdue_amount', 'overdue_bucket'])
+        return True
 
     state = fields.Selection([
         ('draft', u'草稿'),
@@ -669,11 +717,15 @@ class MoneyInvoice(models.Model):
         change_default=True,
         default=lambda self: self.env['res.company']._company_default_get())
     overdue_days = fields.Float(u'逾期天数', readonly=True,
-                                compute='compute_overdue',
+                                compute='compute_overdue', store=True,
                                 help=u'当前日期 - 到期日')
     overdue_amount = fields.Float(u'逾期金额', readonly=True,
-                                  compute='compute_overdue',
+                                  compute='compute_overdue', store=True,
+                                  digits=dp.get_precision('Amount'),
                                   help=u'超过到期日后仍未核销的金额')
+    overdue_bucket = fields.Selection(OVERDUE_BUCKETS, u'账龄区间', readonly=True,
+                                      compute='compute_overdue', store=True, index=True,
+                                      help=u'按逾期天数划分的账龄区间')
     note = fields.Char(u'备注',
                        help=u'可填入到期日计算的依据')
 
@@ -811,7 +863,7 @@ class SourceOrderLine(models.Model):
     _description = u'待核销行'
 
     money_id = fields.Many2one('money.order', string=u'收付款单',
-                               ondelete='cascade',
+                               ondelete='cascade', index=True,
                                help=u'待核销行对应的收付款单')  # 收付款单上的待核销行
     receivable_reconcile_id = fields.Many2one('reconcile.order',
                                               string=u'核销单', ondelete='cascade',
@@ -821,7 +873,7 @@ class SourceOrderLine(models.Model):
                                            help=u'核销单上的应付结算单明细')  # 核销单上的应付结算单明细
     name = fields.Many2one('money.invoice', string=u'结算单',
                            copy=False, required=True,
-                           ondelete='cascade',
+                           ondelete='cascade', index=True,
                            help=u'待核销行对应的结算单')
     category_id = fields.Many2one('core.category', string=u'类别',
                                   required=True, ondelete='restrict',
@@ -848,6 +900,23 @@ class SourceOrderLine(models.Model):
         change_default=True,
         default=lambda self: self.env['res.company']._company_default_get())
 
+    @api.model
+    def get_reconciled_by_invoice(self, invoice_ids):
+        '''
+        已审核收付款单对各结算单的本次核销金额合计，一次分组查询得到
+        :return: {结算单id: 已收付款金额}
+        '''
+        if not invoice_ids:
+            return {}
+        self.env.cr.execute('''
+            SELECT line.name, SUM(line.this_reconcile)
+              FROM source_order_line line
+              JOIN money_order mo ON mo.id = line.money_id
+             WHERE mo.state = 'done' AND line.name IN %s
+          GROUP BY line.name
+        ''', (tuple(invoice_ids),))
+        return dict(self.env.cr.fetchall())
+
 
 class ReconcileOrder(models.Model):
     _name = 'reconcile.order'
@@ -910,6 +979,10 @@ class ReconcileOrder(models.Model):
                                      states={'draft': [('readonly', False)]},
                                      help=u'类型：预收冲应收,预付冲应付,应收冲应付,应收转应收,应付转应付'
                                      )
+    strategy = fields.Selection(RECONCILE_STRATEGIES, string=u'自动分配策略',
+                                readonly=True, default='fifo',
+                                states={'draft': [('readonly', False)]},
+                                help=u'点击自动分配时，按此策略计算各行的本次核销金额')
     name = fields.Char(string=u'单据编号', copy=False, readonly=True,
                        help=u'单据编号，创建时会自动生成')
     date = fields.Date(string=u'单据日期', readonly=True,
@@ -931,22 +1004,20 @@ class ReconcileOrder(models.Model):
         :param way: 收/付款单的type
         :return: list
         """
-        money_orders = self.env['money.order'].search(
+        money_orders = self.env['money.order'].search_read(
             [('partner_id', '=', self.partner_id.id),
              ('type', '=', way),
              ('state', '=', 'done'),
-             ('to_reconcile', '!=', 0)])
-        result = []
-        for order in money_orders:
-            result.append((0, 0, {
-                'name': order.id,
-                'amount': order.amount,
-                'date': order.date,
-                'reconciled': order.reconciled,
-                'to_reconcile': order.to_reconcile,
-                'this_reconcile': order.to_reconcile,
-            }))
-        return result
+             ('to_reconcile', '!=', 0)],
+            ['amount', 'date', 'reconciled', 'to_reconcile'], order='date, id')
+        return [(0, 0, {
+            'name': order['id'],
+            'amount': order['amount'],
+            'date': order['date'],
+            'reconciled': order['reconciled'],
+            'to_reconcile': order['to_reconcile'],
+            'this_reconcile': order['to_reconcile'],
+        }) for order in money_orders]
 
     @api.multi
     def _get_money_invoice(self, way='income'):
@@ -956,23 +1027,22 @@ class ReconcileOrder(models.Model):
         :param way: money.invoice 中的category_id 的type
         :return:
         """
-        MoneyInvoice = self.env['money.invoice'].search([
+        invoices = self.env['money.invoice'].search_read([
             ('category_id.type', '=', way),
             ('partner_id', '=', self.partner_id.id),
-            ('to_reconcile', '!=', 0)])
-        result = []
-        for invoice in MoneyInvoice:
-            result.append((0, 0, {
-                'name': invoice.id,
-                'category_id': invoice.category_id.id,
-                'amount': invoice.amount,
-                'date': invoice.date,
-                'reconciled': invoice.reconciled,
-                'to_reconcile': invoice.to_reconcile,
-                'date_due': invoice.date_due,
-                'this_reconcile': invoice.to_reconcile,
-            }))
-        return result
+            ('to_reconcile', '!=', 0)],
+            ['category_id', 'amount', 'date', 'reconciled', 'to_reconcile', 'date_due'],
+            order='date_due, date, id')
+        return [(0, 0, {
+            'name': invoice['id'],
+            'category_id': invoice['category_id'] and invoice['category_id'][0],
+            'amount': invoice['amount'],
+            'date': invoice['date'],
+            'reconciled': invoice['reconciled'],
+            'to_reconcile': invoice['to_reconcile'],
+            'date_due': invoice['date_due'],
+            'this_reconcile': invoice['to_reconcile'],
+        }) for invoice in invoices]
 
     @api.onchange('partner_id', 'to_partner_id', 'business_type')
     def onchange_partner_id(self):
@@ -1009,11 +1079,74 @@ class ReconcileOrder(models.Model):
             self.payable_source_ids = self._get_money_invoice('expense')
             return {'domain': {'to_partner_id': [('s_category_id', '!=', False)]}}
 
+    @api.multi
+    def action_auto_match(self):
+        '''
+        按分配策略计算各行的本次核销金额，两边核销合计相同；
+        应收转应收、应付转应付只有一边，不自动分配
+        '''
+        engine = self.env['reconcile.engine']
+        for order in self:
+            if order.business_type == 'adv_pay_to_get':
+                debit_lines, credit_lines = order.advance_payment_ids, order.receivable_source_ids
+            elif order.business_type == 'adv_get_to_pay':
+                debit_lines, credit_lines = order.advance_payment_ids, order.payable_source_ids
+            elif order.business_type == 'get_to_pay':
+                debit_lines, credit_lines = order.receivable_source_ids, order.payable_source_ids
+            else:
+                raise UserError(u'应收转应收、应付转应付不能自动分配核销金额')
+            debit_amounts, credit_amounts = engine.match(
+                [order._get_match_item(line) for line in debit_lines],
+                [order._get_match_item(line) for line in credit_lines],
+                order.strategy or 'fifo')
+            for lines, amounts in ((debit_lines, debit_amounts), (credit_lines, credit_amounts)):
+                for line in lines:
+                    line.this_reconcile = amounts.get(line.id, 0)
+        return True
+
+    @api.model
+    def _get_match_item(self, line):
+        ''' 核销单行转换为 reconcile.engine.match 的单据字典 '''
+        return {
+            'id': line.id,
+            'date': line.date,
+            'date_due': 'date_due' in line._fields and line.date_due or line.date,
+            'to_reconcile': line.to_reconcile,
+        }
+
+    @api.model
+    def _apply_reconcile(self, model, amounts):
+        '''
+        用一条 UPDATE 更新多张单据的已核销、未核销金额
+        :param amounts: {单据id: 本次核销金额}
+        '''
+        amounts = dict((key, value) for key, value in amounts.items()
+                       if not float_is_zero(value, 2))
+        if not amounts:
+            return
+        Model = self.env[model]
+        cr = self.env.cr
+        cr.execute('''
+            UPDATE "%s" doc
+               SET to_reconcile = COALESCE(doc.to_reconcile, 0) - v.amount,
+                   reconciled = COALESCE(doc.reconciled, 0) + v.amount,
+                   write_uid = %%s, write_date = (now() at time zone 'UTC')
+              FROM (VALUES %s) AS v(id, amount)
+             WHERE doc.id = v.id
+        ''' % (Model._table, ','.join(cr.mogrify('(%s, %s::numeric)', item)
+                                      for item in amounts.items())), (self.env.uid,))
+        records = Model.browse(list(amounts))
+        records.invalidate_cache(['to_reconcile', 'reconciled', 'write_uid', 'write_date'],
+                                 records.ids)
+        records.modified(['to_reconcile', 'reconciled'])
+        records.recompute()
+
     @api.multi
     def _get_or_pay(self, line, business_type,
                     partner_id, to_partner_id, name):
         """
-        核销单 核销时 对具体核销单行进行的操作
+        核销单 核销时 对具体核销单行进行的操作，
+        结算单的已核销、未核销金额由 reconcile_order_done 统一更新
         :param line:
         :param business_type:
         :param partner_id:
@@ -1025,9 +1158,6 @@ class ReconcileOrder(models.Model):
         if float_compare(line.this_reconcile, line.to_reconcile, precision_digits=decimal_amount.digits) == 1:
             raise UserError(u'核销金额不能大于未核销金额。\n核销金额:%s 未核销金额:%s' %
                             (line.this_reconcile, line.to_reconcile))
-        # 更新每一行的已核销余额、未核销余额
-        line.name.to_reconcile -= line.this_reconcile
-        line.name.reconciled += line.this_reconcile
 
         # 应收转应收、应付转应付
         if business_type in ['get_to_get', 'pay_to_pay']:
@@ -1053,12 +1183,14 @@ class ReconcileOrder(models.Model):
     @api.multi
     def reconcile_order_done(self):
         '''核销单的审核按钮'''
+        # 所有核销单行的金额汇总后一次更新到收付款单和结算单
+        order_amounts, invoice_amounts = defaultdict(float), defaultdict(float)
         # 核销金额不能大于未核销金额
         for order in self:
             if order.state == 'done':
                 raise UserError(u'核销单%s已审核，不能再次审核。' % order.name)
             order_reconcile, invoice_reconcile = 0, 0
-            if self.business_type in ['get_to_get', 'pay_to_pay'] and order.partner_id == order.to_partner_id:
+            if order.business_type in ['get_to_get', 'pay_to_pay'] and order.partner_id == order.to_partner_id:
                 raise UserError(u'业务伙伴和转入往来单位不能相同。\n业务伙伴:%s 转入往来单位:%s'
                                 % (order.partner_id.name, order.to_partner_id.name))
 
@@ -1070,33 +1202,35 @@ class ReconcileOrder(models.Model):
                     raise UserError(u'核销金额不能大于未核销金额。\n核销金额:%s 未核销金额:%s' % (
                         line.this_reconcile, line.to_reconcile))
 
-                # 更新每一行的已核销余额、未核销余额
-                line.name.to_reconcile -= line.this_reconcile
-                line.name.reconciled += line.this_reconcile
+                order_amounts[line.name.id] += line.this_reconcile
 
             for line in order.receivable_source_ids:
                 invoice_reconcile += line.this_reconcile
                 self._get_or_pay(line, order.business_type,
                                  order.partner_id,
                                  order.to_partner_id, order.name)
+                invoice_amounts[line.name.id] += line.this_reconcile
             for line in order.payable_source_ids:
-                if self.business_type == 'adv_get_to_pay':
+                if order.business_type == 'adv_get_to_pay':
                     invoice_reconcile += line.this_reconcile
                 else:
                     order_reconcile += line.this_reconcile
                 self._get_or_pay(line, order.business_type,
                                  order.partner_id,
                                  order.to_partner_id, order.name)
+                invoice_amounts[line.name.id] += line.this_reconcile
 
             # 核销金额必须相同
-            if self.business_type in ['adv_pay_to_get',
+            if order.business_type in ['adv_pay_to_get',
                                       'adv_get_to_pay', 'get_to_pay']:
                 decimal_amount = self.env.ref('core.decimal_amount')
                 if float_compare(order_reconcile, invoice_reconcile, precision_digits=decimal_amount.digits) != 0:
                     raise UserError(u'核销金额必须相同, %s 不等于 %s'
                                     % (order_reconcile, invoice_reconcile))
 
-            order.state = 'done'
+        self._apply_reconcile('money.order', order_amounts)
+        self._apply_reconcile('money.invoice', invoice_amounts)
+        self.write({'state': 'done'})
         return True
 
 
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, fields, models
+from odoo.exceptions import UserError
+from odoo.tools import float_compare, float_is_zero, float_round, ustr
+
+_logger = logging.getLogger(__name__)
+
+# 自动核销的分配策略
+RECONCILE_STRATEGIES = [
+    ('fifo', u'按到期日先进先出'),
+    ('exact', u'金额相同优先'),
+    ('oldest', u'按单据日期从早到晚'),
+]
+
+# 可以自动核销的业务类型：(借方单据, 借方类型, 贷方单据, 贷方类型)
+# 借方对应核销单的预收/付款单行或应收结算单行，贷方对应应收或应付结算单行
+RECONCILE_SIDES = {
+    'adv_pay_to_get': ('money.order', 'get', 'money.invoice', 'income'),
+    'adv_get_to_pay': ('money.order', 'pay', 'money.invoice', 'expense'),
+    'get_to_pay': ('money.invoice', 'income', 'money.invoice', 'expense'),
+}
+
+OPEN_ITEM_QUERIES = {
+    'money.order': '''
+        SELECT mo.id, mo.partner_id, mo.date, mo.date AS date_due, NULL AS category_id,
+               mo.amount, mo.reconciled, mo.to_reconcile
+          FROM money_order mo
+         WHERE mo.type = %s
+           AND mo.state = 'done'
+           AND mo.to_reconcile > 0
+           %s
+    ''',
+    'money.invoice': '''
+        SELECT inv.id, inv.partner_id, inv.date, inv.date_due, inv.category_id,
+               inv.amount, inv.reconciled, inv.to_reconcile
+          FROM money_invoice inv
+          JOIN core_category category ON category.id = inv.category_id
+         WHERE category.type = %s
+           AND inv.state = 'done'
+           AND inv.to_reconcile > 0
+           %s
+    ''',
+}
+OPEN_ITEM_COLUMNS = ['id', 'partner_id', 'date', 'date_due', 'category_id',
+                     'amount', 'reconciled', 'to_reconcile']
+
+
+class ReconcileEngine(models.AbstractModel):
+    '''
+    自动核销：一次查出往来单位未核销的收付款单和结算单，
+    在内存中按分配策略计算每张单据的本次核销金额，生成核销单并审核
+    '''
+    _name = 'reconcile.engine'
+    _description = u'自动核销'
+
+    @api.model
+    def _get_digits(self):
+        return self.env.ref('core.decimal_amount').digits
+
+    @api.model
+    def get_open_items(self, model, way, partner_ids=None):
+        '''
+        取未核销的单据
+        :param model: money.order 或 money.invoice
+        :param way: 收付款单的 type 或结算单类别的 type
+        :return: {往来单位id: [单据字典]}
+        '''
+        where, params = '', [way]
+        if partner_ids is not None:
+            if not partner_ids:
+                return {}
+            where = 'AND partner_id IN %s'
+            params.append(tuple(partner_ids))
+        self.env.cr.execute(OPEN_ITEM_QUERIES[model] % ('%s', where), params)
+        result = {}
+        for row in self.env.cr.fetchall():
+            item = dict(zip(OPEN_ITEM_COLUMNS, row))
+            result.setdefault(item['partner_id'], []).append(item)
+        return result
+
+    @api.model
+    def _sort_items(self, items, strategy):
+        if strategy == 'oldest':
+            key = lambda item: (item['date'], item['id'])
+        else:
+            key = lambda item: (item['date_due'] or item['date'], item['date'], item['id'])
+        return sorted(items, key=key)
+
+    @api.model
+    def match(self, debits, credits, strategy='fifo'):
+        '''
+        在内存中分配核销金额，两边的核销合计相同
+        :param debits: 借方单据字典列表，需要 id, date, date_due, to_reconcile
+        :param credits: 贷方单据字典列表
+        :return: ({借方id: 核销金额}, {贷方id: 核销金额})
+        '''
+        if strategy not in dict(RECONCILE_STRATEGIES):
+            raise UserError(u'不支持的核销策略：%s' % strategy)
+        digits = self._get_digits()
+        debits = self._sort_items(debits, strategy)
+        credits = self._sort_items(credits, strategy)
+        debit_amounts, credit_amounts = {}, {}
+        left = dict((('d', item['id']), item['to_reconcile']) for item in debits)
+        left.update((('c', item['id']), item['to_reconcile']) for item in credits)
+
+        def allocate(debit, credit):
+            amount = float_round(min(left[('d', debit['id'])], left[('c', credit['id'])]),
+                                 precision_digits=digits)
+            if float_compare(amount, 0, precision_digits=digits) <= 0:
+                return
+            left[('d', debit['id'])] -= amount
+            left[('c', credit['id'])] -= amount
+            debit_amounts[debit['id']] = debit_amounts.get(debit['id'], 0) + amount
+            credit_amounts[credit['id']] = credit_amounts.get(credit['id'], 0) + amount
+
+        if strategy == 'exact':
+            # 先按金额配对，剩余的再按到期日先进先出
+            by_amount = {}
+            for credit in credits:
+                by_amount.setdefault(
+                    float_round(credit['to_reconcile'], precision_digits=digits), []).append(credit)
+            for debit in debits:
+                candidates = by_amount.get(
+                    float_round(debit['to_reconcile'], precision_digits=digits))
+                if candidates:
+                    allocate(debit, candidates.pop(0))
+
+        credit_index = 0
+        for debit in debits:
+            while credit_index < len(credits) and \
+                    not float_is_zero(left[('d', debit['id'])], precision_digits=digits):
+                credit = credits[credit_index]
+                allocate(debit, credit)
+                if float_is_zero(left[('c', credit['id'])], precision_digits=digits):
+                    credit_index += 1
+                else:
+                    break
+        return debit_amounts, credit_amounts
+
+    @api.model
+    def _prepare_line(self, item, amount):
+        vals = {
+            'name': item['id'],
+            'amount': item['amount'],
+            'date': item['date'],
+            'reconciled': item['reconciled'],
+            'to_reconcile': item['to_reconcile'],
+            'this_reconcile': amount,
+        }
+        if item['category_id']:
+            vals.update(category_id=item['category_id'], date_due=item['date_due'])
+        return vals
+
+    @api.model
+    def reconcile_partner(self, partner, business_type, strategy='fifo',
+                          debits=None, credits=None):
+        '''
+        按策略为往来单位生成核销单并审核
+        :param debits: 已查出的借方单据，不传时查询
+        :param credits: 已查出的贷方单据，不传时查询
+        :return: 审核后的核销单，没有可核销的金额时返回 False
+        '''
+        if business_type not in RECONCILE_SIDES:
+            raise UserError(u'业务类型 %s 不能自动核销' % business_type)
+        debit_model, debit_way, credit_model, credit_way = RECONCILE_SIDES[business_type]
+        if debits is None:
+            debits = self.get_open_items(debit_model, debit_way, [partner.id]).get(partner.id, [])
+        if credits is None:
+            credits = self.get_open_items(credit_model, credit_way, [partner.id]).get(partner.id, [])
+        debit_amounts, credit_amounts = self.match(debits, credits, strategy)
+        if not debit_amounts:
+            return False
+
+        debit_lines = [(0, 0, self._prepare_line(item, debit_amounts[item['id']]))
+                       for item in debits if item['id'] in debit_amounts]
+        credit_lines = [(0, 0, self._prepare_line(item, credit_amounts[item['id']]))
+                        for item in credits if item['id'] in credit_amounts]
+        vals = {
+            'partner_id': partner.id,
+            'business_type': business_type,
+            'strategy': strategy,
+        }
+        if business_type == 'get_to_pay':
+            vals.update(receivable_source_ids=debit_lines, payable_source_ids=credit_lines)
+        elif business_type == 'adv_pay_to_get':
+            vals.update(advance_payment_ids=debit_lines, receivable_source_ids=credit_lines)
+        else:
+            vals.update(advance_payment_ids=debit_lines, payable_source_ids=credit_lines)
+        order = self.env['reconcile.order'].create(vals)
+        order.reconcile_order_done()
+        return order
+
+    @api.model
+    def run_batch(self, business_types=None, strategy='fifo'):
+        '''
+        定时任务调用：为所有同时有借方和贷方未核销单据的往来单位自动核销，
+        每个往来单位在独立的保存点中处理，出错的往来单位跳过
+        :return: 生成的核销单
+        '''
+        orders = self.env['reconcile.order']
+        for business_type in business_types or sorted(RECONCILE_SIDES):
+            debit_model, debit_way, credit_model, credit_way = RECONCILE_SIDES[business_type]
+            all_debits = self.get_open_items(debit_model, debit_way)
+            all_credits = self.get_open_items(
+                credit_model, credit_way, list(all_debits))
+            for partner in self.env['partner'].browse(sorted(all_credits)):
+                try:
+                    with self.env.cr.savepoint():
+                        order = self.reconcile_partner(
+                            partner, business_type, strategy,
+                            debits=all_debits[partner.id],
+                            credits=all_credits[partner.id])
+                except Exception as e:
+                    # 保存点已回滚，丢弃该往来单位在缓存中的修改后继续
+                    self.env.invalidate_all()
+                    _logger.warning(u'往来单位 %s 自动核销失败：%s', partner.name,
+                                    ustr(getattr(e, 'name', None) or e))
+                    continue
+                if order:
+                    orders |= order
+        return orders
@@ -4,3 +4,4 @@ import other_money_statements
 import money_get_pay
 import customer_statements
 import supplier_statements
+import receivable_aging
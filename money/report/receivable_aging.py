@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import odoo.addons.decimal_precision as dp
+from odoo import fields, models
+from odoo.addons.money.models.money_order import OVERDUE_BUCKETS
+
+
+class ReceivableAgingReport(models.TransientModel):
+    _name = 'receivable.aging.report'
+    _inherit = 'report.materialize'
+    _description = u'往来账龄分析表'
+    _report_columns = ['partner_id', 'overdue_bucket', 'invoice_count',
+                       'to_reconcile', 'overdue_amount']
+
+    partner_id = fields.Many2one('partner', u'往来单位')
+    overdue_bucket = fields.Selection(OVERDUE_BUCKETS, u'账龄区间')
+    invoice_count = fields.Integer(u'结算单数')
+    to_reconcile = fields.Float(u'未核销金额', digits=dp.get_precision('Amount'))
+    overdue_amount = fields.Float(u'逾期金额', digits=dp.get_precision('Amount'))
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from odoo.tests.common import TransactionCase
+from odoo import fields
 from odoo.exceptions import UserError
 
 
@@ -141,3 +142,28 @@ class TestInvoice(TransactionCase):
             'date_due': '2016-04-10',
         })
         self.assertEqual(invoice.overdue_amount, 117)
+        self.assertEqual(invoice.overdue_bucket, 'over_90')
+
+        # 修改到期日时重算
+        invoice.date_due = fields.Date.context_today(invoice)
+        self.assertEqual(invoice.overdue_days, 0)
+        self.assertEqual(invoice.overdue_amount, 0)
+        self.assertEqual(invoice.overdue_bucket, 'current')
+
+        # 日期变化后由定时任务批量更新
+        self.env.cr.execute(
+            "UPDATE money_invoice SET date_due = %s::date - 45 WHERE id = %s",
+            (fields.Date.context_today(invoice), invoice.id))
+        self.env['money.invoice'].refresh_overdue()
+        self.assertEqual(invoice.overdue_days, 45)
+        self.assertEqual(invoice.overdue_amount, 117)
+        self.assertEqual(invoice.overdue_bucket, '31_60')
+
+        # 往来账龄分析表按往来单位和账龄区间汇总
+        action = self.env['receivable.aging.wizard'].create({
+            'partner_id': self.env.ref('core.jd').id,
+        }).open_report()
+        rows = self.env['receivable.aging.report'].search(action['domain'])
+        row = rows.filtered(lambda row: row.overdue_bucket == '31_60')
+        self.assertEqual(row.partner_id, self.env.ref('core.jd'))
+        self.assertTrue(row.overdue_amount >= 117)
@@ -162,3 +162,62 @@ class TestReconcileOrder(TransactionCase):
             reconcile_pay_to_pay_partner_same.reconcile_order_done()
 
         self.env.ref('money.reconcile_get_to_get').reconcile_order_done()
+
+    def test_reconcile_engine_match(self):
+        '''自动核销：按策略分配核销金额'''
+        engine = self.env['reconcile.engine']
+        debits = [{'id': 1, 'date': '2016-01-01', 'date_due': '2016-01-01', 'to_reconcile': 100.0},
+                  {'id': 2, 'date': '2016-01-02', 'date_due': '2016-01-02', 'to_reconcile': 50.0}]
+        credits = [{'id': 10, 'date': '2016-01-01', 'date_due': '2016-02-01', 'to_reconcile': 50.0},
+                   {'id': 11, 'date': '2016-01-02', 'date_due': '2016-01-15', 'to_reconcile': 80.0}]
+        # 到期日早的结算单先核销
+        self.assertEqual(engine.match(debits, credits, 'fifo'),
+                         ({1: 100.0, 2: 30.0}, {11: 80.0, 10: 50.0}))
+        # 金额相同的先配对
+        self.assertEqual(engine.match(debits, credits, 'exact'),
+                         ({1: 80.0, 2: 50.0}, {11: 80.0, 10: 50.0}))
+        # 单据日期早的先核销
+        self.assertEqual(engine.match(debits, credits, 'oldest'),
+                         ({1: 100.0, 2: 30.0}, {10: 50.0, 11: 80.0}))
+        with self.assertRaises(UserError):
+            engine.match(debits, credits, 'unknown')
+
+    def test_reconcile_engine(self):
+        '''自动核销：为往来单位生成核销单并审核，批量核销所有往来单位'''
+        self.get_invoice.money_invoice_done()
+        engine = self.env['reconcile.engine']
+        order = engine.reconcile_partner(self.env.ref('core.jd'), 'adv_pay_to_get')
+        self.assertEqual(order.state, 'done')
+        self.assertAlmostEqual(sum(order.advance_payment_ids.mapped('this_reconcile')),
+                               sum(order.receivable_source_ids.mapped('this_reconcile')))
+        for line in order.advance_payment_ids + order.receivable_source_ids:
+            self.assertAlmostEqual(line.name.to_reconcile,
+                                   line.to_reconcile - line.this_reconcile)
+            self.assertAlmostEqual(line.name.reconciled,
+                                   line.reconciled + line.this_reconcile)
+        # 应收转应收不能自动核销
+        with self.assertRaises(UserError):
+            engine.reconcile_partner(self.env.ref('core.jd'), 'get_to_get')
+
+        # 批量核销后不再有同时存在未核销预收款和应收结算单的往来单位
+        self.env.ref('money.pay_2000').money_order_done()
+        self.pay_invoice.money_invoice_done()
+        engine.run_batch()
+        for business_type in ['adv_pay_to_get', 'adv_get_to_pay']:
+            debits = engine.get_open_items(
+                'money.order', business_type == 'adv_pay_to_get' and 'get' or 'pay')
+            credits = engine.get_open_items(
+                'money.invoice', business_type == 'adv_pay_to_get' and 'income' or 'expense')
+            self.assertFalse(set(debits) & set(credits))
+
+    def test_action_auto_match(self):
+        '''核销单上按策略自动分配本次核销金额'''
+        self.get_invoice.money_invoice_done()
+        reconcile = self.env.ref('money.reconcile_adv_pay_to_get')
+        reconcile.partner_id = self.env.ref('core.jd').id
+        reconcile.onchange_partner_id()
+        reconcile.action_auto_match()
+        self.assertAlmostEqual(sum(reconcile.advance_payment_ids.mapped('this_reconcile')),
+                               sum(reconcile.receivable_source_ids.mapped('this_reconcile')))
+        reconcile.reconcile_order_done()
+        self.assertEqual(reconcile.state, 'done')
@@ -114,3 +114,27 @@ class TestReport(TransactionCase):
         current_period = period_row and period_row[0]
         self.assertEqual(wizard.period_id, current_period)
         wizard.show()
+
+    def test_cash_flow_amounts(self):
+        """现金流量表 分组汇总金额及表行计算"""
+        wizard = self.env['cash.flow.wizard'].create({})
+        date_start, date_end = self.env['finance.period'].get_period_month_date_range(
+            wizard.period_id)
+        self.env.ref('money.get_40000').money_order_done()
+        orders = self.env['money.order'].search([('type', '=', 'get'),
+                                                 ('state', '=', 'done'),
+                                                 ('date', '>=', date_start),
+                                                 ('date', '<=', date_end)])
+        res = wizard.show()
+        reports = self.env['cash.flow.statement'].search(res['domain'])
+        amounts = {rep.line_num: rep for rep in reports}
+        self.assertEqual(len(reports),
+                         self.env['cash.flow.template'].search_count([]))
+        self.assertAlmostEqual(amounts['1'].amount,
+                               sum(order.amount for order in orders))
+        self.assertAlmostEqual(amounts['7'].amount,
+                               amounts['1'].amount + amounts['2'].amount
+                               - sum(amounts[num].amount for num in ('3', '4', '5', '6')))
+        self.assertAlmostEqual(amounts['20'].year_amount,
+                               amounts['7'].year_amount + amounts['13'].year_amount
+                               + amounts['19'].year_amount)
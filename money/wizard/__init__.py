@@ -4,3 +4,4 @@ import bank_statements_wizard
 import other_money_statements_wizard
 import money_get_pay_wizard
 import cash_flow_wizard
+import receivable_aging_wizard
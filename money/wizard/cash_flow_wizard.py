@@ -22,124 +22,133 @@ class CashFlowWizard(models.TransientModel):
                                 default=_default_period_id)
 
     @api.model
-    def get_amount(self, tem, report_ids, period_id):
+    def _get_cash_flow_sums(self, period_id):
         '''
-             [('get',u'销售收款'),
-              ('pay',u'采购付款'),
-              ('category',u'其他收支'),
-              ('begin',u'科目期初'),
-              ('end',u'科目期末'),
-              ('lines',u'表行计算')]
+        按类型、类别、科目分组汇总本月及本年累计金额，所有模板行共用
+        :return: {'money': {type: (本月, 本年)},
+                  'category': {category_id: (本月, 本年)},
+                  'account': {account_id: (期初, 年初, 期末)}}
         '''
         date_start, date_end = self.env['finance.period'].get_period_month_date_range(
             period_id)
-        ret = 0
-        if tem.line_type == 'get' or tem.line_type == 'pay':
-            # 收款单或付款单金额合计
-            ret = sum([order.amount for order in self.env['money.order'].search([('type', '=', tem.line_type),
-                                                                                 ('state',
-                                                                                  '=', 'done'),
-                                                                                 ('date', '>=',
-                                                                                  date_start),
-                                                                                 ('date', '<=', date_end)])])
-        if tem.line_type == 'category':
-            # 其他收支单金额合计
-            ret = sum([line.amount for line in self.env['other.money.order.line'].search([('category_id', 'in', [c.id for c in tem.category_ids]),
-                                                                                          ('other_money_id.state', '=', 'done'),
-                                                                                          ('other_money_id.date', '>=', date_start),
-                                                                                          ('other_money_id.date', '<=', date_end)])])
-        if tem.line_type == 'begin':
-            # 科目期初金额合计
-            ret = sum([acc.initial_balance_debit - acc.initial_balance_credit
-                       for acc in self.env['trial.balance'].search([('period_id', '=', period_id.id),
-                                                                    ('subject_name_id', 'in', [b.id for b in tem.begin_ids])])])
-        if tem.line_type == 'end':
-            # 科目期末金额合计
-            ret = sum([acc.ending_balance_debit - acc.ending_balance_credit
-                       for acc in self.env['trial.balance'].search([('period_id', '=', period_id.id),
-                                                                    ('subject_name_id', 'in', [e.id for e in tem.end_ids])])])
-        if tem.line_type == 'lines':
-            # 根据其他报表行计算
-            for line in self.env['cash.flow.statement'].browse(report_ids):
-                for l in tem.plus_ids:
-                    if l.line_num == line.line_num:
-                        ret += line.amount
-                for l in tem.nega_ids:
-                    if l.line_num == line.line_num:
-                        ret -= line.amount
-        return ret
+        year_start = date_start[0:5] + '01-01'
+        cr = self.env.cr
+        # 收款单或付款单金额合计
+        cr.execute('''
+            SELECT type,
+                   COALESCE(SUM(CASE WHEN date >= %s THEN amount END), 0),
+                   COALESCE(SUM(amount), 0)
+              FROM money_order
+             WHERE state = 'done' AND type IN ('get', 'pay')
+               AND date >= %s AND date <= %s
+          GROUP BY type
+        ''', (date_start, year_start, date_end))
+        money = {row[0]: row[1:] for row in cr.fetchall()}
+        # 其他收支单金额合计
+        cr.execute('''
+            SELECT line.category_id,
+                   COALESCE(SUM(CASE WHEN mo.date >= %s THEN line.amount END), 0),
+                   COALESCE(SUM(line.amount), 0)
+              FROM other_money_order_line line
+              JOIN other_money_order mo ON mo.id = line.other_money_id
+             WHERE mo.state = 'done' AND mo.date >= %s AND mo.date <= %s
+          GROUP BY line.category_id
+        ''', (date_start, year_start, date_end))
+        category = {row[0]: row[1:] for row in cr.fetchall()}
+        # 科目期初、年初、期末金额合计，年初余额同 trial.balance._get_year_init
+        cr.execute('''
+            SELECT tb.subject_name_id,
+                   COALESCE(SUM(tb.initial_balance_debit - tb.initial_balance_credit), 0),
+                   COALESCE(SUM(CASE WHEN acc.costs_types IN ('in', 'out') THEN 0
+                                     ELSE tb.ending_balance_debit - tb.ending_balance_credit
+                                          - tb.cumulative_occurrence_debit
+                                          + tb.cumulative_occurrence_credit END), 0),
+                   COALESCE(SUM(tb.ending_balance_debit - tb.ending_balance_credit), 0)
+              FROM trial_balance tb
+              JOIN finance_account acc ON acc.id = tb.subject_name_id
+             WHERE tb.period_id = %s
+          GROUP BY tb.subject_name_id
+        ''', (period_id.id,))
+        account = {row[0]: row[1:] for row in cr.fetchall()}
+        return {'money': money, 'category': category, 'account': account}
 
     @api.model
-    def get_year_amount(self, tem, report_ids, period_id):
+    def get_template_amounts(self, templates, period_id):
         '''
+        计算所有模板行的本月金额和本年累计金额
              [('get',u'销售收款'),
               ('pay',u'采购付款'),
               ('category',u'其他收支'),
               ('begin',u'科目期初'),
               ('end',u'科目期末'),
               ('lines',u'表行计算')]
+        :return: {template_id: (本月金额, 本年累计金额)}
         '''
-        date_start, date_end = self.env['finance.period'].get_period_month_date_range(
-            period_id)
-        date_start = date_start[0:5] + '01-01'
-        ret = 0
-        if tem.line_type == 'get' or tem.line_type == 'pay':
-            # 收款单或付款单金额合计
-            ret = sum([order.amount for order in self.env['money.order'].search([('type', '=', tem.line_type),
-                                                                                 ('state',
-                                                                                  '=', 'done'),
-                                                                                 ('date', '>=',
-                                                                                  date_start),
-                                                                                 ('date', '<=', date_end)])])
-        if tem.line_type == 'category':
-            # 其他收支单金额合计
-            ret = sum([line.amount for line in self.env['other.money.order.line'].search([('category_id', 'in', [c.id for c in tem.category_ids]),
-                                                                                          ('other_money_id.state', '=', 'done'),
-                                                                                          ('other_money_id.date', '>=', date_start),
-                                                                                          ('other_money_id.date', '<=', date_end)])])
-        if tem.line_type == 'begin':
-            # 科目期初金额合计
-            ret = sum([acc.year_init_debit - acc.year_init_credit
-                       for acc in self.env['trial.balance'].search([('period_id', '=', period_id.id),
-                                                                    ('subject_name_id', 'in', [b.id for b in tem.begin_ids])])])
-        if tem.line_type == 'end':
-            # 科目期末金额合计
-            ret = sum([acc.ending_balance_debit - acc.ending_balance_credit
-                       for acc in self.env['trial.balance'].search([('period_id', '=', period_id.id),
-                                                                    ('subject_name_id', 'in', [e.id for e in tem.end_ids])])])
-        if tem.line_type == 'lines':
-            # 根据其他报表行计算
-            for line in self.env['cash.flow.statement'].browse(report_ids):
-                for l in tem.plus_ids:
-                    if l.line_num == line.line_num:
-                        ret += line.year_amount
-                for l in tem.nega_ids:
-                    if l.line_num == line.line_num:
-                        ret -= line.year_amount
-        return ret
+        sums = self._get_cash_flow_sums(period_id)
+        result = {}
+        for tem in templates:
+            amount = year_amount = 0
+            if tem.line_type in ('get', 'pay'):
+                amount, year_amount = sums['money'].get(tem.line_type, (0, 0))
+            elif tem.line_type == 'category':
+                for category in tem.category_ids:
+                    month, year = sums['category'].get(category.id, (0, 0))
+                    amount += month
+                    year_amount += year
+            elif tem.line_type == 'begin':
+                for account in tem.begin_ids:
+                    month, year = sums['account'].get(account.id, (0, 0, 0))[:2]
+                    amount += month
+                    year_amount += year
+            elif tem.line_type == 'end':
+                for account in tem.end_ids:
+                    end = sums['account'].get(account.id, (0, 0, 0))[2]
+                    amount += end
+                    year_amount += end
+            if tem.line_type != 'lines':
+                result[tem.id] = (amount, year_amount)
+
+        # 表行计算：按行次引用其他报表行，依赖关系一次拓扑求值
+        by_line_num = {}
+        for tem in templates:
+            by_line_num.setdefault(tem.line_num, []).append(tem)
+        visiting = set()
+
+        def resolve(tem):
+            if tem.id in result:
+                return result[tem.id]
+            if tem.id in visiting:
+                raise UserError(u'现金流量表模板行 %s 的表行计算存在循环引用' % tem.name)
+            visiting.add(tem.id)
+            amount = year_amount = 0
+            for lines, sign in ((tem.plus_ids, 1), (tem.nega_ids, -1)):
+                for l in lines:
+                    for ref in by_line_num.get(l.line_num, []):
+                        month, year = resolve(ref)
+                        amount += sign * month
+                        year_amount += sign * year
+            visiting.discard(tem.id)
+            result[tem.id] = (amount, year_amount)
+            return result[tem.id]
+
+        for tem in templates:
+            resolve(tem)
+        return result
 
     @api.multi
     def show(self):
         """生成现金流量表"""
         rep_ids = []
-        '''
-        old_report = self.env['cash.flow.statement'].search([('period_id','=',self.period_id.id)])
-        if old_report:
-            rep_ids = [rep.id for rep in old_report]
-        else:
-        '''
         if self.period_id:
             templates = self.env['cash.flow.template'].search([])
-            for tem in templates:
-                new_rep = self.env['cash.flow.statement'].create(
-                    {
-                        'name': tem.name,
-                        'line_num': tem.line_num,
-                        'amount': self.get_amount(tem, rep_ids, self.period_id),
-                        'year_amount': self.get_year_amount(tem, rep_ids, self.period_id),
-                    }
-                )
-                rep_ids.append(new_rep.id)
+            amounts = self.get_template_amounts(templates, self.period_id)
+            reports = self.env['cash.flow.statement']._bulk_insert([{
+                'name': tem.name,
+                'line_num': tem.line_num,
+                'amount': amounts[tem.id][0],
+                'year_amount': amounts[tem.id][1],
+            } for tem in templates])
+            rep_ids = reports.ids
         view_id = self.env.ref('money.cash_flow_statement_tree').id
         attachment_information = u'编制单位：' + self.env.user.company_id.name + u',,' + self.period_id.year\
                                  + u'年' + self.period_id.month + u'月' + u',' + u'单位：元'
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models, api
+
+
+class ReceivableAgingWizard(models.TransientModel):
+    _name = 'receivable.aging.wizard'
+    _description = u'往来账龄分析向导'
+
+    type = fields.Selection([('income', u'应收'), ('expense', u'应付')],
+                            string=u'类别', required=True, default='income',
+                            help=u'按结算单类别统计应收或应付账龄')
+    partner_id = fields.Many2one('partner', u'往来单位',
+                                 help=u'不选时统计所有往来单位')
+
+    @api.multi
+    def open_report(self):
+        ''' 按往来单位和账龄区间汇总未核销的结算单 '''
+        self.ensure_one()
+        domain = [('category_id.type', '=', self.type),
+                  ('state', '=', 'done'),
+                  ('to_reconcile', '!=', 0)]
+        if self.partner_id:
+            domain.append(('partner_id', '=', self.partner_id.id))
+        groups = self.env['money.invoice'].read_group(
+            domain, ['partner_id', 'overdue_bucket', 'to_reconcile', 'overdue_amount'],
+            ['partner_id', 'overdue_bucket'], lazy=False)
+        report = self.env['receivable.aging.report']
+        run_tag = report.materialize_rows([{
+            'partner_id': group['partner_id'] and group['partner_id'][0],
+            'overdue_bucket': group['overdue_bucket'],
+            'invoice_count': group['__count'],
+            'to_reconcile': group['to_reconcile'],
+            'overdue_amount': group['overdue_amount'],
+        } for group in groups])
+        return report.get_run_action(
+            run_tag, u'往来账龄分析表',
+            [(self.env.ref('money.receivable_aging_report_pivot').id, 'pivot'),
+             (self.env.ref('money.receivable_aging_report_tree').id, 'tree')])
@@ -43,143 +43,143 @@ class StockRequest(models.Model):
         string=u'公司',
         change_default=True,
         default=lambda self: self.env['res.company']._company_default_get())
+    incremental = fields.Boolean(u'增量查询',
+                                 states={'done': [('readonly', True)]},
+                                 help=u'勾选后只计算上次查询库存后有库存移动或订单变动的商品')
+    query_date = fields.Datetime(u'查询时间', readonly=True, copy=False,
+                                 help=u'最近一次查询库存的时间，增量查询以此为起点')
 
     @api.one
     def stock_query(self):
         ''' 点击 查询库存 按钮 生成补货申请行
                                     每行一个商品一个属性的 数量，补货数量
          '''
-        goods = self.env['goods'].search([('no_stock', '=', False)])
-
-        for good in goods:
-            qty = 0  # 当前数量
-            to_delivery_qty = 0  # 未发货数量
-            to_receipt_qty = 0  # 未到货数量
-            to_sell_qty = 0  # 未审核销货数量
-            to_buy_qty = 0  # 未审核购货数量
-
-            wh_move_lines = self.env['wh.move.line'].search(
-                [('goods_id', '=', good.id)])
-
-            attribute_dict = {}
-            to_delivery_dict = {}
-            to_receipt_dict = {}
-            to_sell_dict = {}
-            to_buy_dict = {}
-            for wh_move_line in wh_move_lines:
-                # 计算当前数量
-                if wh_move_line.state == 'done':
-                    if wh_move_line.warehouse_dest_id.type == 'stock':  # 目的库位为库存库位
-                        if wh_move_line.attribute_id:  # 商品存在属性
-                            if wh_move_line.attribute_id not in attribute_dict:
-                                attribute_dict.update(
-                                    {wh_move_line.attribute_id: wh_move_line.qty_remaining})
-                            else:
-                                attribute_dict[wh_move_line.attribute_id] += wh_move_line.qty_remaining
-                        else:  # 商品不存在属性
-                            qty += wh_move_line.qty_remaining
-                # 计算未发货和未到货数量
-                else:
-                    if wh_move_line.type == 'out':
-                        if wh_move_line.attribute_id:  # 商品存在属性
-                            if not to_delivery_dict.has_key(wh_move_line.attribute_id):
-                                to_delivery_dict.update(
-                                    {wh_move_line.attribute_id: wh_move_line.goods_qty})
-                            else:
-                                to_delivery_dict[wh_move_line.attribute_id] += wh_move_line.goods_qty
-                        else:  # 商品不存在属性
-                            to_delivery_qty += wh_move_line.goods_qty
-                    else:
-                        if wh_move_line.attribute_id:  # 商品存在属性
-                            if not to_receipt_dict.has_key(wh_move_line.attribute_id):
-                                to_receipt_dict.update(
-                                    {wh_move_line.attribute_id: wh_move_line.goods_qty})
-                            else:
-                                to_receipt_dict[wh_move_line.attribute_id] += wh_move_line.goods_qty
-                        else:  # 商品不存在属性
-                            to_receipt_qty += wh_move_line.goods_qty
-            # 计算未销货数量
-            sell_order_lines = self.env['sell.order.line'].search([('goods_id', '=', good.id),
-                                                                   ('order_id.state', '=', 'draft')])
-            for line in sell_order_lines:
-                if line.attribute_id:  # 商品存在属性
-                    if not to_sell_dict.has_key(line.attribute_id):
-                        to_sell_dict.update({line.attribute_id: line.quantity})
-                    else:
-                        to_sell_dict[line.attribute_id] += line.quantity
-                else:  # 商品不存在属性
-                    to_sell_qty += line.quantity
-            # 计算未购货数量
-            buy_order_lines = self.env['buy.order.line'].search([('goods_id', '=', good.id),
-                                                                 ('order_id.state', '=', 'draft')])
-            for line in buy_order_lines:
-                if line.attribute_id:  # 商品存在属性
-                    if not to_buy_dict.has_key(line.attribute_id):
-                        to_buy_dict.update({line.attribute_id: line.quantity})
-                    else:
-                        to_buy_dict[line.attribute_id] += line.quantity
-                else:  # 商品不存在属性
-                    to_buy_qty += line.quantity
-
-            # 如果组装单模板存在，is_buy置为False
-            bom_line = self.env['wh.bom.line'].search([('goods_id', '=', good.id),
-                                                       ('bom_id.type',
-                                                        '=', 'assembly'),
-                                                       ('type', '=', 'parent')])
-            if bom_line:
-                is_buy = False
-            else:
-                is_buy = True
-
-            # 生成补货申请行
-            qty_available = 0  # 可用库存
-            if good.attribute_ids:  # 商品存在属性
-                for attribute in good.attribute_ids:
-                    qty = attribute in attribute_dict and attribute_dict[attribute] or 0
-                    to_sell_qty = attribute in to_sell_dict and to_sell_dict[attribute] or 0
-                    to_delivery_qty = attribute in to_delivery_dict and to_delivery_dict[
-                        attribute] or 0
-                    to_buy_qty = attribute in to_buy_dict and to_buy_dict[attribute] or 0
-                    to_receipt_qty = attribute in to_receipt_dict and to_receipt_dict[
-                        attribute] or 0
-                    qty_available = qty + to_receipt_qty + \
-                        to_buy_qty - to_delivery_qty - to_sell_qty
-                    if qty_available < good.min_stock_qty:
-                        self.env['stock.request.line'].create({
-                            'request_id': self.id,
-                            'goods_id': good.id,
-                            'attribute_id': attribute.id,
-                            'qty': qty,
-                            'to_sell_qty': to_sell_qty,
-                            'to_delivery_qty': to_delivery_qty,
-                            'to_buy_qty': to_buy_qty,
-                            'to_receipt_qty': to_receipt_qty,
-                            'min_stock_qty': good.min_stock_qty,
-                            'request_qty': good.min_stock_qty - qty_available,
-                            'uom_id': good.uom_id.id,
-                            'supplier_id': good.supplier_id and good.supplier_id.id or False,
-                            'is_buy': is_buy,
-                        })
-            else:  # 商品不存在属性
-                qty_available = qty + to_receipt_qty + \
-                    to_buy_qty - to_delivery_qty - to_sell_qty
-                if qty_available < good.min_stock_qty:
-                    self.env['stock.request.line'].create({
-                        'request_id': self.id,
-                        'goods_id': good.id,
-                        'qty': qty,
-                        'to_sell_qty': to_sell_qty,
-                        'to_delivery_qty': to_delivery_qty,
-                        'to_buy_qty': to_buy_qty,
-                        'to_receipt_qty': to_receipt_qty,
-                        'min_stock_qty': good.min_stock_qty,
-                        'request_qty': good.min_stock_qty - qty_available,
-                        'uom_id': good.uom_id.id,
-                        'supplier_id': good.supplier_id and good.supplier_id.id or False,
-                        'is_buy': is_buy,
-                    })
+        query_date = fields.Datetime.now()
+        goods_ids = None
+        if self.incremental:
+            last_query = self.search([('id', '!=', self.id),
+                                      ('query_date', '!=', False)],
+                                     order='query_date desc', limit=1)
+            if last_query:
+                goods_ids = self._get_changed_goods_ids(last_query.query_date)
+
+        vals_list = []
+        if goods_ids is None or goods_ids:
+            vals_list = self._get_request_line_vals(goods_ids)
+        self.env['stock.request.line']._bulk_insert(vals_list)
+        self.write({'state': 'draft', 'query_date': query_date})
+
+    def _get_changed_goods_ids(self, since):
+        ''' 增量查询：上次查询后库存移动、未审核销货/购货订单行或最低库存量有变化的商品 '''
+        self.env.cr.execute('''
+            SELECT goods_id FROM wh_move_line WHERE write_date > %(since)s
+             UNION
+            SELECT goods_id FROM sell_order_line WHERE write_date > %(since)s
+             UNION
+            SELECT goods_id FROM buy_order_line WHERE write_date > %(since)s
+             UNION
+            SELECT id FROM goods WHERE write_date > %(since)s
+        ''', {'since': since})
+        return [row[0] for row in self.env.cr.fetchall() if row[0]]
 
-        self.state = 'draft'
+    def _get_stock_qty_dict(self, goods_ids):
+        '''
+        分组汇总每个 (商品, 属性) 的当前数量、未发货、未到货、未审核销货和未审核购货数量
+        :param goods_ids: 需要计算的商品 id 列表，None 表示全部商品
+        :return: {(goods_id, attribute_id): {字段名: 数量}}
+        '''
+        goods_where = goods_ids is not None and 'AND line.goods_id IN %(goods_ids)s' or ''
+        params = {'goods_ids': tuple(goods_ids or [0])}
+        qty_dict = {}
+
+        def collect(query, names):
+            self.env.cr.execute(query % {'goods_where': goods_where}, params)
+            for row in self.env.cr.fetchall():
+                qtys = qty_dict.setdefault((row[0], row[1]), {})
+                for name, qty in zip(names, row[2:]):
+                    qtys[name] = qtys.get(name, 0) + (qty or 0)
+
+        # 当前数量取已审核且调入库存库位的剩余数量，未审核的出库/入库为未发货/未到货
+        collect('''
+            SELECT line.goods_id, line.attribute_id,
+                   SUM(CASE WHEN line.state = 'done' AND wh.type = 'stock'
+                            THEN line.qty_remaining ELSE 0 END),
+                   SUM(CASE WHEN line.state != 'done' AND line.type = 'out'
+                            THEN line.goods_qty ELSE 0 END),
+                   SUM(CASE WHEN line.state != 'done' AND line.type != 'out'
+                            THEN line.goods_qty ELSE 0 END)
+              FROM wh_move_line line
+         LEFT JOIN warehouse wh ON wh.id = line.warehouse_dest_id
+             WHERE TRUE %(goods_where)s
+          GROUP BY line.goods_id, line.attribute_id
+        ''', ['qty', 'to_delivery_qty', 'to_receipt_qty'])
+        for table, name in (('sell_order', 'to_sell_qty'),
+                            ('buy_order', 'to_buy_qty')):
+            collect('''
+                SELECT line.goods_id, line.attribute_id, SUM(line.quantity)
+                  FROM %(table)s_line line
+                  JOIN %(table)s o ON o.id = line.order_id
+                 WHERE o.state = 'draft' %%(goods_where)s
+              GROUP BY line.goods_id, line.attribute_id
+            ''' % {'table': table}, [name])
+        return qty_dict
+
+    def _get_request_line_vals(self, goods_ids=None):
+        '''
+        计算可用库存低于安全库存的 (商品, 属性)，返回待写入的补货申请行数据
+        可用库存 = 当前数量 + 未到货 + 未审核购货 - 未发货 - 未审核销货
+        '''
+        qty_dict = self._get_stock_qty_dict(goods_ids)
+        # 存在组装单模板的商品走组装，其余走采购
+        self.env.cr.execute('''
+            SELECT DISTINCT bl.goods_id
+              FROM wh_bom_line bl
+              JOIN wh_bom b ON b.id = bl.bom_id
+             WHERE b.type = 'assembly' AND bl.type = 'parent'
+        ''')
+        produce_goods_ids = set(row[0] for row in self.env.cr.fetchall())
+
+        # 有属性的商品按属性逐个补货，没有属性的商品按商品补货
+        self.env.cr.execute('''
+            SELECT g.id, a.id, g.min_stock_qty, g.uom_id, g.supplier_id
+              FROM goods g
+         LEFT JOIN attribute a ON a.goods_id = g.id
+             WHERE g.active AND g.no_stock IS NOT TRUE %s
+          ORDER BY g.id, a.id
+        ''' % (goods_ids is not None and 'AND g.id IN %(goods_ids)s' or ''),
+            {'goods_ids': tuple(goods_ids or [0])})
+
+        vals_list = []
+        empty = {}
+        for goods_id, attribute_id, min_stock_qty, uom_id, supplier_id \
+                in self.env.cr.fetchall():
+            min_stock_qty = min_stock_qty or 0
+            qtys = qty_dict.get((goods_id, attribute_id), empty)
+            qty = qtys.get('qty', 0)
+            to_sell_qty = qtys.get('to_sell_qty', 0)
+            to_delivery_qty = qtys.get('to_delivery_qty', 0)
+            to_buy_qty = qtys.get('to_buy_qty', 0)
+            to_receipt_qty = qtys.get('to_receipt_qty', 0)
+            qty_available = qty + to_receipt_qty + \
+                to_buy_qty - to_delivery_qty - to_sell_qty
+            if qty_available < min_stock_qty:
+                vals_list.append({
+                    'request_id': self.id,
+                    'goods_id': goods_id,
+                    'attribute_id': attribute_id,
+                    'qty': qty,
+                    'to_sell_qty': to_sell_qty,
+                    'to_delivery_qty': to_delivery_qty,
+                    'to_buy_qty': to_buy_qty,
+                    'to_receipt_qty': to_receipt_qty,
+                    'min_stock_qty': min_stock_qty,
+                    'request_qty': min_stock_qty - qty_available,
+                    'uom_id': uom_id,
+                    'supplier_id': supplier_id,
+                    'is_buy': goods_id not in produce_goods_ids,
+                    'company_id': self.company_id.id,
+                })
+        return vals_list
 
     def _get_buy_order_line_data(self, line, buy_order):
         price_taxed = line.goods_id.cost
@@ -74,6 +74,22 @@ class TestMailThread(TransactionCase):
         res = self.order.good_process_refused(self.order.id, self.order._name)
         self.assertTrue(res[0] == u'已经通过不能拒绝！')
 
+    def test_stored_approve_state(self):
+        """审批状态可直接按字段搜索"""
+        orders = self.env['buy.order'].search(
+            [('_approve_state', '=', u'已提交')])
+        self.assertTrue(self.order in orders)
+
+    def test_process_cache(self):
+        """审批规则停用后不再生成待审批人"""
+        Process = self.env['good_process.process']
+        self.assertTrue(Process.get_process('buy.order', self.approve_rule.type))
+        self.approve_rule.active = False
+        self.assertFalse(Process.get_process('buy.order', self.approve_rule.type))
+        order = self.env.ref('buy.buy_order_1').copy()
+        self.assertFalse(order._to_approver_ids)
+        self.assertTrue(order._approve_state == u'已审批')
+
     def test_unlink(self):
         """级联删除"""
         self.order.unlink()
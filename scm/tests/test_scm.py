@@ -59,6 +59,34 @@ class TestScm(TransactionCase):
 
         self.stock_request.stock_query()
 
+    def test_stock_query_qty(self):
+        ''' 测试 查询库存 按商品属性汇总数量并计算补货数量 '''
+        self.wh_move_in_1.approve_order()
+        self.stock_request.stock_query()
+        self.assertEqual(self.stock_request.state, 'draft')
+        self.assertTrue(self.stock_request.query_date)
+        for line in self.stock_request.line_ids:
+            qty_available = line.qty + line.to_receipt_qty + line.to_buy_qty \
+                - line.to_delivery_qty - line.to_sell_qty
+            self.assertAlmostEqual(line.request_qty,
+                                   line.min_stock_qty - qty_available)
+            if line.goods_id.attribute_ids:
+                self.assertTrue(line.attribute_id)
+
+    def test_stock_query_incremental(self):
+        ''' 测试 增量查询 只计算上次查询后有变动的商品 '''
+        self.stock_request.stock_query()
+        stock_request = self.env['stock.request'].create({
+            'date': datetime.now(),
+            'incremental': True,
+        })
+        self.env.cr.execute('UPDATE stock_request SET query_date = %s WHERE id = %s',
+                            ('2100-01-01 00:00:00', self.stock_request.id))
+        self.stock_request.invalidate_cache()
+        stock_request.stock_query()
+        self.assertFalse(stock_request.line_ids)
+        self.assertEqual(stock_request.state, 'draft')
+
     def test_stock_request_done(self):
         ''' 测试 审核 方法'''
         self.wh_move_in_1.approve_order()
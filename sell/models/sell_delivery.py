@@ -19,6 +19,8 @@ class SellDelivery(models.Model):
     _inherit = ['mail.thread']
     _description = u'销售发货单'
     _order = 'date desc, id desc'
+    # 批量审核任务调用的审核方法
+    _batch_approve_method = 'sell_delivery_done'
 
     @api.one
     @api.depends('line_out_ids.subtotal', 'discount_amount', 'partner_cost',
@@ -318,26 +320,23 @@ class SellDelivery(models.Model):
         })
         return money_order
 
-    def _create_voucher_line(self, account_id, debit, credit, voucher, goods_id, goods_qty):
+    def _get_voucher_line_vals(self, account_id, debit, credit, goods_id, goods_qty):
         """
-        创建凭证明细行
+        凭证明细行的值
         :param account_id: 科目
         :param debit: 借方
         :param credit: 贷方
-        :param voucher: 凭证
         :param goods_id: 商品
         :return:
         """
-        voucher_line = self.env['voucher.line'].create({
+        return {
             'name': u'%s %s' % (self.name, self.note or ''),
             'account_id': account_id and account_id.id,
             'debit': debit,
             'credit': credit,
-            'voucher_id': voucher and voucher.id,
             'goods_qty': goods_qty,
             'goods_id': goods_id and goods_id.id,
-        })
-        return voucher_line
+        }
 
     @api.multi
     def create_voucher(self):
@@ -351,29 +350,25 @@ class SellDelivery(models.Model):
         退货单生成的金额为负
         '''
         self.ensure_one()
-        voucher = self.env['voucher'].create({'date': self.date})
-
         sum_amount = 0
+        voucher_lines = []
         line_ids = self.is_return and self.line_in_ids or self.line_out_ids
         for line in line_ids:   # 发货单/退货单明细
             cost = self.is_return and -line.cost or line.cost
 
             if cost:  # 贷方明细
                 sum_amount += cost
-                self._create_voucher_line(line.goods_id.category_id.account_id,
-                                          0, cost, voucher, line.goods_id, line.goods_qty)
+                voucher_lines.append(self._get_voucher_line_vals(
+                    line.goods_id.category_id.account_id, 0, cost, line.goods_id, line.goods_qty))
             else:
                 # 缺货审核发货单时不产生出库凭证
                 continue
         if sum_amount:  # 借方明细
-            self._create_voucher_line(self.sell_move_id.finance_category_id.account_id,
-                                      sum_amount, 0, voucher, False, 0)
+            voucher_lines.append(self._get_voucher_line_vals(
+                self.sell_move_id.finance_category_id.account_id, sum_amount, 0, False, 0))
 
-        if len(voucher.line_ids) > 0:
-            voucher.voucher_done()
-            return voucher
-        else:
-            voucher.unlink()
+        if voucher_lines:
+            return self.env['voucher'].create_voucher({'date': self.date}, voucher_lines)
 
     @api.one
     def auto_reconcile_sell_order(self):
@@ -3,7 +3,7 @@
 from odoo import fields, models, api
 import odoo.addons.decimal_precision as dp
 from odoo.exceptions import UserError
-from odoo.tools import float_compare
+from odoo.tools import float_compare, float_is_zero
 
 # 销货订单审核状态可选值
 SELL_ORDER_STATES = [
@@ -16,6 +16,12 @@ READONLY_STATES = {
     'done': [('readonly', True)],
 }
 
+# 收款状态可选值：未收、部分、全部
+SELL_MONEY_STATES = {
+    'sell': (u'未收款', u'部分收款', u'全部收款'),
+    'return': (u'未退款', u'部分退款', u'全部退款'),
+}
+
 
 class SellOrder(models.Model):
     _name = 'sell.order'
@@ -56,16 +62,30 @@ class SellOrder(models.Model):
             return self.env['warehouse'].get_warehouse_by_type(
                 self.env.context.get('warehouse_type'))
 
-    @api.one
+    @api.multi
+    @api.depends('delivery_ids.invoice_id.reconciled', 'money_order_ids.state',
+                 'money_order_ids.amount', 'money_order_ids.reconciled')
     def _get_received_amount(self):
-        '''计算销货订单收款/退款状态'''
-        deliverys = self.env['sell.delivery'].search(
-            [('order_id', '=', self.id)])
-        money_order_rows = self.env['money.order'].search([('sell_id', '=', self.id),
-                                                           ('reconciled', '=', 0),
-                                                           ('state', '=', 'done')])
-        self.received_amount = sum([delivery.invoice_id.reconciled for delivery in deliverys]) +\
-            sum([order_row.amount for order_row in money_order_rows])
+        '''计算销货订单已收/已退金额：发货单结算单已核销金额加上未核销的已审核收款单金额'''
+        for order in self:
+            order.received_amount = sum(
+                order.delivery_ids.mapped('invoice_id.reconciled')) + \
+                sum(money.amount for money in order.money_order_ids
+                    if money.state == 'done' and not money.reconciled)
+
+    @api.multi
+    @api.depends('received_amount', 'amount', 'type')
+    def _get_sell_money_state(self):
+        '''返回收款/退款状态'''
+        for order in self:
+            received_amount = abs(order.received_amount)
+            if float_is_zero(received_amount, 2):
+                index = 0
+            elif float_compare(received_amount, abs(order.amount), 2) < 0:
+                index = 1
+            else:
+                index = 2
+            order.money_state = SELL_MONEY_STATES[order.type or 'sell'][index]
 
     @api.multi
     @api.depends('delivery_ids')
@@ -162,7 +182,13 @@ class SellOrder(models.Model):
         change_default=True,
         default=lambda self: self.env['res.company']._company_default_get())
     received_amount = fields.Float(
-        u'已收金额',  compute=_get_received_amount, readonly=True)
+        u'已收金额', compute=_get_received_amount, readonly=True, store=True,
+        copy=False, digits=dp.get_precision('Amount'))
+    money_state = fields.Char(u'收款状态', compute=_get_sell_money_state,
+                              store=True, default=u'未收款',
+                              help=u"销货订单的收款状态", index=True, copy=False)
+    money_order_ids = fields.One2many(
+        'money.order', 'sell_id', string=u'收款单', copy=False)
     delivery_ids = fields.One2many(
         'sell.delivery', 'order_id', string='Deliverys', copy=False)
     delivery_count = fields.Integer(
@@ -405,6 +431,15 @@ class SellOrder(models.Model):
             'target': 'current',
         }
 
+    @api.multi
+    def action_recompute_money_state(self):
+        '''重新计算已收金额和收款状态，用于修复历史数据；未选订单时计算全部订单'''
+        orders = self or self.search([])
+        for name in ('received_amount', 'money_state'):
+            self.env.add_todo(self._fields[name], orders)
+        orders.recompute()
+        return True
+
     @api.multi
     def action_view_delivery(self):
         '''
@@ -6,7 +6,12 @@ from odoo import fields, models, api
 
 class SellOrderTrack(models.TransientModel):
     _name = 'sell.order.track'
+    _inherit = 'report.materialize'
     _description = u'销售订单跟踪表'
+    _report_columns = ['goods_code', 'goods_id', 'attribute', 'uom', 'date',
+                       'order_name', 'user_id', 'partner_id', 'warehouse_id',
+                       'goods_state', 'qty', 'amount', 'qty_not_out',
+                       'delivery_date', 'wh_out_date', 'note']
 
     goods_code = fields.Char(u'商品编码')
     goods_id = fields.Many2one('goods', u'商品名称')
@@ -25,6 +30,38 @@ class SellOrderTrack(models.TransientModel):
     wh_out_date = fields.Date(u'出库日期')
     note = fields.Char(u'备注')
 
+    @api.model
+    def _get_source_query(self, domain):
+        '''
+        按销货订单行生成跟踪表行，退货订单的数量、金额取反，
+        出库日期取该行已审核的出库明细（分批出库时取第一条）
+        '''
+        line_query, params = self._domain_subquery('sell.order.line', domain)
+        return '''
+            SELECT goods.code, line.goods_id, attribute.name, uom.name,
+                   so.date, so.name, so.user_id, so.partner_id, so.warehouse_id,
+                   so.goods_state,
+                   sign.factor * line.quantity,
+                   sign.factor * line.subtotal,
+                   sign.factor * (line.quantity - COALESCE(line.quantity_out, 0)),
+                   so.delivery_date, wh_out.date, line.note
+              FROM sell_order_line line
+              JOIN sell_order so ON so.id = line.order_id
+         LEFT JOIN goods ON goods.id = line.goods_id
+         LEFT JOIN attribute ON attribute.id = line.attribute_id
+         LEFT JOIN uom ON uom.id = line.uom_id
+        CROSS JOIN LATERAL (
+                   SELECT CASE WHEN so.type = 'sell' THEN 1 ELSE -1 END AS factor
+                   ) sign
+         LEFT JOIN LATERAL (
+                   SELECT wml.date FROM wh_move_line wml
+                    WHERE wml.sell_line_id = line.id AND wml.state = 'done'
+                 ORDER BY wml.lot, wml.id LIMIT 1
+                   ) wh_out ON TRUE
+             WHERE line.id IN (%s)
+          ORDER BY line.goods_id, line.id
+        ''' % line_query, params
+
     @api.multi
     def view_detail(self):
         '''查看明细按钮'''
@@ -6,6 +6,7 @@ from odoo import fields, models, api
 
 class SellReceipt(models.TransientModel):
     _name = 'sell.receipt'
+    _inherit = 'report.materialize'
     _description = u'销售收款一览表'
 
     c_category_id = fields.Many2one('core.category', u'客户类别')
@@ -150,6 +150,19 @@ class TestTrackWizard(TransactionCase):
         self.track.warehouse_id = self.env.ref('warehouse.hd_stock').id
         self.track.button_ok()
 
+    def test_button_ok_run_tag(self):
+        '''测试销售订单跟踪表  按生成批次打开，每个订单行一条，退货取反'''
+        domain = self.track.button_ok()['domain']
+        tracks = self.env['sell.order.track'].search(domain)
+        lines = self.env['sell.order.line'].search(self.track._get_domain())
+        self.assertEqual(len(tracks), len(lines))
+        self.assertEqual(sum(tracks.mapped('amount')),
+                         sum(line.order_id.type == 'sell' and line.subtotal or -line.subtotal
+                             for line in lines))
+        # 再次生成的行不在上次的批次中
+        self.assertNotEqual(self.track.button_ok()['domain'], domain)
+        self.assertEqual(len(self.env['sell.order.track'].search(domain)), len(lines))
+
     def test_view_detail(self):
         '''测试销售订单跟踪表  查看明细按钮'''
 
@@ -483,6 +496,8 @@ class TestReceiptWizard(TransactionCase):
 
         receipt_line = self.env['sell.receipt'].search(
             [('order_name', '=', self.delivery.name)])
+        # 已收款为已审核收款单对发货单结算单的核销金额
+        self.assertEqual(receipt_line.receipt, self.delivery.invoice_id.reconciled)
         for line in receipt_line:
             line.view_detail()
         receipt_line2 = self.env['sell.receipt'].search(
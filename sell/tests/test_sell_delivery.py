@@ -335,6 +335,30 @@ class TestSellDelivery(TransactionCase):
         self.delivery.currency_id = self.env.ref('base.USD')
         self.delivery.sell_delivery_done()
 
+    def test_batch_approve(self):
+        """批量审核：相同商品的发货单分在同一组，失败的单据记录原因"""
+        delivery = self.delivery.copy()
+        delivery.line_out_ids.write({'goods_qty': 100000})
+        records = self.delivery | delivery
+        wizard = self.env['batch.approve.wizard'].with_context({
+            'active_model': 'sell.delivery',
+            'active_ids': records.ids}).create({})
+        batch = self.env['batch.approve'].browse(wizard.create_batch()['res_id'])
+        self.assertEqual(len(set(batch.line_ids.mapped('group_no'))), 1)
+        self.env['batch.approve'].run_jobs()
+        batch.invalidate_cache()
+        self.assertEqual(batch.state, 'done')
+        self.assertEqual(self.delivery.state, 'done')
+        self.assertEqual(batch.done_count, 1)
+        self.assertEqual(batch.failed_count, 1)
+        self.assertEqual(batch.progress, 100)
+        self.assertTrue(batch.line_ids.filtered(
+            lambda line: line.state == 'failed').message)
+        # 失败单据重新排队
+        batch.retry_failed()
+        self.assertEqual(batch.state, 'running')
+        self.assertEqual(batch.failed_count, 0)
+
 
 class TestWhMoveLine(TransactionCase):
 
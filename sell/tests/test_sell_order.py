@@ -174,6 +174,30 @@ class TestSellOrder(TransactionCase):
         with self.assertRaises(UserError):
             self.order.sell_order_draft()
 
+    def test_received_amount_stored(self):
+        ''' 测试 已收金额和收款状态存储在订单上，可按收款状态搜索，可重新计算修复 '''
+        bank_account = self.env.ref('core.alipay')
+        bank_account.balance = 1000000
+        self.order.pre_receipt = 50.0
+        self.order.bank_account_id = bank_account
+        self.order.sell_order_done()
+        self.assertEqual(len(self.order.money_order_ids), 1)
+        received_amount = self.order.received_amount
+        money_state = self.order.money_state
+        self.assertIn(money_state, [u'未收款', u'部分收款'])
+        self.assertEqual(self.env['sell.order'].search(
+            [('id', '=', self.order.id), ('money_state', '=', money_state)]),
+            self.order)
+
+        # 数据被改乱后重新计算
+        self.env.cr.execute("UPDATE sell_order SET received_amount = 1, "
+                            "money_state = %s WHERE id = %s",
+                            (u'全部收款', self.order.id))
+        self.order.invalidate_cache()
+        self.order.action_recompute_money_state()
+        self.assertEqual(self.order.received_amount, received_amount)
+        self.assertEqual(self.order.money_state, money_state)
+
 
 class TestSellOrderLine(TransactionCase):
 
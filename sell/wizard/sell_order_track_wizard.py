@@ -51,70 +51,18 @@ class SellOrderTrackWizard(models.TransientModel):
             domain.append(('order_id.warehouse_id', '=', self.warehouse_id.id))
         return domain
 
-    def _get_wh_out_date(self, line):
-        '''对于一个 sell order line，返回一个出库日期'''
-        wh_out_date = None
-        wh_move_line = self.env['wh.move.line'].search([
-            ('sell_line_id', '=', line.id),
-            ('state', '=', 'done'),
-        ])
-        if len(wh_move_line) > 1:  # 如果是分批出库，则出库单明细行上的sell_line_id相同
-            wh_out_date = wh_move_line[0].date
-        else:
-            wh_out_date = wh_move_line.date
-        return wh_out_date
-
-    def _prepare_track_line(self, line, qty, amount, qty_not_out):
-        '''返回跟踪表明细行（非小计行）'''
-        return {
-            'goods_code': line.goods_id.code,
-            'goods_id': line.goods_id.id,
-            'attribute': line.attribute_id.name,
-            'uom': line.uom_id.name,
-            'date': line.order_id.date,
-            'order_name': line.order_id.name,
-            'user_id': line.order_id.user_id.id,
-            'partner_id': line.order_id.partner_id.id,
-            'warehouse_id': line.order_id.warehouse_id.id,
-            'goods_state': line.order_id.goods_state,
-            'qty': qty,
-            'amount': amount,
-            'qty_not_out': qty_not_out,
-            'delivery_date': line.order_id.delivery_date,
-            'wh_out_date': self._get_wh_out_date(line),  # 出库日期
-            'note': line.note,
-        }
-
     @api.multi
     def button_ok(self):
         self.ensure_one()
-        res = []
         if self.date_end < self.date_start:
             raise UserError(u'开始日期不能大于结束日期！\n所选开始日期:%s 所选结束日期:%s' %
                             (self.date_start, self.date_end))
 
-        sell_order_line = self.env['sell.order.line']
-        for line in sell_order_line.search(self._get_domain(), order='goods_id'):
-            is_sell = line.order_id.type == 'sell' and 1 or -1  # 是否销货订单
-            # 以下分别为明细行上数量、销售额、未出库数量，退货时均取反
-            qty = is_sell * line.quantity
-            amount = is_sell * line.subtotal
-            qty_not_out = is_sell * (line.quantity - line.quantity_out)
-
-            # 创建跟踪表明细行（非小计行）
-            track = self.env['sell.order.track'].create(
-                self._prepare_track_line(line, qty, amount, qty_not_out))
-            res.append(track.id)
+        # 一条 INSERT ... SELECT 生成跟踪表明细行
+        track = self.env['sell.order.track']
+        run_tag = track.materialize_query(
+            *track._get_source_query(self._get_domain()))
 
         view = self.env.ref('sell.sell_order_track_tree')
-        return {
-            'name': u'销售订单跟踪表',
-            'view_type': 'form',
-            'view_mode': 'tree',
-            'view_id': False,
-            'views': [(view.id, 'tree')],
-            'res_model': 'sell.order.track',
-            'type': 'ir.actions.act_window',
-            'domain': [('id', 'in', res)],
-            'limit': 65535,
-        }
+        return track.get_run_action(
+            run_tag, u'销售订单跟踪表', [(view.id, 'tree')], limit=65535)
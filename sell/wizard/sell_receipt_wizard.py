@@ -55,17 +55,17 @@ class SellReceiptWizard(models.TransientModel):
                      ('warehouse_dest_id', '=', self.warehouse_id.id)]
         return cond
 
-    def _compute_receipt(self, delivery):
-        '''计算该发货单的已收款'''
-        receipt = 0
-        for order in self.env['money.order'].search(
-                [('state', '=', 'done')], order='name'):
-            for source in order.source_ids:
-                if source.name.name == delivery.name:
-                    receipt += source.this_reconcile
-        return receipt
+    def _compute_receipt(self, delivery, receipts=None):
+        '''
+        计算该发货单的已收款
+        :param receipts: get_reconciled_by_invoice 返回的 {结算单id: 已收款}，不传时单独查询
+        '''
+        if receipts is None:
+            receipts = self.env['source.order.line'].get_reconciled_by_invoice(
+                delivery.invoice_id.ids)
+        return receipts.get(delivery.invoice_id.id, 0)
 
-    def _prepare_sell_receipt(self, delivery):
+    def _prepare_sell_receipt(self, delivery, receipts=None):
         '''对于传入的发货单/退货单，为创建销售收款一览表准备数据'''
         self.ensure_one()
         factor = delivery.is_return and -1 or 1  # 如果是退货则金额均取反
@@ -76,7 +76,7 @@ class SellReceiptWizard(models.TransientModel):
         order_type = not delivery.is_return and u'普通销售' or u'销售退回'
         warehouse = not delivery.is_return and delivery.warehouse_id or delivery.warehouse_dest_id
         # 计算该发货单的已收款
-        receipt = self._compute_receipt(delivery)
+        receipt = self._compute_receipt(delivery, receipts)
         # 计算回款率
         receipt_rate = (amount + partner_cost) != 0 and (receipt /
                                                          (amount + partner_cost)) * 100 or 0
@@ -101,23 +101,20 @@ class SellReceiptWizard(models.TransientModel):
     @api.multi
     def button_ok(self):
         self.ensure_one()
-        res = []
         if self.date_end < self.date_start:
             raise UserError(u'开始日期不能大于结束日期！\n 所选的开始日期:%s 结束日期:%s' %
                             (self.date_start, self.date_end))
 
-        delivery_obj = self.env['sell.delivery']
-        for delivery in delivery_obj.search(self._get_domain(), order='partner_id'):
-            # 用查找到的发货单信息来创建一览表
-            line = self.env['sell.receipt'].create(
-                self._prepare_sell_receipt(delivery))
-            res.append(line.id)
+        deliveries = self.env['sell.delivery'].search(
+            self._get_domain(), order='partner_id')
+        # 所有发货单的已收款一次查出
+        receipts = self.env['source.order.line'].get_reconciled_by_invoice(
+            deliveries.mapped('invoice_id').ids)
+        # 用查找到的发货单信息来创建一览表
+        report = self.env['sell.receipt']
+        run_tag = report.materialize_rows(
+            [self._prepare_sell_receipt(delivery, receipts)
+             for delivery in deliveries])
 
-        return {
-            'name': u'销售收款一览表',
-            'view_mode': 'tree',
-            'res_model': 'sell.receipt',
-            'type': 'ir.actions.act_window',
-            'domain': [('id', 'in', res)],
-            'limit': 65535,
-        }
+        return report.get_run_action(
+            run_tag, u'销售收款一览表', [(False, 'tree')], limit=65535)
@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from odoo import models, api
-from odoo import osv, fields
-from datetime import datetime
 
 
 class MailMessage(models.Model):
@@ -12,21 +10,14 @@ class MailMessage(models.Model):
     @api.model
     def staff_birthday_message(self):
         '''员工生日当天，whole company 会收到祝福信息'''
-        newid = []
-        staff_obj = self.env.get("staff")
-
-        for staff in staff_obj.search([]):
-            if not staff.birthday:
-                continue
-            # 获取当前月日     和    员工生日
-            now = datetime.now().strftime("%m-%d")
-            staff_bir = staff.birthday[5:]
-            if now == staff_bir:
-                values = {}
-                # 创建一条祝福信息
-                values['subject'] = u"生日快乐！"
-                values['model'] = "mail.channel"
-                values['body'] = staff.name + u"，祝你生日快乐!"
-                values['res_id'] = 1
-                newid.append(self.create(values))
-        return newid
+        messages = self.browse()
+        # 按生日月日索引只取当天生日的员工
+        for staff in self.env['staff'].get_birthday_staff():
+            # 创建一条祝福信息
+            messages |= self.create({
+                'subject': u"生日快乐！",
+                'model': "mail.channel",
+                'body': staff.name + u"，祝你生日快乐!",
+                'res_id': 1,
+            })
+        return messages
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 from odoo import fields, models, api, tools, modules
-from datetime import datetime
+import calendar
 from odoo.exceptions import UserError
 
+# 生日的月日，用于表达式索引和按月日查询（如 3 月 8 日为 308）
+BIRTHDAY_MONTH_DAY = '(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday))'
+
 
 class StaffDepartment(models.Model):
     _name = "staff.department"
@@ -156,20 +159,64 @@ class Staff(models.Model):
     bank_name = fields.Char(u'开户行')
     bank_num = fields.Char(u'银行账号')
 
+    @api.model_cr
+    def init(self):
+        ''' 生日按月日建表达式索引，生日提醒只取当天生日的员工 '''
+        self._cr.execute(
+            "SELECT indexname FROM pg_indexes WHERE indexname = 'staff_birthday_month_day_idx'")
+        if not self._cr.fetchone():
+            self._cr.execute('''CREATE INDEX staff_birthday_month_day_idx
+                                ON staff (%s) WHERE birthday IS NOT NULL''' % BIRTHDAY_MONTH_DAY)
+
+    @api.model
+    def get_birthday_staff(self, date=None):
+        '''
+        取某天（默认今天）生日的在职员工，
+        平年的 2 月 28 日同时包含 2 月 29 日生日的员工
+        '''
+        date = fields.Date.from_string(date or fields.Date.context_today(self))
+        month_days = [date.month * 100 + date.day]
+        if (date.month, date.day) == (2, 28) and not calendar.isleap(date.year):
+            month_days.append(229)
+        self.env.cr.execute('''
+            SELECT id FROM staff
+             WHERE birthday IS NOT NULL
+               AND active
+               AND %s IN %%s
+          ORDER BY id
+        ''' % BIRTHDAY_MONTH_DAY, (tuple(month_days),))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def queue_template_mails(self, template, res_ids):
+        '''
+        一次渲染模板对应的所有邮件并放入邮件队列，由邮件队列定时任务发送
+        :return: 新建的 mail.mail
+        '''
+        mails = self.env['mail.mail']
+        if not res_ids:
+            return mails
+        results = template.generate_email(list(res_ids))
+        for res_id in res_ids:
+            values = results[res_id]
+            values['recipient_ids'] = [(4, pid) for pid in values.pop('partner_ids', [])]
+            values['attachment_ids'] = [(6, 0, values.pop('attachment_ids', []))]
+            values.pop('attachments', None)
+            if 'email_from' in values and not values.get('email_from'):
+                values.pop('email_from')
+            mails |= mails.create(values)
+        return mails
+
     @api.model
     def staff_contract_over_date(self):
-        # 员工合同到期，发送邮件给员工 和 部门经理（如果存在）
-        now = datetime.now().strftime("%Y-%m-%d")
-        for Staff in self.search([]):
-            if not Staff.contract_ids:
-                continue
-
-            for contract in Staff.contract_ids:
-                if now == contract.over_date:
-                    self.env.ref('staff.contract_over_due_date_employee').send_mail(
-                        self.env.user.id)
-                    if Staff.parent_id and Staff.parent_id.work_email:
-                        self.env.ref('staff.contract_over_due_date_manager').send_mail(
-                            self.env.user.id)
-
-        return
+        ''' 员工合同到期，发送邮件给员工 和 部门经理（如果存在） '''
+        today = fields.Date.context_today(self)
+        staffs = self.env['staff.contract'].search(
+            [('over_date', '=', today)]).mapped('staff_id')
+        mails = self.queue_template_mails(
+            self.env.ref('staff.contract_over_due_date_employee'),
+            staffs.filtered(lambda staff: staff.work_email).ids)
+        mails |= self.queue_template_mails(
+            self.env.ref('staff.contract_over_due_date_manager'),
+            staffs.filtered(lambda staff: staff.parent_id.work_email).ids)
+        return mails
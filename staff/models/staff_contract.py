@@ -8,7 +8,7 @@ class StaffContract(models.Model):
 
     staff_id = fields.Many2one('staff', u'员工', required=True)
 
-    over_date = fields.Date(u'到期日', required=True)
+    over_date = fields.Date(u'到期日', required=True, index=True)
     basic_wage = fields.Float(u'基础工资')
     endowment = fields.Float(u'个人养老保险')
     health = fields.Float(u'个人医疗保险')
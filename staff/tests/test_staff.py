@@ -42,7 +42,12 @@ class TestStaff(TransactionCase):
         # has staff.contract_ids and apartment manager
         self.env.ref('staff.staff_1').work_email = 'admin@sina.com.cn'
         staff_lily.parent_id = self.env.ref('staff.staff_1').id
-        self.env['staff'].staff_contract_over_date()
+        mails = self.env['staff'].staff_contract_over_date()
+        # 员工和部门经理的邮件各一封，放入邮件队列
+        self.assertEqual(mails.mapped('email_to'),
+                         ['lili@sina.com.cn', 'admin@sina.com.cn'])
+        self.assertEqual(set(mails.mapped('res_id')), set([staff_lily.id]))
+        self.assertEqual(set(mails.mapped('state')), set(['outgoing']))
 
 
 class TestStaffDepartment(TransactionCase):
@@ -77,7 +82,16 @@ class TestMailMessage(TransactionCase):
         job.nextcall = (datetime.now() + timedelta(hours=8)
                         ).strftime('%Y-%m-%d %H:%M:%S')
         job.doall = True
-        self.env['mail.message'].staff_birthday_message()
+        messages = self.env['mail.message'].staff_birthday_message()
+        self.assertTrue(any(self.staff.name + u"，祝你生日快乐!" in body
+                            for body in messages.mapped('body')))
+
+    def test_get_birthday_staff(self):
+        '''测试：平年 2 月 28 日包含 2 月 29 日生日的员工'''
+        self.staff.birthday = '1996-02-29'
+        self.assertTrue(self.staff in self.env['staff'].get_birthday_staff('2017-02-28'))
+        self.assertFalse(self.staff in self.env['staff'].get_birthday_staff('2016-02-28'))
+        self.assertTrue(self.staff in self.env['staff'].get_birthday_staff('2016-02-29'))
 
 
 class TestResUsers(TransactionCase):
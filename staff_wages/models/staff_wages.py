@@ -121,7 +121,6 @@ class StaffWages(models.Model):
         if not self.voucher_id:
             # 生成并审核计提凭证
             voucher = self.create_voucher(self.date)
-            voucher.voucher_done()
             self.voucher_id = voucher.id
         else:
             # 如计提凭证已存在，判断当前期间是否与工资期间相同
@@ -131,7 +130,6 @@ class StaffWages(models.Model):
                 voucher, self.voucher_id = self.voucher_id, False
                 self.voucher_unlink(voucher)
                 voucher = self.create_voucher(self.date)
-                voucher.voucher_done()
                 self.voucher_id = voucher.id
             else:
                 # 如不同，生成并审核修正凭证
@@ -149,53 +147,42 @@ class StaffWages(models.Model):
             # 如果修正计提凭证存在，则删除后重新生成修正计提凭证
             change_voucher, self.change_voucher_id = self.change_voucher_id, False
             self.voucher_unlink(change_voucher)
-        change_voucher = self.create_voucher(date)
-        for change_line in change_voucher.line_ids:
+        change_lines = self.get_voucher_lines()
+        for change_line in change_lines:
             for before_line in before_voucher.line_ids:
-                if change_line.account_id == before_line.account_id \
-                        and change_line.auxiliary_id == before_line.auxiliary_id:
-                    change_line.credit -= before_line.credit
-                    change_line.debit -= before_line.debit
-                    continue
-
-        for change_line in change_voucher.line_ids:
-            if change_line.credit == 0 and change_line.debit == 0:
-                change_line.unlink()
-
-        if not change_voucher.line_ids:
-            change_voucher.unlink()
-        else:
-            change_voucher.voucher_done()
+                if change_line['account_id'] == before_line.account_id.id \
+                        and (change_line.get('auxiliary_id') or False) == before_line.auxiliary_id.id:
+                    change_line['credit'] = change_line.get('credit', 0) - before_line.credit
+                    change_line['debit'] = change_line.get('debit', 0) - before_line.debit
+
+        change_lines = [change_line for change_line in change_lines
+                        if change_line.get('credit') or change_line.get('debit')]
+        if change_lines:
+            change_voucher = self.env['voucher'].create_voucher({'date': date}, change_lines)
             self.write({'change_voucher_id': change_voucher.id})
 
-    def create_credit_line(self, voucher, name, account, credit, auxiliary_id):
+    def credit_line_vals(self, name, account, credit, auxiliary_id):
         """
-        生成贷方行
-        :param voucher: 凭证
+        贷方行的值
         :param name: 摘要
         :param account: 借方科目
         :param credit: 贷方金额
         :return:
         """
-        vals = {
-            'voucher_id': voucher.id,
+        return {
             'name': name,
             'account_id': account.id,
             'credit': credit,
             'auxiliary_id': auxiliary_id and auxiliary_id.id,
         }
-        voucher_line = self.env['voucher.line'].create(vals)
-        return voucher_line
 
     @api.multi
-    def create_voucher(self, date):
+    def get_voucher_lines(self):
         """
-        生成并审核计提凭证
-        :param date: 一个日期
-        :return:
+        计提凭证行的值
+        :return: 凭证行值的列表
         """
         self.ensure_one()
-        vouch_obj = self.env['voucher'].create({'date': date})
         credit_account = self.env.ref('staff_wages.staff_wages')
         res = {}
         for line in self.line_ids:
@@ -210,15 +197,13 @@ class StaffWages(models.Model):
                 'debit': val.get('debit') + line.all_wage + line.housing_fund_co
                 + line.endowment_co + line.health_co + line.unemployment_co
                 + line.injury + line.maternity,
-                'voucher_id': vouch_obj.id,
                 'account_id': debit_account.id,
                 'name': u'提本月工资'})
 
-        # 生成借方凭证行
-        for account_id, val in res.iteritems():
-            self.env['voucher.line'].create(
-                dict(val, account_id=account_id.id))
-        # 生成贷方凭证行
+        # 借方凭证行
+        voucher_lines = [dict(val, account_id=account_id.id)
+                         for account_id, val in res.iteritems()]
+        # 贷方凭证行
         endowment_co = self.env.ref(
             'staff_wages.categ_endowment_co')  # 公司缴纳养老类别
         health_co = self.env.ref('staff_wages.categ_health_co')  # 公司缴纳医疗类别
@@ -229,21 +214,33 @@ class StaffWages(models.Model):
         housing_co = self.env.ref(
             'staff_wages.categ_housing_fund_co')  # 公司缴纳住房公积金类别
         for line in self.line_ids:
-            self.create_credit_line(
-                vouch_obj, u'提本月工资', credit_account.account_id, line.all_wage, line.name.auxiliary_id)
-        self.create_credit_line(
-            vouch_obj, u'提本月养老保险', endowment_co.account_id, self.totoal_endowment_co, False)
-        self.create_credit_line(
-            vouch_obj, u'提本月医疗保险', health_co.account_id, self.totoal_health_co, False)
-        self.create_credit_line(
-            vouch_obj, u'提本月失业保险', unemployment_co.account_id, self.totoal_unemployment_co, False)
-        self.create_credit_line(
-            vouch_obj, u'提本月生育保险', maternity.account_id, self.totoal_maternity, False)
-        self.create_credit_line(vouch_obj, u'提本月工伤保险',
-                                injury.account_id, self.totoal_injury, False)
-        self.create_credit_line(
-            vouch_obj, u'提本月公积金', housing_co.account_id, self.totoal_housing_fund_co, False)
-        return vouch_obj
+            voucher_lines.append(self.credit_line_vals(
+                u'提本月工资', credit_account.account_id, line.all_wage, line.name.auxiliary_id))
+        voucher_lines += [
+            self.credit_line_vals(
+                u'提本月养老保险', endowment_co.account_id, self.totoal_endowment_co, False),
+            self.credit_line_vals(
+                u'提本月医疗保险', health_co.account_id, self.totoal_health_co, False),
+            self.credit_line_vals(
+                u'提本月失业保险', unemployment_co.account_id, self.totoal_unemployment_co, False),
+            self.credit_line_vals(
+                u'提本月生育保险', maternity.account_id, self.totoal_maternity, False),
+            self.credit_line_vals(
+                u'提本月工伤保险', injury.account_id, self.totoal_injury, False),
+            self.credit_line_vals(
+                u'提本月公积金', housing_co.account_id, self.totoal_housing_fund_co, False),
+        ]
+        return voucher_lines
+
+    @api.multi
+    def create_voucher(self, date):
+        """
+        生成并审核计提凭证
+        :param date: 一个日期
+        :return:
+        """
+        self.ensure_one()
+        return self.env['voucher'].create_voucher({'date': date}, self.get_voucher_lines())
 
     @api.multi
     def _other_pay(self):
@@ -26,13 +26,6 @@ class Project(models.Model):
     _inherits = {'auxiliary.financing': 'auxiliary_id'}
     _inherit = ['mail.thread']
 
-    @api.multi
-    def _compute_hours(self):
-        '''计算项目的实际工时'''
-        for Project in self:
-            for Task in Project.task_ids:
-                Project.hours += Task.hours
-
     auxiliary_id = fields.Many2one(
         string=u'辅助核算',
         comodel_name='auxiliary.financing',
@@ -60,12 +53,31 @@ class Project(models.Model):
 
     plan_hours = fields.Float(u'计划工时',
                               track_visibility='onchange')
-    hours = fields.Float(u'实际工时',
-                         compute=_compute_hours)
+    hours = fields.Float(u'实际工时', readonly=True, copy=False,
+                         help=u'项目下各任务实际工时的合计，工作记录变化时更新')
     address = fields.Char(u'地址')
     note = fields.Text(u'备注')
     active = fields.Boolean(u'启用', default=True)
 
+    @api.model
+    def refresh_hours(self, project_ids):
+        ''' 用一条分组更新重算项目的实际工时 '''
+        project_ids = [project_id for project_id in set(project_ids) if project_id]
+        if not project_ids:
+            return
+        self.env.cr.execute('''
+            UPDATE project
+               SET hours = COALESCE(total.hours, 0)
+              FROM (SELECT project.id, SUM(task.hours) AS hours
+                      FROM project
+                 LEFT JOIN task ON task.project_id = project.id
+                     WHERE project.id IN %s
+                  GROUP BY project.id) total
+             WHERE project.id = total.id
+               AND project.hours IS DISTINCT FROM COALESCE(total.hours, 0)
+        ''', (tuple(project_ids),))
+        self.invalidate_cache(['hours'], project_ids)
+
 
 class ProjectInvoice(models.Model):
     _name = 'project.invoice'
@@ -164,18 +176,10 @@ class Task(models.Model):
     _inherit = ['mail.thread']
     _order = 'sequence, priority desc, id'
 
-    @api.multi
-    def _compute_hours(self):
-        '''计算任务的实际工时'''
-        for Task in self:
-            for line in Task.timeline_ids:
-                Task.hours += line.hours
-
     def _default_status_impl(self):
         '''任务阶段默认值的实现方法'''
-        status_id = self.env['task.status'].search(
-            [('state', '=', 'doing')])
-        return status_id and status_id[0]
+        return self.env['task.status'].search(
+            [('state', '=', 'doing')], limit=1)
 
     @api.model
     def _default_status(self):
@@ -191,12 +195,14 @@ class Task(models.Model):
         string=u'指派给',
         comodel_name='res.users',
         track_visibility='onchange',
+        index=True,
     )
 
     project_id = fields.Many2one(
         string=u'项目',
         comodel_name='project',
         ondelete='cascade',
+        index=True,
     )
 
     timeline_ids = fields.One2many(
@@ -223,10 +229,11 @@ class Task(models.Model):
         string=u'状态',
         default=_default_status,
         track_visibility='onchange',
+        index=True,
     )
     plan_hours = fields.Float(u'计划工时')
-    hours = fields.Float(u'实际工时',
-                         compute=_compute_hours)
+    hours = fields.Float(u'实际工时', readonly=True, copy=False,
+                         help=u'各工作记录小时数的合计，工作记录变化时更新')
     sequence = fields.Integer(u'顺序')
     is_schedule = fields.Boolean(u'列入计划')
     note = fields.Text(u'描述')
@@ -246,6 +253,44 @@ class Task(models.Model):
                                domain=[('type', '=', 'task_tag')],
                                context={'type': 'task_tag'})
 
+    @api.model
+    def refresh_hours(self, task_ids):
+        ''' 用一条分组更新重算任务的实际工时，并重算所属项目的实际工时 '''
+        task_ids = [task_id for task_id in set(task_ids) if task_id]
+        if not task_ids:
+            return
+        self.env.cr.execute('''
+            UPDATE task
+               SET hours = COALESCE(total.hours, 0)
+              FROM (SELECT task.id, SUM(timeline.hours) AS hours
+                      FROM task
+                 LEFT JOIN timeline ON timeline.task_id = task.id
+                     WHERE task.id IN %s
+                  GROUP BY task.id) total
+             WHERE task.id = total.id
+               AND task.hours IS DISTINCT FROM COALESCE(total.hours, 0)
+        ''', (tuple(task_ids),))
+        self.invalidate_cache(['hours'], task_ids)
+        self.env.cr.execute(
+            'SELECT DISTINCT project_id FROM task WHERE id IN %s', (tuple(task_ids),))
+        self.env['project'].refresh_hours([row[0] for row in self.env.cr.fetchall()])
+
+    @api.multi
+    def write(self, vals):
+        ''' 任务换项目时重算新旧项目的实际工时 '''
+        project_ids = 'project_id' in vals and self.mapped('project_id').ids
+        res = super(Task, self).write(vals)
+        if project_ids is not False:
+            self.env['project'].refresh_hours(project_ids + [vals['project_id']])
+        return res
+
+    @api.multi
+    def unlink(self):
+        project_ids = self.mapped('project_id').ids
+        res = super(Task, self).unlink()
+        self.env['project'].refresh_hours(project_ids)
+        return res
+
     @api.multi
     def assign_to_me(self):
         '''将任务指派给自己，并修改状态'''
@@ -389,6 +434,21 @@ class Timeline(models.Model):
         default=lambda self: self.env['res.company']._company_default_get()
     )
 
+    @api.model_cr
+    def init(self):
+        '''
+        安装或升级时重算所有任务和项目的实际工时。
+        工作记录是三个模型中最后建表的，此时 task、timeline 表和 hours 列都已存在
+        '''
+        self._cr.execute('''
+            UPDATE task SET hours = COALESCE((
+                SELECT SUM(timeline.hours) FROM timeline WHERE timeline.task_id = task.id), 0)
+        ''')
+        self._cr.execute('''
+            UPDATE project SET hours = COALESCE((
+                SELECT SUM(task.hours) FROM task WHERE task.project_id = project.id), 0)
+        ''')
+
     @api.model
     def create(self, vals):
         '''创建工作记录时，更新对应task的status等字段'''
@@ -407,4 +467,21 @@ class Timeline(models.Model):
             Task.write({'next_datetime': next_datetime})
         if user_id:
             Task.write({'user_id': user_id})
+        self.env['task'].refresh_hours(res.task_id.ids)
+        return res
+
+    @api.multi
+    def write(self, vals):
+        ''' 小时数或任务变化时重算相关任务的实际工时 '''
+        task_ids = ('hours' in vals or 'task_id' in vals) and self.mapped('task_id').ids
+        res = super(Timeline, self).write(vals)
+        if task_ids is not False:
+            self.env['task'].refresh_hours(task_ids + self.mapped('task_id').ids)
+        return res
+
+    @api.multi
+    def unlink(self):
+        task_ids = self.mapped('task_id').ids
+        res = super(Timeline, self).unlink()
+        self.env['task'].refresh_hours(task_ids)
         return res
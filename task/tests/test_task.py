@@ -112,3 +112,25 @@ class TestProject(TransactionCase):
     def test_compute_hours(self):
         '''计算项目的实际工时'''
         self.assertTrue(self.project_id.hours == 1)
+
+    def test_refresh_hours(self):
+        '''工作记录增删改时更新任务和项目的实际工时'''
+        task = self.env.ref('task.task_sell')
+        timeline = self.env['timeline'].create({
+            'task_id': task.id,
+            'just_done': u'测试工时',
+            'hours': 2,
+        })
+        self.assertEqual(task.hours, 3)
+        self.assertEqual(self.project_id.hours, 3)
+        timeline.hours = 1.5
+        self.assertEqual(task.hours, 2.5)
+        self.assertEqual(self.project_id.hours, 2.5)
+        timeline.unlink()
+        self.assertEqual(task.hours, 1)
+        self.assertEqual(self.project_id.hours, 1)
+        # 任务换项目时，原项目的实际工时减少
+        project = self.project_id.copy({'name': u'测试项目'})
+        task.project_id = project
+        self.assertEqual(self.project_id.hours, 0)
+        self.assertEqual(project.hours, 1)
@@ -50,12 +50,16 @@
         'wizard/save_bom_view.xml',
         'wizard/stock_transceive_wizard_view.xml',
         'wizard/non_active_report_wizard.xml',
+        'wizard/batch_approve_wizard_view.xml',
         'view/assets_backend.xml',
         'view/warehouse_view.xml',
         'view/inventory_view.xml',
         'view/production_view.xml',
         'view/res_company.xml',
         'view/qc_rule.xml',
+        'view/batch_approve_view.xml',
+        'view/stock_aging_view.xml',
+        'view/lot_index_view.xml',
         'report/report_data.xml',
         'report/stock_balance_view.xml',
         'report/stock_transceive_view.xml',
@@ -63,6 +67,10 @@
         'action/warehouse_action.xml',
         'menu/warehouse_menu.xml',
         'data/sequence.xml',
+        'data/batch_approve_data.xml',
+        'data/stock_balance_data.xml',
+        'data/stock_aging_data.xml',
+        'data/lot_index_data.xml',
         'security/ir.model.access.csv',
         'data/home_page_data.xml',
     ],
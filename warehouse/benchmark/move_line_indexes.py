@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+'''
+wh_move_line 库存热点查询索引基准测试
+
+在一个事务中插入大量模拟的出入库明细，对每个热点查询分别在
+    without  删除 WH_MOVE_LINE_INDEXES 中的索引
+    with     保留索引
+两种情况下记录执行计划和耗时。
+
+用法：
+    python move_line_indexes.py -c /etc/odoo.conf -d gooderp --rows 3000000
+
+结束时回滚事务，模拟数据和删除的索引都不会保留。
+'''
+import argparse
+import time
+
+import odoo
+from odoo.addons.warehouse.models.warehouse_move_line import WH_MOVE_LINE_INDEXES
+
+# (查询名, 语句)，参数由 seed 返回
+HOT_QUERIES = [
+    ('fifo_matching', '''
+        SELECT id, qty_remaining FROM wh_move_line
+         WHERE qty_remaining > 0 AND state = 'done'
+           AND goods_id = %(goods_id)s AND warehouse_dest_id = %(warehouse_id)s
+           AND attribute_id IS NULL
+      ORDER BY location_id, expiration_date, cost_time, id
+    '''),
+    ('goods_stock_qty', '''
+        SELECT SUM(qty_remaining) FROM wh_move_line
+         WHERE qty_remaining > 0 AND state = 'done' AND goods_id = %(goods_id)s
+    '''),
+    ('warehouse_stock_qty', '''
+        SELECT goods_id, SUM(qty_remaining) FROM wh_move_line
+         WHERE qty_remaining > 0 AND state = 'done'
+           AND warehouse_dest_id = %(warehouse_id)s
+      GROUP BY goods_id
+    '''),
+    ('last_cost', '''
+        SELECT id, cost_unit FROM wh_move_line
+         WHERE state = 'done' AND goods_id = %(goods_id)s
+           AND warehouse_dest_id = %(warehouse_id)s
+      ORDER BY cost_time DESC, id DESC LIMIT 1
+    '''),
+    ('transceive_month', '''
+        SELECT goods_id, SUM(goods_qty), SUM(cost) FROM wh_move_line
+         WHERE state = 'done' AND date >= %(date_start)s AND date < %(date_end)s
+           AND warehouse_dest_id = %(warehouse_id)s
+      GROUP BY goods_id
+    '''),
+    ('issue_cost_month', '''
+        SELECT goods_id, type, SUM(goods_qty), SUM(cost) FROM wh_move_line
+         WHERE state = 'done' AND date >= %(date_start)s AND date <= %(date_end)s
+      GROUP BY goods_id, type
+    '''),
+]
+
+
+def seed(cr, rows):
+    ''' 用一条 INSERT ... SELECT 把模拟明细分布到现有商品和仓库：约三分之一为出库，入库行有一半未出完 '''
+    cr.execute("SELECT id FROM warehouse WHERE type = 'stock' ORDER BY id")
+    stock_ids = [row[0] for row in cr.fetchall()]
+    cr.execute("SELECT id FROM warehouse WHERE type != 'stock' ORDER BY id LIMIT 1")
+    other_id = cr.fetchone()[0]
+    cr.execute('SELECT id FROM goods ORDER BY id')
+    goods_ids = [row[0] for row in cr.fetchall()]
+    start = time.time()
+    cr.execute('''
+        INSERT INTO wh_move_line
+               (type, state, goods_id, warehouse_id, warehouse_dest_id,
+                goods_qty, cost_unit, cost, qty_remaining, date, cost_time)
+        SELECT CASE WHEN n %% 3 = 0 THEN 'out' ELSE 'in' END,
+               CASE WHEN n %% 20 = 0 THEN 'draft' ELSE 'done' END,
+               (%(goods_ids)s)[1 + n %% %(goods_count)s],
+               CASE WHEN n %% 3 = 0 THEN (%(stock_ids)s)[1 + n %% %(stock_count)s]
+                    ELSE %(other_id)s END,
+               CASE WHEN n %% 3 = 0 THEN %(other_id)s
+                    ELSE (%(stock_ids)s)[1 + n %% %(stock_count)s] END,
+               10, 5, 50,
+               CASE WHEN n %% 3 != 0 AND n %% 2 = 0 THEN 10 ELSE 0 END,
+               DATE '2015-01-01' + (n %% 1000),
+               TIMESTAMP '2015-01-01' + (n %% 1000) * INTERVAL '1 day' + n * INTERVAL '1 second'
+          FROM generate_series(1, %(rows)s) AS n
+    ''', {'goods_ids': goods_ids, 'goods_count': len(goods_ids),
+          'stock_ids': stock_ids, 'stock_count': len(stock_ids),
+          'other_id': other_id, 'rows': rows})
+    cr.execute('ANALYZE wh_move_line')
+    print('seeded %d rows in %.1fs' % (rows, time.time() - start))
+    return {'goods_id': goods_ids[0], 'warehouse_id': stock_ids[0],
+            'date_start': '2016-01-01', 'date_end': '2016-02-01'}
+
+
+def run(cr, label, params, repeat):
+    for name, query in HOT_QUERIES:
+        cr.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query, params)
+        plan = [row[0] for row in cr.fetchall()]
+        start = time.time()
+        for _i in range(repeat):
+            cr.execute(query, params)
+            cr.fetchall()
+        elapsed = (time.time() - start) / repeat
+        print('%-8s %-20s %8.2f ms' % (label, name, elapsed * 1000))
+        for line in plan:
+            print('    ' + line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=u'wh_move_line 库存热点查询索引基准测试')
+    parser.add_argument('-c', '--config', help=u'odoo 配置文件')
+    parser.add_argument('-d', '--database', required=True, help=u'数据库名')
+    parser.add_argument('--rows', type=int, default=3000000, help=u'插入的模拟明细行数')
+    parser.add_argument('--repeat', type=int, default=20, help=u'每个查询的执行次数')
+    args = parser.parse_args()
+
+    odoo.tools.config.parse_config(args.config and ['-c', args.config] or [])
+    registry = odoo.registry(args.database)
+    with registry.cursor() as cr:
+        try:
+            params = seed(cr, args.rows)
+            cr.execute('SAVEPOINT without_indexes')
+            for name, _columns, _where in WH_MOVE_LINE_INDEXES:
+                cr.execute('DROP INDEX IF EXISTS %s' % name)
+            run(cr, 'without', params, args.repeat)
+            cr.execute('ROLLBACK TO SAVEPOINT without_indexes')
+            run(cr, 'with', params, args.repeat)
+        finally:
+            cr.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,3 +10,7 @@ import warehouse_move_line
 import move_matching
 import res_company
 import qc_rule
+import batch_approve
+import stock_balance
+import stock_aging
+import lot_index
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from odoo import models, fields, api, tools
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+BATCH_STATE = [('wait', u'排队中'),
+               ('running', u'处理中'),
+               ('done', u'已完成')]
+
+LINE_STATE = [('wait', u'排队中'),
+              ('done', u'已审核'),
+              ('failed', u'失败')]
+
+
+class BatchApprove(models.Model):
+    '''
+    批量审核任务：选中的单据按商品分组后排队，由定时任务在后台审核。
+    有相同商品的单据在同一组内依次审核，不同组可由多个定时任务并行审核，
+    每张单据单独提交，失败的单据记录原因，不影响其他单据。
+    任务状态由单据状态得出，并行审核的进程只写各自的单据行，不争用任务行
+    '''
+    _name = 'batch.approve'
+    _description = u'批量审核任务'
+    _order = 'id desc'
+
+    @api.multi
+    @api.depends('line_ids.state')
+    def _compute_progress(self):
+        counts = {}
+        for row in self.env['batch.approve.line'].read_group(
+                [('batch_id', 'in', self.ids)], ['batch_id', 'state'],
+                ['batch_id', 'state'], lazy=False):
+            counts[(row['batch_id'][0], row['state'])] = row['__count']
+        for batch in self:
+            done_count = counts.get((batch.id, 'done'), 0)
+            failed_count = counts.get((batch.id, 'failed'), 0)
+            total_count = done_count + failed_count + \
+                counts.get((batch.id, 'wait'), 0)
+            batch.total_count = total_count
+            batch.done_count = done_count
+            batch.failed_count = failed_count
+            batch.progress = total_count and \
+                100.0 * (done_count + failed_count) / total_count
+            if done_count + failed_count == total_count:
+                batch.state = 'done'
+            elif done_count or failed_count:
+                batch.state = 'running'
+            else:
+                batch.state = 'wait'
+
+    name = fields.Char(u'任务', required=True)
+    model = fields.Char(u'单据模型', required=True)
+    method = fields.Char(u'审核方法', required=True)
+    line_ids = fields.One2many('batch.approve.line', 'batch_id', u'单据',
+                               readonly=True)
+    state = fields.Selection(BATCH_STATE, u'状态', compute='_compute_progress')
+    total_count = fields.Integer(u'单据数', compute='_compute_progress')
+    done_count = fields.Integer(u'已审核', compute='_compute_progress')
+    failed_count = fields.Integer(u'失败', compute='_compute_progress')
+    progress = fields.Float(u'进度', compute='_compute_progress')
+    company_id = fields.Many2one(
+        'res.company',
+        string=u'公司',
+        change_default=True,
+        default=lambda self: self.env['res.company']._company_default_get())
+
+    @api.model
+    def _partition(self, records):
+        '''
+        按商品把单据分组：有相同商品的单据（直接或间接）分在同一组
+        :return: 与 records 顺序对应的组号列表，组号从 1 开始
+        '''
+        parent = range(len(records))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        goods_owner = {}
+        for index, record in enumerate(records):
+            for goods in (record.line_out_ids | record.line_in_ids).mapped('goods_id'):
+                if goods.id in goods_owner:
+                    parent[find(index)] = find(goods_owner[goods.id])
+                else:
+                    goods_owner[goods.id] = index
+        group_nos = {}
+        return [group_nos.setdefault(find(index), len(group_nos) + 1)
+                for index in range(len(records))]
+
+    @api.model
+    def create_batch(self, records, method):
+        '''
+        把 records 排入批量审核队列
+        :param records: 待审核的单据（需有 line_out_ids、line_in_ids 明细）
+        :param method: 单据上的审核方法名
+        :return: 批量审核任务
+        '''
+        if not records:
+            raise UserError(u'请选择需要审核的单据')
+        batch = self.create({
+            'name': u'%s %s' % (records._description, fields.Datetime.now()),
+            'model': records._name,
+            'method': method,
+        })
+        self.env['batch.approve.line']._bulk_insert([{
+            'batch_id': batch.id,
+            'res_id': record.id,
+            'name': record.name,
+            'group_no': group_no,
+            'state': 'wait',
+        } for record, group_no in zip(records, self._partition(records))])
+        return batch
+
+    def _commit(self):
+        ''' 每张单据单独提交；测试时不提交 '''
+        if not getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.commit()
+
+    def _rollback(self):
+        ''' 出错时回滚，事务中断后才能释放咨询锁；测试时不回滚 '''
+        if not getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.rollback()
+
+    @api.model
+    def run_jobs(self):
+        '''
+        定时任务调用：每次认领一个其他进程未在处理的分组，依次审核组内单据，
+        直到没有排队的单据。分组用 PostgreSQL 会话级咨询锁互斥，
+        多个定时任务可以同时运行
+        '''
+        cr = self.env.cr
+        while True:
+            cr.execute('''
+                SELECT DISTINCT batch_id, group_no
+                  FROM batch_approve_line
+                 WHERE state = 'wait'
+              ORDER BY batch_id, group_no
+            ''')
+            for batch_id, group_no in cr.fetchall():
+                cr.execute('SELECT pg_try_advisory_lock(%s, %s)',
+                           (batch_id, group_no))
+                if cr.fetchone()[0]:
+                    break
+            else:
+                return True
+            try:
+                self.browse(batch_id)._run_group(group_no)
+            except Exception:
+                self._rollback()
+                raise
+            finally:
+                cr.execute('SELECT pg_advisory_unlock(%s, %s)',
+                           (batch_id, group_no))
+
+    @api.multi
+    def _run_group(self, group_no):
+        ''' 按顺序审核一个分组内排队的单据 '''
+        self.ensure_one()
+        # 拿到锁后重新开始事务，读取其他进程已提交的处理结果
+        self._commit()
+        lines = self.env['batch.approve.line'].search(
+            [('batch_id', '=', self.id),
+             ('group_no', '=', group_no),
+             ('state', '=', 'wait')], order='id')
+        if not lines:
+            return
+        Model = self.env[self.model].sudo(self.create_uid.id)
+        for line in lines:
+            record = Model.browse(line.res_id)
+            try:
+                with self.env.cr.savepoint():
+                    getattr(record, self.method)()
+                    if record.state != 'done':
+                        raise UserError(u'单据未能审核，请手工处理')
+                line.write({'state': 'done', 'message': False})
+            except Exception as e:
+                self.env.invalidate_all()
+                _logger.info(u'批量审核 %s 失败', line.name, exc_info=True)
+                line.write({'state': 'failed',
+                            'message': tools.ustr(getattr(e, 'name', None) or e)})
+            self._commit()
+
+    @api.multi
+    def retry_failed(self):
+        ''' 失败的单据重新排队 '''
+        for batch in self:
+            batch.line_ids.filtered(lambda line: line.state == 'failed').write(
+                {'state': 'wait', 'message': False})
+
+
+class BatchApproveLine(models.Model):
+    _name = 'batch.approve.line'
+    _description = u'批量审核单据'
+    _order = 'batch_id, group_no, id'
+
+    batch_id = fields.Many2one('batch.approve', u'批量审核任务',
+                               ondelete='cascade', required=True, index=True)
+    res_id = fields.Integer(u'单据ID', required=True)
+    name = fields.Char(u'单据编号')
+    group_no = fields.Integer(u'分组', help=u'有相同商品的单据在同一分组内依次审核')
+    state = fields.Selection(LINE_STATE, u'状态', default='wait', index=True)
+    message = fields.Text(u'失败原因')
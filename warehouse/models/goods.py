@@ -75,6 +75,107 @@ class Goods(models.Model):
             cost_unit = self._get_cost(warehouse, ignore=ignore_move)
         return cost_unit * qty, cost_unit
 
+    def _get_cost_snapshot(self, warehouse, goods_ids, ignore_move=None):
+        """
+        一次查询取得一批商品在某仓库的成本快照
+        :param ignore_move: 查询成本时跳过的 move_line id 列表
+        :return: {'layers': {商品 id: [(属性 id, 剩余数量, 单位成本)]} 按出库顺序排列,
+                  'last_cost': {商品 id: 最后一条已审核移库行的单位成本}}
+        """
+        snapshot = {'layers': {}, 'last_cost': {}}
+        if not warehouse or not goods_ids:
+            return snapshot
+        if isinstance(ignore_move, (long, int)):
+            ignore_move = [ignore_move]
+        params = {'warehouse_id': warehouse.id, 'goods_ids': tuple(goods_ids),
+                  'ignore': tuple(ignore_move or [0]),
+                  'location_id': self.env.context.get('location')}
+        location_where = params['location_id'] and 'AND line.location_id = %(location_id)s' or ''
+        # 出库顺序与 get_matching_records 相同：库位就近、先到期先出、先进先出
+        self.env.cr.execute('''
+            SELECT line.goods_id, line.attribute_id, line.qty_remaining,
+                   CASE WHEN line.goods_qty != 0
+                        THEN COALESCE(line.cost, 0) / line.goods_qty ELSE 0 END
+              FROM wh_move_line line
+         LEFT JOIN location loc ON loc.id = line.location_id
+             WHERE line.qty_remaining > 0
+               AND line.state = 'done'
+               AND line.warehouse_dest_id = %%(warehouse_id)s
+               AND line.goods_id IN %%(goods_ids)s
+               AND line.id NOT IN %%(ignore)s
+               %s
+          ORDER BY loc.name, line.expiration_date, line.cost_time, line.id
+        ''' % location_where, params)
+        for goods_id, attribute_id, qty_remaining, cost_unit in self.env.cr.fetchall():
+            snapshot['layers'].setdefault(goods_id, []).append(
+                (attribute_id, qty_remaining, cost_unit))
+
+        # 没有可匹配的入库行时，取最后一条已审核移库行的单位成本，同 _get_cost
+        self.env.cr.execute('''
+            SELECT DISTINCT ON (line.goods_id) line.goods_id, COALESCE(line.cost_unit, 0)
+              FROM wh_move_line line
+             WHERE line.state = 'done'
+               AND line.warehouse_dest_id = %(warehouse_id)s
+               AND line.goods_id IN %(goods_ids)s
+               AND line.id NOT IN %(ignore)s
+          ORDER BY line.goods_id, line.cost_time DESC, line.id DESC
+        ''', params)
+        snapshot['last_cost'] = dict(self.env.cr.fetchall())
+        return snapshot
+
+    @api.model
+    def get_suggested_costs(self, items, ignore_move=None):
+        """
+        批量计算建议成本，结果与逐行调用 get_suggested_cost_by_warehouse 相同，
+        每个仓库只查询一次（物料清单展开、成本分摊时使用）
+        :param items: [(仓库, 商品, 数量, 属性, 批号)]，属性和批号可以为空
+        :param ignore_move: 查询成本时跳过的 move_line id 列表
+        :return: 与 items 顺序一致的 [(成本, 单位成本)]
+        """
+        if self.env.context.get('wh_in_line_ids'):
+            return [goods.get_suggested_cost_by_warehouse(
+                warehouse, qty, lot_id=lot_id, attribute=attribute, ignore_move=ignore_move)
+                for warehouse, goods, qty, attribute, lot_id in items]
+
+        snapshots = {}
+        for warehouse, goods, qty, attribute, lot_id in items:
+            if not lot_id:
+                snapshots.setdefault(warehouse, set()).add(goods.id)
+        for warehouse, goods_ids in snapshots.items():
+            snapshots[warehouse] = self._get_cost_snapshot(
+                warehouse, goods_ids, ignore_move=ignore_move)
+
+        results = []
+        for warehouse, goods, qty, attribute, lot_id in items:
+            if lot_id:
+                results.append(goods.get_suggested_cost_by_warehouse(
+                    warehouse, qty, lot_id=lot_id, ignore_move=ignore_move))
+                continue
+
+            snapshot = snapshots[warehouse]
+            qty_to_go, cost, matching_qty = qty, 0, 0
+            for attribute_id, qty_remaining, cost_unit in snapshot['layers'].get(goods.id, []):
+                if qty_to_go <= 0:
+                    break
+                if attribute and attribute_id != attribute.id:
+                    continue
+                line_qty = min(qty_remaining, qty_to_go)
+                cost += line_qty * cost_unit
+                matching_qty += line_qty
+                qty_to_go -= line_qty
+
+            if matching_qty:
+                cost_unit = safe_division(cost, matching_qty)
+                if matching_qty >= qty:
+                    results.append((cost, cost_unit))
+                    continue
+            elif goods.id in snapshot['last_cost']:
+                cost_unit = snapshot['last_cost'][goods.id]
+            else:
+                cost_unit = goods.cost
+            results.append((cost_unit * qty, cost_unit))
+        return results
+
     def is_using_matching(self):
         """
         是否需要获取匹配记录
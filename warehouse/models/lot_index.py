@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import odoo.addons.decimal_precision as dp
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# 影响批次索引的出入库明细字段
+LOT_INDEX_FIELDS = set(['state', 'qty_remaining', 'uos_qty_remaining', 'lot',
+                        'expiration_date', 'goods_id', 'warehouse_dest_id',
+                        'attribute_id', 'date'])
+
+# compute_lot_domain 生成的固定条件，批号下拉只带这些条件时从批次索引查询
+LOT_DOMAIN_FIXED = set([('state', '=', 'done'), ('lot', '!=', False),
+                        ('qty_remaining', '>', 0),
+                        ('warehouse_dest_id.type', '=', 'stock')])
+LOT_DOMAIN_KEYS = {'goods_id': 'goods_id',
+                   'warehouse_dest_id': 'warehouse_id',
+                   'attribute_id': 'attribute_id'}
+
+EXPIRY_STATES = [('normal', u'正常'),
+                 ('near', u'临期'),
+                 ('expired', u'已过保')]
+
+# 按过保日和公司的临期预警天数计算临期状态，%(alias)s 为带 expiration_date 的表
+EXPIRY_STATE_SQL = '''
+    CASE WHEN %(alias)s.expiration_date IS NULL THEN 'normal'
+         WHEN %(alias)s.expiration_date < CURRENT_DATE THEN 'expired'
+         WHEN %(alias)s.expiration_date <= CURRENT_DATE + COALESCE(company.lot_expiry_warning_days, 0)
+              THEN 'near'
+         ELSE 'normal' END
+'''
+
+LOT_INDEX_COLUMNS = '''line_id, goods_id, warehouse_id, attribute_id, lot,
+                       expiration_date, date, qty_remaining, uos_qty_remaining,
+                       company_id, expiry_state'''
+
+# 从出入库明细选出未出完的批次
+LOT_INDEX_SELECT = '''
+    SELECT line.id, line.goods_id, line.warehouse_dest_id, line.attribute_id, line.lot,
+           line.expiration_date, line.date, line.qty_remaining, line.uos_qty_remaining,
+           line.company_id, ''' + EXPIRY_STATE_SQL % {'alias': 'line'} + '''
+      FROM wh_move_line line
+      JOIN warehouse wh ON wh.id = line.warehouse_dest_id
+ LEFT JOIN res_company company ON company.id = line.company_id
+     WHERE line.lot IS NOT NULL
+       AND line.state = 'done'
+       AND line.qty_remaining > 0
+       AND wh.type = 'stock'
+       %s
+'''
+
+
+class WhLotIndex(models.Model):
+    '''
+    批次索引：每个未出完的批号入库明细一行，带剩余数量和过保日。
+    出入库明细变化时刷新对应行，批号下拉和临期扫描直接查询此表
+    '''
+    _name = 'wh.lot.index'
+    _description = u'批次索引'
+    _log_access = False
+    _order = 'warehouse_id, expiration_date, lot'
+    _rec_name = 'lot'
+
+    line_id = fields.Many2one('wh.move.line', u'入库明细',
+                              required=True, ondelete='cascade')
+    goods_id = fields.Many2one('goods', u'商品')
+    warehouse_id = fields.Many2one('warehouse', u'仓库')
+    attribute_id = fields.Many2one('attribute', u'属性')
+    lot = fields.Char(u'批号')
+    expiration_date = fields.Date(u'过保日')
+    date = fields.Date(u'入库日期')
+    qty_remaining = fields.Float(u'剩余数量', digits=dp.get_precision('Quantity'))
+    uos_qty_remaining = fields.Float(
+        u'剩余辅助数量', digits=dp.get_precision('Quantity'))
+    company_id = fields.Many2one('res.company', u'公司')
+    expiry_state = fields.Selection(EXPIRY_STATES, u'临期状态')
+
+    _sql_constraints = [
+        ('line_uniq', 'unique(line_id)', u'一个入库明细只能有一条批次索引'),
+    ]
+
+    @api.model_cr
+    def init(self):
+        for name, columns, where in [
+                # 批号下拉：按商品、仓库取未出完批次，过保日早的在前
+                ('wh_lot_index_goods_idx',
+                 'goods_id, warehouse_id, expiration_date, lot', ''),
+                # 临期扫描：按过保日范围取各仓库批次
+                ('wh_lot_index_expiry_idx',
+                 'expiration_date, warehouse_id', 'WHERE expiration_date IS NOT NULL'),
+                # 按批号前缀查找
+                ('wh_lot_index_lot_idx', 'lot varchar_pattern_ops', '')]:
+            self._cr.execute(
+                'SELECT indexname FROM pg_indexes WHERE indexname = %s', (name,))
+            if not self._cr.fetchone():
+                self._cr.execute('CREATE INDEX %s ON wh_lot_index (%s) %s' %
+                                 (name, columns, where))
+        # 安装或升级时重建，保证与明细一致
+        self.rebuild()
+
+    @api.model
+    def refresh(self, line_ids):
+        ''' 从出入库明细重新生成指定明细的批次索引 '''
+        if not line_ids:
+            return
+        line_ids = tuple(line_ids)
+        self.env.cr.execute(
+            'DELETE FROM wh_lot_index WHERE line_id IN %s', (line_ids,))
+        self.env.cr.execute(
+            'INSERT INTO wh_lot_index (%s) ' % LOT_INDEX_COLUMNS +
+            LOT_INDEX_SELECT % 'AND line.id IN %s', (line_ids,))
+        self.invalidate_cache()
+
+    @api.model
+    def rebuild(self):
+        ''' 全部重建批次索引 '''
+        self.env.cr.execute('DELETE FROM wh_lot_index')
+        self.env.cr.execute(
+            'INSERT INTO wh_lot_index (%s) ' % LOT_INDEX_COLUMNS + LOT_INDEX_SELECT % '')
+        self.invalidate_cache()
+        return True
+
+    @api.model
+    def _parse_lot_domain(self, args):
+        '''
+        识别 compute_lot_domain 生成的批号下拉条件
+        :return: search_lots 的参数，不是批号下拉条件时返回 None
+        '''
+        found, values = set(), {}
+        for leaf in args or []:
+            if not isinstance(leaf, (list, tuple)) or len(leaf) != 3:
+                return None
+            leaf = tuple(leaf)
+            if leaf in LOT_DOMAIN_FIXED:
+                found.add(leaf)
+            elif leaf[0] in LOT_DOMAIN_KEYS and leaf[1] == '=':
+                values[LOT_DOMAIN_KEYS[leaf[0]]] = leaf[2]
+            else:
+                return None
+        if found != LOT_DOMAIN_FIXED or not values.get('goods_id'):
+            return None
+        return values
+
+    @api.model
+    def search_lots(self, goods_id, warehouse_id=None, attribute_id=None, name='', limit=100):
+        '''
+        批号下拉：商品的未出完批次，过保日早的在前（先到期先出）
+        :return: [(入库明细id, 显示名称)]
+        '''
+        where, params = ['idx.goods_id = %s'], [goods_id]
+        if warehouse_id:
+            where.append('idx.warehouse_id = %s')
+            params.append(warehouse_id)
+        if attribute_id:
+            where.append('idx.attribute_id = %s')
+            params.append(attribute_id)
+        if name:
+            where.append('idx.lot ILIKE %s')
+            params.append('%%%s%%' % name)
+        query = '''
+            SELECT idx.line_id, idx.lot, wh.name, idx.qty_remaining, idx.expiration_date
+              FROM wh_lot_index idx
+              JOIN warehouse wh ON wh.id = idx.warehouse_id
+             WHERE %s
+          ORDER BY idx.expiration_date NULLS LAST, idx.lot, idx.line_id
+        ''' % ' AND '.join(where)
+        if limit:
+            query += ' LIMIT %s'
+            params.append(limit)
+        self.env.cr.execute(query, params)
+        result = []
+        for line_id, lot, warehouse, qty, expiration_date in self.env.cr.fetchall():
+            name = u'%s %s 余 %s' % (lot, warehouse, qty)
+            if expiration_date:
+                name += u' 过保日 %s' % expiration_date
+            result.append((line_id, name))
+        return result
+
+    @api.model
+    def scan_expiry(self):
+        '''
+        定时任务调用：按过保日和公司的临期预警天数更新所有批次的临期状态，
+        一次查询得到各仓库的临期和已过保批次
+        :return: {仓库id: [批次索引id]}，按过保日排序
+        '''
+        self.env.cr.execute('''
+            UPDATE wh_lot_index idx
+               SET expiry_state = %(state)s
+              FROM res_company company
+             WHERE company.id = idx.company_id
+               AND idx.expiry_state IS DISTINCT FROM %(state)s
+        ''' % {'state': EXPIRY_STATE_SQL % {'alias': 'idx'}})
+        self.env.cr.execute('''
+            SELECT warehouse_id, array_agg(id ORDER BY expiration_date, lot)
+              FROM wh_lot_index
+             WHERE expiry_state IN ('near', 'expired')
+          GROUP BY warehouse_id
+        ''')
+        alerts = dict(self.env.cr.fetchall())
+        self.invalidate_cache()
+        for warehouse_id, index_ids in alerts.items():
+            _logger.info(u'仓库 %s 有 %s 个临期或已过保批次', warehouse_id, len(index_ids))
+        return alerts
+
+
+class WhMoveLine(models.Model):
+    _inherit = 'wh.move.line'
+
+    @api.model
+    def create(self, vals):
+        line = super(WhMoveLine, self).create(vals)
+        if line.state == 'done' and line.lot:
+            self.env['wh.lot.index'].refresh(line.ids)
+        return line
+
+    @api.multi
+    def _write(self, vals):
+        ''' 影响批次的字段变化时（含计算字段的重算）刷新批次索引 '''
+        res = super(WhMoveLine, self)._write(vals)
+        if self and LOT_INDEX_FIELDS & set(vals):
+            self.env['wh.lot.index'].refresh(self.ids)
+        return res
+
+    @api.model
+    def name_search(self, name='', args=None, operator='ilike', limit=100):
+        ''' 批号下拉从批次索引查询，按过保日先到期的在前 '''
+        lot_args = self.env['wh.lot.index']._parse_lot_domain(args)
+        if lot_args is None or operator != 'ilike':
+            return super(WhMoveLine, self).name_search(
+                name=name, args=args, operator=operator, limit=limit)
+        return self.env['wh.lot.index'].search_lots(name=name, limit=limit, **lot_args)
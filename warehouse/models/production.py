@@ -4,7 +4,6 @@ from odoo.osv import osv
 from utils import inherits, inherits_after, \
     create_name, safe_division, create_origin
 import odoo.addons.decimal_precision as dp
-from itertools import islice
 from odoo import models, fields, api
 from odoo.exceptions import UserError
 
@@ -61,37 +60,7 @@ class WhAssembly(models.Model):
 
     def apportion_cost(self, cost):
         for assembly in self:
-            if not assembly.line_in_ids:
-                continue
-
-            collects = []
-            ignore_move = [line.id for line in assembly.line_in_ids]
-            for parent in assembly.line_in_ids:
-                collects.append((
-                    parent, parent.goods_id.get_suggested_cost_by_warehouse(
-                        parent.warehouse_dest_id, parent.goods_qty,
-                        lot_id=parent.lot_id,
-                        attribute=parent.attribute_id,
-                        ignore_move=ignore_move)[0]))
-
-            amount_total, collect_parent_cost = sum(
-                collect[1] for collect in collects), 0
-            for parent, amount in islice(collects, 0, len(collects) - 1):
-                parent_cost = safe_division(amount, amount_total) * cost
-                collect_parent_cost += parent_cost
-                parent.write({
-                    'cost_unit': safe_division(
-                        parent_cost, parent.goods_qty),
-                    'cost': parent_cost,
-                })
-
-            # 最后一行数据使用总金额减去已经消耗的金额来计算
-            last_parent_cost = cost - collect_parent_cost
-            collects[-1][0].write({
-                'cost_unit': safe_division(
-                    last_parent_cost, collects[-1][0].goods_qty),
-                'cost': last_parent_cost,
-            })
+            assembly.line_in_ids.apportion_cost(cost)
 
         return True
 
@@ -138,10 +107,11 @@ class WhAssembly(models.Model):
                             'type': 'in',
                             } for line in self.bom_id.line_parent_ids]
             parent_line_goods_qty = self.bom_id.line_parent_ids[0].goods_qty
-            for line in self.bom_id.line_child_ids:
-                cost, cost_unit = line.goods_id. \
-                    get_suggested_cost_by_warehouse(
-                        warehouse_id[0], line.goods_qty / parent_line_goods_qty * self.goods_qty)
+            costs = self.env['goods'].get_suggested_costs(
+                [(warehouse_id, line.goods_id,
+                  line.goods_qty / parent_line_goods_qty * self.goods_qty, None, None)
+                 for line in self.bom_id.line_child_ids])
+            for line, (cost, cost_unit) in zip(self.bom_id.line_child_ids, costs):
                 local_goods_qty = line.goods_qty / parent_line_goods_qty * self.goods_qty
                 line_out_ids.append({
                     'goods_id': line.goods_id.id,
@@ -171,16 +141,12 @@ class WhAssembly(models.Model):
         if not len(self.line_in_ids) or not len(self.line_out_ids):
             raise UserError(u'组合件和子件的商品必须存在')
 
-    def create_voucher_line(self, data):
-        return [self.env['voucher.line'].create(data_line) for data_line in data]
-
-    def create_vourcher_line_data(self, assembly, voucher_row):
+    def create_vourcher_line_data(self, assembly):
         """
         准备入库凭证行数据
         借：库存商品（商品上）
         贷：生产成本-基本生产成本（核算分类上）
         :param assembly: 组装单
-        :param voucher_row: 入库凭证
         :return:
         """
         line_out_data, line_in_data = [], []
@@ -193,7 +159,6 @@ class WhAssembly(models.Model):
             account_id = self.finance_category_id.account_id.id
             line_out_data.append({'credit': line_out_credit,
                                   'goods_id': False,
-                                  'voucher_id': voucher_row.id,
                                   'account_id': account_id,
                                   'name': u'%s 原料 %s' % (assembly.move_id.name, assembly.move_id.note or '')
                                   })
@@ -203,36 +168,32 @@ class WhAssembly(models.Model):
                 line_in_data.append({'debit': line_in.cost,
                                      'goods_id': line_in.goods_id.id,
                                      'goods_qty': line_in.goods_qty,
-                                     'voucher_id': voucher_row.id,
                                      'account_id': account_id,
                                      'name': u'%s 成品 %s' % (assembly.move_id.name, assembly.move_id.note or '')})
         return line_out_data + line_in_data
 
-    def wh_assembly_create_voucher_line(self, assembly, voucher_row):
+    def wh_assembly_voucher_line_data(self, assembly):
         """
-        创建入库凭证行
+        准备入库凭证行数据，含组装费用
         :param assembly: 组装单
-        :param voucher_row: 入库凭证
-        :return:
+        :return: 入库凭证行数据
         """
         voucher_line_data = []
         # 贷方行
         if assembly.fee:
             account_row = assembly.create_uid.company_id.operating_cost_account_id
             voucher_line_data.append({'name': u'组装费用', 'account_id': account_row.id,
-                                      'credit': assembly.fee, 'voucher_id': voucher_row.id})
-        voucher_line_data += self.create_vourcher_line_data(
-            assembly, voucher_row)
+                                      'credit': assembly.fee})
+        voucher_line_data += self.create_vourcher_line_data(assembly)
 
-        self.create_voucher_line(voucher_line_data)
+        return voucher_line_data
 
-    def pre_out_vourcher_line_data(self, assembly, voucher):
+    def pre_out_vourcher_line_data(self, assembly):
         """
         准备出库凭证行数据
         借：生产成本-基本生产成本（核算分类上）
         贷：库存商品（商品上）
         :param assembly: 组装单
-        :param voucher: 出库凭证
         :return: 出库凭证行数据
         """
         line_out_data, line_in_data = [], []
@@ -245,7 +206,6 @@ class WhAssembly(models.Model):
             account_id = self.finance_category_id.account_id.id
             line_in_data.append({'debit': line_out_debit,
                                  'goods_id': False,
-                                 'voucher_id': voucher.id,
                                  'account_id': account_id,
                                  'name': u'%s 成品 %s' % (assembly.move_id.name, assembly.move_id.note or '')
                                  })
@@ -255,32 +215,18 @@ class WhAssembly(models.Model):
                 line_out_data.append({'credit': line_out.cost,
                                       'goods_id': line_out.goods_id.id,
                                       'goods_qty': line_out.goods_qty,
-                                      'voucher_id': voucher.id,
                                       'account_id': account_id,
                                       'name': u'%s 原料 %s' % (assembly.move_id.name, assembly.move_id.note or '')})
         return line_out_data + line_in_data
 
-    def create_out_voucher_line(self, assembly, voucher):
-        """
-        创建出库凭证行
-        :param assembly: 组装单
-        :param voucher: 出库凭证
-        :return:
-        """
-        voucher_line_data = self.pre_out_vourcher_line_data(assembly, voucher)
-
-        self.create_voucher_line(voucher_line_data)
-
     def wh_assembly_create_voucher(self):
         """
         生成入库凭证并审核
         :return:
         """
         for assembly in self:
-            voucher_row = self.env['voucher'].create({'date': assembly.date})
-            self.wh_assembly_create_voucher_line(assembly, voucher_row)  # 入库凭证
-            assembly.voucher_id = voucher_row.id
-            voucher_row.voucher_done()
+            assembly.voucher_id = self.env['voucher'].create_voucher(
+                {'date': assembly.date}, self.wh_assembly_voucher_line_data(assembly))  # 入库凭证
 
     def create_out_voucher(self):
         """
@@ -288,10 +234,8 @@ class WhAssembly(models.Model):
         :return:
         """
         for assembly in self:
-            out_voucher = self.env['voucher'].create({'date': assembly.date})
-            self.create_out_voucher_line(assembly, out_voucher)  # 出库凭证
-            assembly.out_voucher_id = out_voucher.id
-            out_voucher.voucher_done()
+            assembly.out_voucher_id = self.env['voucher'].create_voucher(
+                {'date': assembly.date}, self.pre_out_vourcher_line_data(assembly))  # 出库凭证
 
     @api.multi
     def approve_feeding(self):
@@ -390,10 +334,10 @@ class WhAssembly(models.Model):
                 'attribute_id': line.attribute_id,
             } for line in self.bom_id.line_parent_ids]
 
-            for line in self.bom_id.line_child_ids:
-                cost, cost_unit = line.goods_id. \
-                    get_suggested_cost_by_warehouse(
-                        warehouse_id[0], line.goods_qty)
+            costs = self.env['goods'].get_suggested_costs(
+                [(warehouse_id, line.goods_id, line.goods_qty, None, None)
+                 for line in self.bom_id.line_child_ids])
+            for line, (cost, cost_unit) in zip(self.bom_id.line_child_ids, costs):
                 line_out_ids.append({
                     'type': 'out',
                     'goods_id': line.goods_id.id,
@@ -575,10 +519,11 @@ class outsource(models.Model):
 
             parent_line_goods_qty = self.bom_id.line_parent_ids[0].goods_qty
 
-            for line in self.bom_id.line_child_ids:
-                cost, cost_unit = line.goods_id.get_suggested_cost_by_warehouse(
-                    warehouse_id[0], line.goods_qty / parent_line_goods_qty * self.goods_qty)
-
+            costs = self.env['goods'].get_suggested_costs(
+                [(warehouse_id, line.goods_id,
+                  line.goods_qty / parent_line_goods_qty * self.goods_qty, None, None)
+                 for line in self.bom_id.line_child_ids])
+            for line, (cost, cost_unit) in zip(self.bom_id.line_child_ids, costs):
                 local_goods_qty = line.goods_qty / parent_line_goods_qty * self.goods_qty
 
                 line_out_ids.append({
@@ -620,10 +565,10 @@ class outsource(models.Model):
                 'type': 'in',
             } for line in self.bom_id.line_parent_ids]
 
-            for line in self.bom_id.line_child_ids:
-                cost, cost_unit = line.goods_id. \
-                    get_suggested_cost_by_warehouse(
-                        warehouse_id[0], line.goods_qty)
+            costs = self.env['goods'].get_suggested_costs(
+                [(warehouse_id, line.goods_id, line.goods_qty, None, None)
+                 for line in self.bom_id.line_child_ids])
+            for line, (cost, cost_unit) in zip(self.bom_id.line_child_ids, costs):
                 line_out_ids.append({
                     'goods_id': line.goods_id.id,
                     'warehouse_id': warehouse_id.id,
@@ -661,38 +606,7 @@ class outsource(models.Model):
 
     def apportion_cost(self, cost):
         for outsource in self:
-            if not outsource.line_in_ids:
-                continue
-
-            collects = []
-            ignore_move = [line.id for line in outsource.line_in_ids]
-            for parent in outsource.line_in_ids:
-                collects.append((parent,
-                                 parent.goods_id.get_suggested_cost_by_warehouse(
-                                     parent.warehouse_dest_id, parent.goods_qty,
-                                     lot_id=parent.lot_id,
-                                     attribute=parent.attribute_id,
-                                     ignore_move=ignore_move)[0]
-                                 ))
-
-            amount_total, collect_parent_cost = sum(
-                collect[1] for collect in collects), 0
-            for parent, amount in islice(collects, 0, len(collects) - 1):
-                parent_cost = safe_division(amount, amount_total) * cost
-                collect_parent_cost += parent_cost
-                parent.write({
-                    'cost_unit': safe_division(
-                        parent_cost, parent.goods_qty),
-                    'cost': parent_cost,
-                })
-
-            # 最后一行数据使用总金额减去已经消耗的金额来计算
-            last_parent_cost = cost - collect_parent_cost
-            collects[-1][0].write({
-                'cost_unit': safe_division(
-                    last_parent_cost, collects[-1][0].goods_qty),
-                'cost': last_parent_cost,
-            })
+            outsource.line_in_ids.apportion_cost(cost)
 
         return True
 
@@ -751,16 +665,12 @@ class outsource(models.Model):
             self.invoice_id = source_id.id
         return source_id
 
-    def create_voucher_line(self, data):
-        return [self.env['voucher.line'].create(data_line) for data_line in data]
-
-    def create_vourcher_line_data(self, outsource, voucher_row):
+    def create_vourcher_line_data(self, outsource):
         """
         准备入库凭证行数据
         借：库存商品（商品上）
         贷：生产成本-基本生产成本（核算分类上）
         :param outsource: 委外加工单
-        :param voucher_row: 入库凭证
         :return:
         """
         line_out_data, line_in_data = [], []
@@ -773,7 +683,6 @@ class outsource(models.Model):
             account_id = self.finance_category_id.account_id.id
             line_out_data.append({'credit': line_out_credit,
                                   'goods_id': False,
-                                  'voucher_id': voucher_row.id,
                                   'account_id': account_id,
                                   'name': u'%s 原料 %s' % (outsource.move_id.name, outsource.move_id.note or '')
                                   })
@@ -783,19 +692,17 @@ class outsource(models.Model):
                 line_in_data.append({'debit': line_in.cost,
                                      'goods_id': line_in.goods_id.id,
                                      'goods_qty': line_in.goods_qty,
-                                     'voucher_id': voucher_row.id,
                                      'account_id': account_id,
                                      'name': u'%s 成品 %s' % (outsource.move_id.name, outsource.move_id.note or '')
                                      })
         return line_out_data + line_in_data
 
-    def pre_out_vourcher_line_data(self, outsource, voucher):
+    def pre_out_vourcher_line_data(self, outsource):
         """
         准备出库凭证行数据
         借：委托加工物资（核算分类上）
         贷：库存商品（商品上）
         :param outsource: 委外加工单
-        :param voucher: 出库凭证
         :return: 出库凭证行数据
         """
         line_out_data, line_in_data = [], []
@@ -808,7 +715,6 @@ class outsource(models.Model):
             account_id = self.finance_category_id.account_id.id
             line_in_data.append({'debit': line_out_debit,
                                  'goods_id': False,
-                                 'voucher_id': voucher.id,
                                  'account_id': account_id,
                                  'name': u'%s 成品 %s' % (outsource.move_id.name, outsource.move_id.note or '')
                                  })
@@ -818,39 +724,25 @@ class outsource(models.Model):
                 line_out_data.append({'credit': line_out.cost,
                                       'goods_id': line_out.goods_id.id,
                                       'goods_qty': line_out.goods_qty,
-                                      'voucher_id': voucher.id,
                                       'account_id': account_id,
                                       'name': u'%s 原料 %s' % (outsource.move_id.name, outsource.move_id.note or '')})
         return line_out_data + line_in_data
 
-    def outsource_create_voucher_line(self, outsource, voucher_row):
+    def outsource_voucher_line_data(self, outsource):
         """
-        创建入库凭证行
+        准备入库凭证行数据，含委外费用
         :param outsource: 委外加工单
-        :param voucher_row: 入库凭证
-        :return:
+        :return: 入库凭证行数据
         """
         voucher_line_data = []
         if outsource.outsource_fee:
             account_row = outsource.create_uid.company_id.operating_cost_account_id  # 公司上的生产费用科目
             # 贷方行
             voucher_line_data.append({'name': u'委外费用', 'account_id': account_row.id,
-                                      'credit': outsource.outsource_fee, 'voucher_id': voucher_row.id})
+                                      'credit': outsource.outsource_fee})
 
-        voucher_line_data += self.create_vourcher_line_data(
-            outsource, voucher_row)
-        self.create_voucher_line(voucher_line_data)
-
-    def create_out_voucher_line(self, outsource, voucher):
-        """
-        创建出库凭证行
-        :param outsource: 委外加工单
-        :param voucher: 出库凭证
-        :return:
-        """
-        voucher_line_data = self.pre_out_vourcher_line_data(outsource, voucher)
-
-        self.create_voucher_line(voucher_line_data)
+        voucher_line_data += self.create_vourcher_line_data(outsource)
+        return voucher_line_data
 
     def outsource_create_voucher(self):
         """
@@ -858,11 +750,8 @@ class outsource(models.Model):
         :return:
         """
         for outsource in self:
-            voucher_row = self.env['voucher'].create({'date': outsource.date})
-            self.outsource_create_voucher_line(outsource, voucher_row)  # 入库凭证
-
-            outsource.voucher_id = voucher_row.id
-            voucher_row.voucher_done()
+            outsource.voucher_id = self.env['voucher'].create_voucher(
+                {'date': outsource.date}, self.outsource_voucher_line_data(outsource))  # 入库凭证
 
     def create_out_voucher(self):
         """
@@ -870,11 +759,8 @@ class outsource(models.Model):
         :return:
         """
         for outsource in self:
-            out_voucher = self.env['voucher'].create({'date': outsource.date})
-            self.create_out_voucher_line(outsource, out_voucher)  # 出库凭证
-
-            outsource.out_voucher_id = out_voucher.id
-            out_voucher.voucher_done()
+            outsource.out_voucher_id = self.env['voucher'].create_voucher(
+                {'date': outsource.date}, self.pre_out_vourcher_line_data(outsource))  # 出库凭证
 
     @api.multi
     def approve_feeding(self):
@@ -988,36 +874,7 @@ class WhDisassembly(models.Model):
 
     def apportion_cost(self, cost):
         for assembly in self:
-            if not assembly.line_in_ids:
-                continue
-
-            collects = []
-            ignore_move = [line.id for line in assembly.line_in_ids]
-            for child in assembly.line_in_ids:
-                collects.append((
-                    child, child.goods_id.get_suggested_cost_by_warehouse(
-                        child.warehouse_dest_id, child.goods_qty,
-                        lot_id=child.lot_id, attribute=child.attribute_id,
-                        ignore_move=ignore_move)[0]))
-
-            amount_total, collect_child_cost = \
-                sum(collect[1] for collect in collects), 0
-            for child, amount in islice(collects, 0, len(collects) - 1):
-                child_cost = safe_division(amount, amount_total) * cost
-                collect_child_cost += child_cost
-                child.write({
-                    'cost_unit': safe_division(
-                            child_cost, child.goods_qty),
-                    'cost': child_cost,
-                })
-
-            # 最后一行数据使用总金额减去已经消耗的金额来计算
-            last_child_cost = cost - collect_child_cost
-            collects[-1][0].write({
-                'cost_unit': safe_division(
-                    last_child_cost, collects[-1][0].goods_qty),
-                'cost': last_child_cost,
-            })
+            assembly.line_in_ids.apportion_cost(cost)
 
         return True
 
@@ -1033,16 +890,12 @@ class WhDisassembly(models.Model):
         if not len(self.line_in_ids) or not len(self.line_out_ids):
             raise UserError(u'组合件和子件的商品必须存在')
 
-    def create_voucher_line(self, data):
-        return [self.env['voucher.line'].create(data_line) for data_line in data]
-
-    def create_vourcher_line_data(self, disassembly, voucher_row):
+    def create_vourcher_line_data(self, disassembly):
         """
         准备入库凭证行数据
         借：库存商品（商品上）
         贷：生产成本-基本生产成本（核算分类上）
         :param disassembly: 拆卸单
-        :param voucher_row: 入库库凭证
         :return:
         """
         line_out_data, line_in_data = [], []
@@ -1055,7 +908,6 @@ class WhDisassembly(models.Model):
             account_id = self.finance_category_id.account_id.id
             line_out_data.append({'credit': line_in_credit,
                                   'goods_id': False,
-                                  'voucher_id': voucher_row.id,
                                   'account_id': account_id,
                                   'name': u'%s 原料 %s' % (disassembly.move_id.name, disassembly.move_id.note or '')
                                   })
@@ -1065,19 +917,17 @@ class WhDisassembly(models.Model):
                 line_in_data.append({'debit': line_in.cost,
                                      'goods_id': line_in.goods_id.id,
                                      'goods_qty': line_in.goods_qty,
-                                     'voucher_id': voucher_row.id,
                                      'account_id': account_id,
                                      'name': u'%s 成品 %s' % (disassembly.move_id.name, disassembly.move_id.note or '')
                                      })
         return line_out_data + line_in_data
 
-    def pre_out_vourcher_line_data(self, disassembly, voucher):
+    def pre_out_vourcher_line_data(self, disassembly):
         """
         准备出库凭证行数据
         借：生产成本-基本生产成本（核算分类上）
         贷：库存商品（商品上）
         :param disassembly: 拆卸单
-        :param voucher: 出库凭证
         :return: 出库凭证行数据
         """
         line_out_data, line_in_data = [], []
@@ -1089,7 +939,6 @@ class WhDisassembly(models.Model):
             account_id = self.finance_category_id.account_id.id
             line_in_data.append({'debit': line_out_debit,
                                  'goods_id': False,
-                                 'voucher_id': voucher.id,
                                  'account_id': account_id,
                                  'name': u'%s 成品 %s' % (disassembly.move_id.name, disassembly.move_id.note or '')
                                  })
@@ -1099,40 +948,35 @@ class WhDisassembly(models.Model):
                 line_out_data.append({'credit': line_out.cost + disassembly.fee,
                                       'goods_id': line_out.goods_id.id,
                                       'goods_qty': line_out.goods_qty,
-                                      'voucher_id': voucher.id,
                                       'account_id': account_id,
                                       'name': u'%s 原料 %s' % (disassembly.move_id.name, disassembly.move_id.note or '')})
         return line_out_data + line_in_data
 
-    def wh_disassembly_create_voucher_line(self, disassembly, voucher_row):
+    def wh_disassembly_voucher_line_data(self, disassembly):
         """
-        创建入库凭证行
-        :param disassembly:
-        :param voucher_row:
-        :return:
+        准备入库凭证行数据
+        :param disassembly: 拆卸单
+        :return: 入库凭证行数据
         """
         voucher_line_data = []
-        voucher_line_data += self.create_vourcher_line_data(
-            disassembly, voucher_row)
-        self.create_voucher_line(voucher_line_data)
+        voucher_line_data += self.create_vourcher_line_data(disassembly)
+        return voucher_line_data
 
-    def create_out_voucher_line(self, disassembly, voucher):
+    def out_voucher_line_data(self, disassembly):
         """
-        创建出库凭证行
+        准备出库凭证行数据
         :param disassembly: 拆卸单
-        :param voucher: 出库凭证
-        :return:
+        :return: 出库凭证行数据
         """
         voucher_line_data = []
         # 借方行
         if disassembly.fee:
             account = disassembly.create_uid.company_id.operating_cost_account_id
             voucher_line_data.append({'name': u'拆卸费用', 'account_id': account.id,
-                                      'debit': disassembly.fee, 'voucher_id': voucher.id})
-        voucher_line_data += self.pre_out_vourcher_line_data(
-            disassembly, voucher)
+                                      'debit': disassembly.fee})
+        voucher_line_data += self.pre_out_vourcher_line_data(disassembly)
 
-        self.create_voucher_line(voucher_line_data)
+        return voucher_line_data
 
     def wh_disassembly_create_voucher(self):
         """
@@ -1140,12 +984,8 @@ class WhDisassembly(models.Model):
         :return:
         """
         for disassembly in self:
-            voucher_row = self.env['voucher'].create(
-                {'date': disassembly.date})
-            self.wh_disassembly_create_voucher_line(
-                disassembly, voucher_row)   # 入库凭证
-            disassembly.voucher_id = voucher_row.id
-            voucher_row.voucher_done()
+            disassembly.voucher_id = self.env['voucher'].create_voucher(
+                {'date': disassembly.date}, self.wh_disassembly_voucher_line_data(disassembly))  # 入库凭证
 
     def create_out_voucher(self):
         """
@@ -1153,11 +993,8 @@ class WhDisassembly(models.Model):
         :return:
         """
         for disassembly in self:
-            out_voucher = self.env['voucher'].create(
-                {'date': disassembly.date})
-            self.create_out_voucher_line(disassembly, out_voucher)  # 出库凭证
-            disassembly.out_voucher_id = out_voucher.id
-            out_voucher.voucher_done()
+            disassembly.out_voucher_id = self.env['voucher'].create_voucher(
+                {'date': disassembly.date}, self.out_voucher_line_data(disassembly))  # 出库凭证
 
     def approve_feeding(self):
         ''' 发料 '''
@@ -1312,10 +1149,10 @@ class WhDisassembly(models.Model):
             [('type', '=', 'stock')], limit=1)
         if self.bom_id:
             line_out_ids = []
-            for line in self.bom_id.line_parent_ids:
-                cost, cost_unit = line.goods_id \
-                    .get_suggested_cost_by_warehouse(
-                        warehouse_id, line.goods_qty)
+            costs = self.env['goods'].get_suggested_costs(
+                [(warehouse_id, line.goods_id, line.goods_qty, None, None)
+                 for line in self.bom_id.line_parent_ids])
+            for line, (cost, cost_unit) in zip(self.bom_id.line_parent_ids, costs):
                 line_out_ids.append({
                     'goods_id': line.goods_id,
                     'warehouse_id': self.env[
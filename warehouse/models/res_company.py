@@ -15,6 +15,9 @@ class ResCompany(models.Model):
         return self.env.ref('finance.small_business_chart2211001')
 
     is_enable_negative_stock = fields.Boolean(u'允许负库存')
+    lot_expiry_warning_days = fields.Integer(
+        u'临期预警天数', default=30,
+        help=u'批次过保日在此天数内时列入临期批次')
     endmonth_generation_cost = fields.Boolean(
         u'月末生成凭证', help=u'月末结帐时一次性生成成本凭证')
     operating_cost_account_id = fields.Many2one('finance.account', default=_get_operating_cost_account_id,
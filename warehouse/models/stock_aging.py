@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import odoo.addons.decimal_precision as dp
+from odoo import models, fields, api
+from odoo.exceptions import UserError, ValidationError
+
+
+class StockAgingBucket(models.Model):
+    '''
+    库龄区间：库龄大于等于起始天数、小于下一区间起始天数的库存归入该区间，
+    最后一个区间不限上限
+    '''
+    _name = 'stock.aging.bucket'
+    _description = u'库龄区间'
+    _order = 'day_from'
+
+    name = fields.Char(u'名称', required=True)
+    day_from = fields.Integer(u'起始天数', required=True)
+    active = fields.Boolean(u'启用', default=True,
+                            help=u'已有库龄快照的区间不能删除，可以停用')
+
+    _sql_constraints = [
+        ('day_from_uniq', 'unique(day_from)', u'库龄区间的起始天数不能重复'),
+    ]
+
+    @api.one
+    @api.constrains('day_from')
+    def _check_day_from(self):
+        if self.day_from < 0:
+            raise ValidationError(u'起始天数不能小于0')
+
+
+class StockAging(models.AbstractModel):
+    '''
+    库龄计算：按入库日期把未出完的入库明细（剩余数量 > 0）归入库龄区间，
+    汇总剩余数量和成本（剩余数量 * 单位成本）
+    '''
+    _name = 'stock.aging'
+    _description = u'库龄计算'
+
+    @api.model
+    def get_aging_query(self, day_froms, group_columns, date=None, bucket_ids=None,
+                        warehouse_ids=None, category_ids=None, brand_ids=None):
+        '''
+        库龄汇总查询
+        :param day_froms: 各区间起始天数，升序
+        :param group_columns: 分组列，可用 warehouse_id, goods_id, category_id, brand_id
+        :param date: 计算库龄的日期，默认今天
+        :param bucket_ids: 与 day_froms 对应的库龄区间id，传入时返回区间id，否则返回区间序号（从0开始）
+        :return: (查询, 参数列表)，各列依次为分组列、区间、数量、成本
+        '''
+        date = date or fields.Date.context_today(self)
+        bucket = '''GREATEST((SELECT COUNT(*) FROM unnest(%s::int[]) day_from
+                              WHERE day_from <= %s::date - line.date) - 1, 0)'''
+        params = [list(day_froms), date]
+        if bucket_ids is not None:
+            bucket = '(%%s::int[])[%s + 1]' % bucket
+            params.insert(0, list(bucket_ids))
+        where, where_params = [], [date]
+        for column, ids in (('line.warehouse_dest_id', warehouse_ids),
+                            ('goods.category_id', category_ids),
+                            ('goods.brand', brand_ids)):
+            if ids:
+                where.append('AND %s IN %%s' % column)
+                where_params.append(tuple(ids))
+        group = ', '.join('aged.%s' % column for column in group_columns)
+        return '''
+            SELECT %(group)s, aged.bucket, SUM(aged.qty), SUM(aged.cost)
+              FROM (SELECT line.warehouse_dest_id AS warehouse_id,
+                           line.goods_id, goods.category_id, goods.brand AS brand_id,
+                           %(bucket)s AS bucket,
+                           line.qty_remaining AS qty,
+                           line.qty_remaining * COALESCE(line.cost_unit, 0) AS cost
+                      FROM wh_move_line line
+                      JOIN warehouse wh ON wh.id = line.warehouse_dest_id
+                      JOIN goods ON goods.id = line.goods_id
+                     WHERE line.state = 'done'
+                       AND line.qty_remaining > 0
+                       AND wh.type = 'stock'
+                       AND line.date <= %%s
+                       %(where)s
+                   ) aged
+          GROUP BY %(group)s, aged.bucket
+        ''' % {'group': group, 'bucket': bucket, 'where': ' '.join(where)}, \
+            params + where_params
+
+    @api.model
+    def get_aging(self, day_froms, group_columns, **kwargs):
+        '''
+        :return: [(分组列..., 区间序号, 数量, 成本)]
+        '''
+        query, params = self.get_aging_query(day_froms, group_columns, **kwargs)
+        self.env.cr.execute(query, params)
+        return self.env.cr.fetchall()
+
+
+class StockAgingSnapshot(models.Model):
+    '''
+    每日库龄快照：按 (仓库, 核算类别, 品牌, 库龄区间) 汇总，
+    用于按月查看库龄变化趋势，不需要重新扫描出入库明细
+    '''
+    _name = 'stock.aging.snapshot'
+    _description = u'库龄快照'
+    _log_access = False
+    _order = 'date desc, warehouse_id, bucket_id'
+
+    date = fields.Date(u'日期', required=True, index=True)
+    warehouse_id = fields.Many2one('warehouse', u'仓库')
+    category_id = fields.Many2one('core.category', u'核算类别')
+    brand_id = fields.Many2one('core.value', u'品牌')
+    bucket_id = fields.Many2one('stock.aging.bucket', u'库龄区间',
+                                ondelete='restrict')
+    goods_qty = fields.Float(u'数量', digits=dp.get_precision('Quantity'),
+                             group_operator='sum')
+    cost = fields.Float(u'成本', digits=dp.get_precision('Amount'),
+                        group_operator='sum')
+
+    @api.model
+    def create_snapshot(self, date=None):
+        ''' 定时任务调用：生成（或重新生成）某天的库龄快照，默认今天 '''
+        date = date or fields.Date.context_today(self)
+        buckets = self.env['stock.aging.bucket'].search([])
+        if not buckets:
+            return False
+        query, params = self.env['stock.aging'].get_aging_query(
+            buckets.mapped('day_from'),
+            ['warehouse_id', 'category_id', 'brand_id'],
+            date=date, bucket_ids=buckets.ids)
+        self.env.cr.execute(
+            'DELETE FROM stock_aging_snapshot WHERE date = %s', (date,))
+        self.env.cr.execute('''
+            INSERT INTO stock_aging_snapshot
+                   (date, warehouse_id, category_id, brand_id, bucket_id, goods_qty, cost)
+            SELECT %%s, src.* FROM (%s) src
+        ''' % query, [date] + params)
+        self.invalidate_cache()
+        return True
+
+
+class StockAgingReport(models.TransientModel):
+    _name = 'stock.aging.report'
+    _inherit = 'report.materialize'
+    _description = u'库龄分析表'
+    _report_columns = ['warehouse_id', 'goods_id', 'bucket_id', 'goods_qty', 'cost']
+
+    warehouse_id = fields.Many2one('warehouse', u'仓库')
+    goods_id = fields.Many2one('goods', u'商品')
+    bucket_id = fields.Many2one('stock.aging.bucket', u'库龄区间')
+    goods_qty = fields.Float(u'数量', digits=dp.get_precision('Quantity'))
+    cost = fields.Float(u'成本', digits=dp.get_precision('Amount'))
+
+
+class StockAgingWizard(models.TransientModel):
+    _name = 'stock.aging.wizard'
+    _description = u'库龄分析向导'
+
+    warehouse_id = fields.Many2one('warehouse', u'仓库',
+                                   domain=[('type', '=', 'stock')])
+    category_id = fields.Many2one('core.category', u'核算类别',
+                                  domain=[('type', '=', 'goods')],
+                                  context={'type': 'goods'})
+    brand_id = fields.Many2one('core.value', u'品牌',
+                               domain=[('type', '=', 'brand')],
+                               context={'type': 'brand'})
+
+    @api.multi
+    def open_report(self):
+        ''' 按启用的库龄区间生成库龄分析表 '''
+        self.ensure_one()
+        buckets = self.env['stock.aging.bucket'].search([])
+        if not buckets:
+            raise UserError(u'请先设置库龄区间')
+        report = self.env['stock.aging.report']
+        run_tag = report.materialize_query(*self.env['stock.aging'].get_aging_query(
+            buckets.mapped('day_from'), ['warehouse_id', 'goods_id'],
+            bucket_ids=buckets.ids,
+            warehouse_ids=self.warehouse_id.ids,
+            category_ids=self.category_id.ids,
+            brand_ids=self.brand_id.ids))
+        return report.get_run_action(
+            run_tag, u'库龄分析表',
+            [(self.env.ref('warehouse.stock_aging_report_pivot').id, 'pivot'),
+             (self.env.ref('warehouse.stock_aging_report_tree').id, 'tree')])
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import odoo.addons.decimal_precision as dp
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# 影响库存余额的出入库明细字段，修改时刷新对应 (商品, 仓库) 的余额
+STOCK_BALANCE_FIELDS = set(['state', 'qty_remaining', 'uos_qty_remaining',
+                            'cost_unit', 'goods_id', 'warehouse_dest_id',
+                            'attribute_id', 'lot', 'location_id'])
+
+# 改变明细所属 (商品, 仓库) 的字段，修改时还要刷新修改前的 (商品, 仓库)
+STOCK_BALANCE_KEY_FIELDS = set(['state', 'goods_id', 'warehouse_dest_id'])
+
+# 从已审核的出入库明细汇总库存余额
+STOCK_BALANCE_SELECT = '''
+    SELECT line.warehouse_dest_id, line.goods_id, line.attribute_id,
+           NULLIF(line.lot, ''), line.location_id,
+           SUM(line.qty_remaining), SUM(line.uos_qty_remaining),
+           SUM(line.qty_remaining * line.cost_unit)
+      FROM wh_move_line line
+     WHERE line.state = 'done'
+       AND line.warehouse_dest_id IS NOT NULL
+       %s
+  GROUP BY line.warehouse_dest_id, line.goods_id, line.attribute_id,
+           NULLIF(line.lot, ''), line.location_id
+'''
+
+# 汇总行的唯一键，属性、批号、库位为空也参与比较（空批号统一汇总为 NULL）
+STOCK_BALANCE_KEY = '''(goods_id, warehouse_id, COALESCE(attribute_id, 0),
+                        COALESCE(lot, ''), COALESCE(location_id, 0))'''
+
+# 写入汇总结果。并发事务刷新同一 (商品, 仓库) 时，
+# 同一汇总行冲突或删除对方已修改的行都会引发可重试的串行化错误，而不会重复写入
+STOCK_BALANCE_UPSERT = '''
+    INSERT INTO wh_stock_balance
+           (warehouse_id, goods_id, attribute_id, lot, location_id,
+            goods_qty, goods_uos_qty, cost)
+    %s
+    ON CONFLICT %s DO UPDATE
+       SET goods_qty = EXCLUDED.goods_qty,
+           goods_uos_qty = EXCLUDED.goods_uos_qty,
+           cost = EXCLUDED.cost
+'''
+
+
+class PendingKeys(set):
+    ''' 批量操作中待刷新的 (商品, 仓库)，操作结束刷新后关闭，之后的修改直接刷新 '''
+    closed = False
+
+
+class WhStockBalance(models.Model):
+    '''
+    库存余额汇总表：按 (仓库, 商品, 属性, 批号, 库位) 存储剩余数量和成本。
+    出入库明细审核、反审核、匹配变化时按 (商品, 仓库) 从明细重新汇总，
+    审核、反审核过程中的多次修改合并到结束时一次汇总；
+    库存余额表和库存查询直接读取此表
+    '''
+    _name = 'wh.stock.balance'
+    _description = u'库存余额汇总'
+    _log_access = False
+
+    warehouse_id = fields.Many2one('warehouse', u'仓库', index=True)
+    goods_id = fields.Many2one('goods', u'商品', index=True)
+    attribute_id = fields.Many2one('attribute', u'属性')
+    lot = fields.Char(u'批号')
+    location_id = fields.Many2one('location', u'库位')
+    goods_qty = fields.Float(u'数量', digits=dp.get_precision('Quantity'))
+    goods_uos_qty = fields.Float(
+        u'辅助单位数量', digits=dp.get_precision('Quantity'))
+    cost = fields.Float(u'成本', digits=dp.get_precision('Amount'))
+
+    @api.model_cr
+    def init(self):
+        # 安装或升级时重建，保证与明细一致，也清除唯一键建立前可能重复的行
+        self._cr.execute('DELETE FROM wh_stock_balance')
+        self._cr.execute('DROP INDEX IF EXISTS wh_stock_balance_goods_warehouse_idx')
+        self._cr.execute(
+            "SELECT indexname FROM pg_indexes WHERE indexname = 'wh_stock_balance_key_uniq'")
+        if not self._cr.fetchone():
+            self._cr.execute('CREATE UNIQUE INDEX wh_stock_balance_key_uniq ON wh_stock_balance %s'
+                             % STOCK_BALANCE_KEY)
+        self.rebuild()
+
+    @api.model
+    def get_line_keys(self, line_ids):
+        ''' 已审核出入库明细对应的 (商品, 仓库) '''
+        if not line_ids:
+            return set()
+        self.env.cr.execute('''
+            SELECT DISTINCT goods_id, warehouse_dest_id FROM wh_move_line
+             WHERE id IN %s AND state = 'done' AND warehouse_dest_id IS NOT NULL
+        ''', (tuple(line_ids),))
+        return set(self.env.cr.fetchall())
+
+    @api.model
+    def refresh(self, keys):
+        '''
+        从明细重新汇总指定 (商品, 仓库) 的库存余额
+        :param keys: (商品id, 仓库id) 的集合
+        '''
+        if not keys:
+            return
+        keys = tuple(keys)
+        self.env.cr.execute('''
+            DELETE FROM wh_stock_balance WHERE (goods_id, warehouse_id) IN %s
+        ''', (keys,))
+        self.env.cr.execute(STOCK_BALANCE_UPSERT % (
+            STOCK_BALANCE_SELECT % 'AND (line.goods_id, line.warehouse_dest_id) IN %s',
+            STOCK_BALANCE_KEY), (keys,))
+        self.invalidate_cache()
+
+    @api.model
+    def mark_dirty(self, keys):
+        '''
+        (商品, 仓库) 的明细已修改：在 refresh_after 的批量操作中先收集，结束时一次刷新；
+        否则立即刷新
+        '''
+        pending = self.env.context.get('stock_balance_keys')
+        if pending is not None and not pending.closed:
+            pending |= keys
+        else:
+            self.refresh(keys)
+
+    @api.model
+    def refresh_after(self, records, func):
+        '''
+        执行 func(records)，其间明细修改引起的库存余额刷新合并到结束时一次完成
+        :return: func 的返回值
+        '''
+        pending = self.env.context.get('stock_balance_keys')
+        if pending is not None and not pending.closed:
+            return func(records)
+        keys = PendingKeys()
+        records = records.with_context(stock_balance_keys=keys)
+        try:
+            res = func(records)
+            # 存储的计算字段（如剩余数量）在结束前重算，修改也收集到 keys 中
+            if records.env.recompute:
+                records.recompute()
+        finally:
+            keys.closed = True
+        self.refresh(keys)
+        return res
+
+    @api.model
+    def rebuild(self):
+        ''' 全部重建库存余额 '''
+        self.env.cr.execute('DELETE FROM wh_stock_balance')
+        self.env.cr.execute(STOCK_BALANCE_UPSERT % (STOCK_BALANCE_SELECT % '', STOCK_BALANCE_KEY))
+        self.invalidate_cache()
+        return True
+
+    @api.model
+    def check_consistency(self, repair=False):
+        '''
+        比较汇总表与明细重新汇总的结果
+        :param repair: 为 True 时刷新不一致的 (商品, 仓库)
+        :return: 不一致的 (商品id, 仓库id) 列表
+        '''
+        self.env.cr.execute('''
+            WITH expected AS (%s),
+                 stored AS (
+                    SELECT warehouse_id, goods_id, attribute_id, lot, location_id,
+                           goods_qty, goods_uos_qty, cost
+                      FROM wh_stock_balance),
+                 diff AS (
+                    (SELECT * FROM expected EXCEPT SELECT * FROM stored)
+                    UNION
+                    (SELECT * FROM stored EXCEPT SELECT * FROM expected))
+            SELECT DISTINCT goods_id, warehouse_dest_id FROM diff
+        ''' % (STOCK_BALANCE_SELECT % ''))
+        keys = self.env.cr.fetchall()
+        if keys:
+            _logger.warning(u'库存余额与出入库明细不一致：%s', keys)
+            if repair:
+                self.refresh(keys)
+        return keys
+
+
+class WhMoveLine(models.Model):
+    _inherit = 'wh.move.line'
+
+    @api.multi
+    def _write(self, vals):
+        ''' 影响库存的字段变化时（含计算字段的重算）刷新库存余额 '''
+        if not self or not STOCK_BALANCE_FIELDS & set(vals):
+            return super(WhMoveLine, self)._write(vals)
+        Balance = self.env['wh.stock.balance']
+        keys = set()
+        if STOCK_BALANCE_KEY_FIELDS & set(vals):
+            keys = Balance.get_line_keys(self.ids)
+        res = super(WhMoveLine, self)._write(vals)
+        Balance.mark_dirty(keys | Balance.get_line_keys(self.ids))
+        return res
+
+    @api.multi
+    def unlink(self):
+        Balance = self.env['wh.stock.balance']
+        keys = Balance.get_line_keys(self.ids)
+        res = super(WhMoveLine, self).unlink()
+        Balance.mark_dirty(keys)
+        return res
+
+    @api.multi
+    def action_done(self):
+        ''' 审核（含先进先出匹配、成本写入）结束后一次刷新库存余额 '''
+        return self.env['wh.stock.balance'].refresh_after(
+            self, lambda lines: super(WhMoveLine, lines).action_done())
+
+    @api.multi
+    def action_cancel(self):
+        ''' 反审核（含删除匹配记录）结束后一次刷新库存余额 '''
+        return self.env['wh.stock.balance'].refresh_after(
+            self, lambda lines: super(WhMoveLine, lines).action_cancel())
@@ -9,6 +9,29 @@ from odoo.tools import float_compare
 env = Environment(loader=PackageLoader(
     'odoo.addons.warehouse', 'html'), autoescape=True)
 
+# 库存查询常用的组合/部分索引：(索引名, 字段, 条件)
+WH_MOVE_LINE_INDEXES = [
+    # 先进先出匹配、商品库存：某商品在某仓库的未出完入库行
+    ('wh_move_line_open_goods_idx',
+     'goods_id, warehouse_dest_id, attribute_id',
+     "qty_remaining > 0 AND state = 'done'"),
+    # 仓库库存、库存余额：某仓库的未出完入库行
+    ('wh_move_line_open_warehouse_idx',
+     'warehouse_dest_id, goods_id',
+     "qty_remaining > 0 AND state = 'done'"),
+    # 商品最近成本：按审核时间倒序取最后一条
+    ('wh_move_line_done_cost_time_idx',
+     'goods_id, warehouse_dest_id, cost_time DESC, id DESC',
+     "state = 'done'"),
+    # 收发明细表、发出成本：按日期范围和调入/调出仓库汇总
+    ('wh_move_line_done_date_dest_idx',
+     'date, warehouse_dest_id',
+     "state = 'done'"),
+    ('wh_move_line_done_date_src_idx',
+     'date, warehouse_id',
+     "state = 'done'"),
+]
+
 
 class WhMoveLine(models.Model):
     _name = 'wh.move.line'
@@ -233,6 +256,16 @@ class WhMoveLine(models.Model):
         change_default=True,
         default=lambda self: self.env['res.company']._company_default_get())
 
+    @api.model_cr
+    def init(self):
+        ''' 建立库存查询用的组合/部分索引 '''
+        for name, columns, where in WH_MOVE_LINE_INDEXES:
+            self._cr.execute(
+                "SELECT indexname FROM pg_indexes WHERE indexname = %s", (name,))
+            if not self._cr.fetchone():
+                self._cr.execute('CREATE INDEX %s ON wh_move_line (%s) WHERE %s'
+                                 % (name, columns, where))
+
     @api.model
     def create(self, vals):
         new_id = super(WhMoveLine, self).create(vals)
@@ -281,6 +314,57 @@ class WhMoveLine(models.Model):
 
         return res
 
+    def apportion_cost(self, cost):
+        """
+        按各行建议成本的比例分摊 cost，最后一行用总金额减去已分摊金额；
+        建议成本按仓库批量计算，分摊结果一次写入
+        """
+        if not self:
+            return True
+        amounts = [amount for amount, cost_unit in self.env['goods'].get_suggested_costs(
+            [(line.warehouse_dest_id, line.goods_id, line.goods_qty,
+              line.attribute_id, line.lot_id) for line in self],
+            ignore_move=self.ids)]
+
+        amount_total, collect_cost, values = sum(amounts), 0, []
+        for line, amount in zip(self[:-1], amounts[:-1]):
+            line_cost = safe_division(amount, amount_total) * cost
+            collect_cost += line_cost
+            values.append(
+                (line.id, safe_division(line_cost, line.goods_qty), line_cost))
+
+        # 最后一行数据使用总金额减去已经消耗的金额来计算
+        last_cost = cost - collect_cost
+        values.append(
+            (self[-1].id, safe_division(last_cost, self[-1].goods_qty), last_cost))
+        self._write_cost(values)
+        return True
+
+    def _write_cost(self, values):
+        """
+        用一条 UPDATE 写入多行成本，与 write 一样按字段精度舍入
+        :param values: [(move_line id, 单位成本, 成本)]
+        """
+        cr = self.env.cr
+        cost_unit_field, cost_field = self._fields['cost_unit'], self._fields['cost']
+        values = [(line_id, cost_unit_field.convert_to_column(cost_unit, self),
+                   cost_field.convert_to_column(cost, self))
+                  for line_id, cost_unit, cost in values]
+        cr.execute('''
+            UPDATE wh_move_line line
+               SET cost_unit = v.cost_unit, cost = v.cost,
+                   write_uid = %%s, write_date = (now() at time zone 'UTC')
+              FROM (VALUES %s) AS v(id, cost_unit, cost)
+             WHERE line.id = v.id
+        ''' % ','.join(cr.mogrify('(%s, %s::numeric, %s::numeric)', value)
+                         for value in values), (self.env.uid,))
+        lines = self.browse([value[0] for value in values])
+        lines.invalidate_cache(['cost_unit', 'cost', 'write_uid', 'write_date'], lines.ids)
+        lines.modified(['cost_unit', 'cost'])
+        lines.recompute()
+        Balance = self.env['wh.stock.balance']
+        Balance.mark_dirty(Balance.get_line_keys(lines.ids))
+
     def get_real_cost_unit(self):
         self.ensure_one()
         return safe_division(self.cost, self.goods_qty)
@@ -18,6 +18,7 @@ class ReportLotStatus(models.Model):
     status = fields.Char(u'状态')
     warehouse = fields.Char(u'仓库')
     date = fields.Date(u'日期')
+    expiration_date = fields.Date(u'过保日')
     qty = fields.Float(u'数量', digits=dp.get_precision('Quantity'))
     uos_qty = fields.Float(u'辅助数量', digits=dp.get_precision('Quantity'))
 
@@ -27,28 +28,24 @@ class ReportLotStatus(models.Model):
         cr.execute(
             """
             create or replace view report_lot_status as (
-                SELECT MIN(line.id) as id,
+                SELECT MIN(idx.line_id) as id,
                         goods.name as goods,
                         uom.name as uom,
                         uos.name as uos,
-                        line.lot as lot,
-                        line.attribute_id as attribute_id,
+                        idx.lot as lot,
+                        idx.attribute_id as attribute_id,
                         '在库' as status,
                         wh.name as warehouse,
-                        max(line.date) as date,
-                        sum(line.qty_remaining) as qty,
-                        sum(line.uos_qty_remaining) as uos_qty
+                        max(idx.date) as date,
+                        min(idx.expiration_date) as expiration_date,
+                        sum(idx.qty_remaining) as qty,
+                        sum(idx.uos_qty_remaining) as uos_qty
 
-                FROM wh_move_line line
-                    LEFT JOIN goods goods ON line.goods_id = goods.id
+                FROM wh_lot_index idx
+                    LEFT JOIN goods goods ON idx.goods_id = goods.id
                         LEFT JOIN uom uom ON goods.uom_id = uom.id
                         LEFT JOIN uom uos ON goods.uos_id = uos.id
-                    LEFT JOIN warehouse wh ON line.warehouse_dest_id = wh.id
-
-                WHERE line.lot IS NOT NULL
-                  AND line.qty_remaining > 0
-                  AND wh.type = 'stock'
-                  AND line.state = 'done'
+                    LEFT JOIN warehouse wh ON idx.warehouse_id = wh.id
 
                 GROUP BY goods, uom, uos, lot, attribute_id, warehouse
 
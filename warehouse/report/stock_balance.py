@@ -25,39 +25,37 @@ class ReportStockBalance(models.Model):
     cost = fields.Float(u'成本', digits=dp.get_precision('Amount'))
 
     def init(self):
+        # 从库存余额汇总表读取，不再每次汇总出入库明细
         cr = self._cr
         tools.drop_view_if_exists(cr, 'report_stock_balance')
         cr.execute(
             """
             create or replace view report_stock_balance as (
-                SELECT min(line.id) as id,
+                SELECT balance.id as id,
                        goods.name as goods,
                        goods.id as goods_id,
                        goods.brand as brand_id,
                        loc.name as location,
-                       line.lot as lot,
+                       balance.lot as lot,
                        attribute.name as attribute_id,
                        uom.name as uom,
                        uos.name as uos,
                        wh.name as warehouse,
-                       sum(line.qty_remaining) as goods_qty,
-                       sum(line.uos_qty_remaining) as goods_uos_qty,
-                       sum(line.qty_remaining * line.cost_unit) as cost
-
-                FROM wh_move_line line
-                LEFT JOIN warehouse wh ON line.warehouse_dest_id = wh.id
-                LEFT JOIN goods goods ON line.goods_id = goods.id
-                    LEFT JOIN attribute attribute on attribute.id = line.attribute_id
+                       balance.goods_qty as goods_qty,
+                       balance.goods_uos_qty as goods_uos_qty,
+                       balance.cost as cost
+
+                FROM wh_stock_balance balance
+                JOIN warehouse wh ON balance.warehouse_id = wh.id
+                JOIN goods goods ON balance.goods_id = goods.id
+                    LEFT JOIN attribute attribute on attribute.id = balance.attribute_id
                     LEFT JOIN uom uom ON goods.uom_id = uom.id
                     LEFT JOIN uom uos ON goods.uos_id = uos.id
-                    LEFT JOIN location loc ON loc.goods_id = line.goods_id
+                    LEFT JOIN location loc ON loc.id = balance.location_id
 
                 WHERE  wh.type = 'stock'
-                  AND line.state = 'done'
                   AND ( goods.no_stock is null or goods.no_stock = FALSE)
 
-                GROUP BY wh.name, line.lot, attribute.name, goods.name, goods.id, goods.brand, loc.name, uom.name, uos.name
-
                 ORDER BY goods.name, wh.name, goods_qty asc
             )
         """)
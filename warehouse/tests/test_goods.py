@@ -105,6 +105,18 @@ class TestGoods(TransactionCase):
             self.hd_warehouse, 24, ignore_move=self.others_in_keyboard_mouse.id)
         self.assertEqual(suggested_cost, 24 * 80)
 
+    def test_get_suggested_costs(self):
+        ''' 批量计算建议成本与逐个计算结果一致 '''
+        items = [(self.hd_warehouse, self.goods_keyboard_mouse, qty, None, None)
+                 for qty in (96, 72, 48, 24, 200)]
+        items.append((self.hd_warehouse, self.goods_cable, 10, None, None))
+        for ignore_move in (None, self.others_in_keyboard_mouse.id):
+            costs = self.env['goods'].get_suggested_costs(
+                items, ignore_move=ignore_move)
+            for (warehouse, goods, qty, _, _), cost in zip(items, costs):
+                self.assertEqual(cost, goods.get_suggested_cost_by_warehouse(
+                    warehouse, qty, ignore_move=ignore_move))
+
 
 class TestResCompany(TransactionCase):
 
@@ -245,6 +245,35 @@ class TestMoveLine(TransactionCase):
                         move_line.warehouse_dest_id.name + u' 余 ' + str(move_line.goods_qty))]
         self.assertEqual(result, real_result)
 
+    def test_lot_index(self):
+        '''测试批次索引：批号下拉按过保日排序，临期扫描按仓库列出批次'''
+        move_line = self.env.ref('warehouse.wh_move_line_12')
+        move_line.write({'state': 'done', 'expiration_date': '2000-01-01'})
+        index = self.env['wh.lot.index'].search([('line_id', '=', move_line.id)])
+        self.assertEqual(index.qty_remaining, move_line.qty_remaining)
+        self.assertEqual(index.expiration_date, '2000-01-01')
+
+        # 批号下拉条件从批次索引查询
+        domain = self.mouse_out_line.with_context({
+            'default_warehouse_id': move_line.warehouse_dest_id.id
+        }).compute_lot_domain()
+        result = self.env['wh.move.line'].name_search('ms1603', args=domain)
+        self.assertEqual(result[0][0], move_line.id)
+        self.assertTrue(u'过保日' in result[0][1])
+
+        alerts = self.env['wh.lot.index'].scan_expiry()
+        self.assertTrue(index.id in alerts[move_line.warehouse_dest_id.id])
+        self.assertEqual(index.expiry_state, 'expired')
+
+        # 批次不再在库时从索引中删除
+        move_line.state = 'draft'
+        self.assertFalse(index.exists())
+        self.assertEqual(self.env['wh.lot.index'].search_count([]),
+                         self.env['wh.move.line'].search_count([
+                             ('state', '=', 'done'), ('lot', '!=', False),
+                             ('qty_remaining', '>', 0),
+                             ('warehouse_dest_id.type', '=', 'stock')]))
+
     def test_compute_all_amount_wrong_tax_rate(self):
         '''明细行上输入错误税率，应报错'''
         with self.assertRaises(UserError):
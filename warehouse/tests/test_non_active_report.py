@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from odoo.tests.common import TransactionCase
+from odoo import fields
 from odoo.exceptions import UserError, ValidationError
 import datetime
 
@@ -61,3 +62,31 @@ class TestNonActiveReport(TransactionCase):
             'third_stage_day': 3,
             'four_stage_day_qty': 4
         }).fields_view_get(None, 'form', False, False)
+
+    def test_stock_aging(self):
+        ''' 库龄分析：按库龄区间汇总数量和成本，生成每日快照 '''
+        self.wh_move_line_13.date = datetime.datetime.now() - datetime.timedelta(days=40)
+        self.wh_move_line_13.state = 'done'
+        buckets = self.env['stock.aging.bucket'].search([])
+        rows = self.env['stock.aging'].get_aging(
+            buckets.mapped('day_from'), ['goods_id'],
+            warehouse_ids=[self.browse_ref('warehouse.hd_stock').id])
+        total_qty = sum(row[2] for row in rows)
+        self.assertEqual(total_qty, sum(self.env['wh.move.line'].search([
+            ('state', '=', 'done'), ('qty_remaining', '>', 0),
+            ('warehouse_dest_id', '=', self.browse_ref('warehouse.hd_stock').id)]).mapped('qty_remaining')))
+        # 40 天前入库的明细在第二个区间
+        self.assertTrue([row for row in rows
+                         if row[0] == self.wh_move_line_13.goods_id.id and row[1] == 1])
+
+        action = self.env['stock.aging.wizard'].create({}).open_report()
+        report = self.env['stock.aging.report'].search(action['domain'])
+        self.assertTrue(report)
+
+        # 快照按仓库、类别、品牌汇总，合计与分析表一致；同一天重新生成不重复
+        snapshot = self.env['stock.aging.snapshot']
+        snapshot.create_snapshot()
+        snapshot.create_snapshot()
+        today = snapshot.search([('date', '=', fields.Date.context_today(snapshot))])
+        self.assertAlmostEqual(sum(today.mapped('goods_qty')), sum(report.mapped('goods_qty')))
+        self.assertAlmostEqual(sum(today.mapped('cost')), sum(report.mapped('cost')))
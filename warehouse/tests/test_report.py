@@ -63,6 +63,31 @@ class TestReport(TransactionCase):
         # 测试wizard默认日期
         self.env['report.stock.transceive.wizard'].create({})
 
+    def test_stock_balance(self):
+        ''' 测试 库存余额汇总随出入库审核更新，可检查和修复 '''
+        Balance = self.env['wh.stock.balance']
+        self.assertEqual(Balance.check_consistency(), [])
+        cable = self.env.ref('goods.cable')
+        balances = self.env['report.stock.balance'].search(
+            [('goods_id', '=', cable.id)])
+        self.assertTrue(balances)
+        qty = sum(balances.mapped('goods_qty'))
+        self.assertEqual(qty, sum(self.env['wh.move.line'].search(
+            [('goods_id', '=', cable.id), ('state', '=', 'done'),
+             ('warehouse_dest_id.type', '=', 'stock')]).mapped('qty_remaining')))
+
+        # 汇总表被改乱后检查出不一致并修复
+        self.env.cr.execute('UPDATE wh_stock_balance SET goods_qty = goods_qty + 1 '
+                            'WHERE goods_id = %s', (cable.id,))
+        self.assertTrue(Balance.check_consistency(repair=True))
+        self.assertEqual(Balance.check_consistency(), [])
+        Balance.rebuild()
+        self.assertEqual(Balance.check_consistency(), [])
+
+        # 反审核（含删除匹配记录）结束后一次刷新，与明细一致
+        self.env.ref('warehouse.wh_internal_whint0').cancel_approved_order()
+        self.assertEqual(Balance.check_consistency(), [])
+
     def test_stock_transceive_search_read(self):
         stock_transceive = self.env['report.stock.transceive'].create({})
         self.transceive_wizard.date_start = '2016-02-01'
@@ -2,3 +2,4 @@
 import save_bom
 import stock_transceive_wizard
 import non_active_report_wizard
+import batch_approve_wizard
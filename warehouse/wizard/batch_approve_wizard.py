@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+
+
+class BatchApproveWizard(models.TransientModel):
+    '''选中单据后排入批量审核队列，由后台定时任务审核'''
+    _name = 'batch.approve.wizard'
+    _description = u'批量审核'
+
+    @api.model
+    def _get_records(self):
+        ''' 选中的未审核单据 '''
+        model = self.env.context.get('active_model')
+        records = self.env[model].browse(self.env.context.get('active_ids'))
+        return records.filtered(lambda record: record.state != 'done')
+
+    @api.model
+    def _default_note(self):
+        return u'共 %s 张未审核单据' % len(self._get_records())
+
+    note = fields.Char(u'本次审核', default=_default_note, readonly=True)
+
+    @api.multi
+    def create_batch(self):
+        ''' 生成批量审核任务，并打开任务查看进度 '''
+        records = self._get_records()
+        method = getattr(records, '_batch_approve_method', False)
+        if not method:
+            raise UserError(u'该单据不支持批量审核')
+        batch = self.env['batch.approve'].create_batch(records, method)
+        return {
+            'type': 'ir.actions.act_window',
+            'name': u'批量审核任务',
+            'res_model': 'batch.approve',
+            'view_mode': 'form',
+            'res_id': batch.id,
+            'target': 'current',
+        }
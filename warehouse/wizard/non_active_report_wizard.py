@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import odoo.addons.decimal_precision as dp
 from odoo import models, fields, api
-from datetime import datetime
-import pytz
+from odoo.exceptions import UserError
 from lxml import etree
 
+# 四个阶段对应的报表字段
+STAGE_FIELDS = ['first_stage_day_qty', 'second_stage_day_qty',
+                'third_stage_day_qty', 'four_stage_day_qty']
+
 
 class NonActiveReport(models.TransientModel):
     _name = 'non.active.report'
+    _inherit = 'report.materialize'
     _description = u'呆滞料报表'
 
     warehouse_id = fields.Many2one('warehouse', string=u'仓库')
@@ -17,6 +22,7 @@ class NonActiveReport(models.TransientModel):
     third_stage_day_qty = fields.Float(string=u'第三阶段数量')
     four_stage_day_qty = fields.Float(string=u'第四阶段数量')
     subtotal = fields.Float(u'合计')
+    cost = fields.Float(u'成本合计', digits=dp.get_precision('Amount'))
 
     @api.model
     def fields_view_get(self, view_id=None, view_type='form', toolbar=False, submenu=False):
@@ -31,8 +37,6 @@ class NonActiveReport(models.TransientModel):
         res = super(NonActiveReport, self).fields_view_get(
             view_id=view_id, view_type=view_type, toolbar=toolbar, submenu=submenu)
         if self._context.get('first_stage_day'):
-            now_date = datetime.strftime(
-                datetime.now(pytz.timezone("UTC")), '%Y-%m-%d')
             doc = etree.XML(res['arch'])
             for node in doc.xpath("//field[@name='first_stage_day_qty']"):
                 node.set('string', u"0~%s天" %
@@ -58,6 +62,12 @@ class NonActiveReportWizard(models.TransientModel):
     first_stage_day = fields.Integer(string=u'第一阶段天数', required=True)
     second_stage_day = fields.Integer(string=u'第二阶段天数', required=True)
     third_stage_day = fields.Integer(string=u'第三阶段天数', required=True)
+    category_id = fields.Many2one('core.category', u'核算类别',
+                                  domain=[('type', '=', 'goods')],
+                                  context={'type': 'goods'})
+    brand_id = fields.Many2one('core.value', u'品牌',
+                               domain=[('type', '=', 'brand')],
+                               context={'type': 'brand'})
     company_id = fields.Many2one(
         'res.company',
         string=u'公司',
@@ -67,62 +77,29 @@ class NonActiveReportWizard(models.TransientModel):
     @api.multi
     def get_warehouse_goods_stage_data(self, warehouse_id, first_stage_day, second_stage_day, third_stage_day):
         """
-        用sql 找到 系统 在所输入的时间阶段的对应的商品的 数量
+        用库龄计算找到 系统 在所输入的时间阶段的对应的商品的 数量
         :param warehouse_id:  仓库id
         :param first_stage_day:  第一阶段天数
         :param second_stage_day:第一阶段天数
         :param third_stage_day: 第三阶段天数
         :return: 返回list dict
         """
-        if warehouse_id:
-            wahouse_id_sql = "AND wh_dest.id =%s" % (warehouse_id.id)
-        else:
-            wahouse_id_sql = "AND 1=1"
-        now_date = datetime.strftime(
-            datetime.now(pytz.timezone("UTC")), '%Y-%m-%d')
-        vals = {'now_date': now_date, 'first_stage_day': first_stage_day, 'wahouse_id_sql': wahouse_id_sql,
-                'second_stage_day': second_stage_day, 'third_stage_day': third_stage_day}
-
-        self.env.cr.execute('''
-            select
-                stage_goods_date.warehouse_dest_id as warehouse_id,
-                stage_goods_date.goods_id as goods_id,
-                COALESCE(sum(stage_goods_date.first_stage),0) as first_stage_day_qty,
-                COALESCE(sum(stage_goods_date.second_stage),0) as second_stage_day_qty,
-                COALESCE(sum(stage_goods_date.third_stage),0) as third_stage_day_qty,
-                COALESCE(sum(stage_goods_date.four_stage),0) as four_stage_day_qty,
-                sum(stage_goods_date.subtotal) as subtotal
-                from  (select
-                          CASE
-                              when ('%(now_date)s' -line.date<=%(first_stage_day)d) then
-                                  sum(line.qty_remaining)
-                              end as first_stage,
-                          CASE
-                              when ('%(now_date)s'-line.date>%(first_stage_day)d and '%(now_date)s' -line.date<=%(second_stage_day)d) then
-                                  sum(line.qty_remaining)
-                              end as second_stage,
-                          CASE
-                              when ('%(now_date)s' -line.date>%(second_stage_day)d AND '%(now_date)s'-line.date<=%(third_stage_day)d) then
-                                  sum(line.qty_remaining)
-                              end as third_stage,
-                          CASE
-                              when ('%(now_date)s'-line.date > %(third_stage_day)d) then
-                                  sum(line.qty_remaining)
-                              end as four_stage,
-                          line.goods_id as goods_id,
-
-                          line.warehouse_dest_id as warehouse_dest_id,
-                          sum(line.qty_remaining) as subtotal
-                      FROM wh_move_line line
-                      LEFT JOIN warehouse wh_dest ON line.warehouse_dest_id = wh_dest.id
-                      LEFT JOIN warehouse wh ON line.warehouse_id = wh.id
-                      where line.state = 'done'
-                        %(wahouse_id_sql)s
-                      AND  wh_dest.type='stock'
-                      GROUP BY line.warehouse_dest_id,line.goods_id,line.date) as stage_goods_date
-              GROUP BY  stage_goods_date.warehouse_dest_id,stage_goods_date.goods_id
-        ''' % vals)
-        return self.env.cr.dictfetchall()
+        if not 0 <= first_stage_day < second_stage_day < third_stage_day:
+            raise UserError(u'各阶段天数必须依次增大')
+        rows = {}
+        for warehouse, goods, bucket, qty, cost in self.env['stock.aging'].get_aging(
+                [0, first_stage_day + 1, second_stage_day + 1, third_stage_day + 1],
+                ['warehouse_id', 'goods_id'],
+                warehouse_ids=warehouse_id.ids,
+                category_ids=self.category_id.ids,
+                brand_ids=self.brand_id.ids):
+            vals = rows.setdefault((warehouse, goods), dict(
+                [(name, 0) for name in STAGE_FIELDS],
+                warehouse_id=warehouse, goods_id=goods, subtotal=0, cost=0))
+            vals[STAGE_FIELDS[bucket]] += qty
+            vals['subtotal'] += qty
+            vals['cost'] += cost
+        return [rows[key] for key in sorted(rows)]
 
     @api.multi
     def open_non_active_report(self):
@@ -133,23 +110,12 @@ class NonActiveReportWizard(models.TransientModel):
         """
         data_vals_list = self.get_warehouse_goods_stage_data(self.warehouse_id, self.first_stage_day,
                                                              self.second_stage_day, self.third_stage_day)
-        non_active_id_list = []
-        for vals in data_vals_list:
-            if vals.get('subtotal', 0) != 0:
-                active_row = self.env['non.active.report'].create(vals)
-                non_active_id_list.append(active_row.id)
+        report = self.env['non.active.report']
+        run_tag = report.materialize_rows(data_vals_list)
 
         view = self.env.ref('warehouse.non_active_report_tree')
-
-        return {
-            'name': u'呆滞料报表',
-            'view_type': 'form',
-            'view_mode': 'tree',
-            'views': [(view.id, 'tree')],
-            'res_model': 'non.active.report',
-            'type': 'ir.actions.act_window',
-            'domain': [('id', 'in', non_active_id_list)],
-            'limit': 65535,
-            'context': {'first_stage_day': self.first_stage_day,
-                        'second_stage_day': self.second_stage_day, 'third_stage_day': self.third_stage_day}
-        }
+        return report.get_run_action(
+            run_tag, u'呆滞料报表', [(view.id, 'tree')], limit=65535,
+            context={'first_stage_day': self.first_stage_day,
+                     'second_stage_day': self.second_stage_day,
+                     'third_stage_day': self.third_stage_day})